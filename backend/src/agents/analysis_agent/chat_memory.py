@@ -0,0 +1,101 @@
+# src/agents/analysis_agent/chat_memory.py
+"""
+Rolling summary of long chat sessions.
+
+Once a session's history passes CHAT_SUMMARY_TRIGGER_CHARS, every turn except
+the last CHAT_KEEP_RECENT_TURNS is folded into the session's summary by a
+background worker (enrichment priority, off the request path). Prompts then
+carry summary + recent turns, so their size stays flat as the session grows.
+If the history changed while the summary was being written, the fold is
+skipped and retried after the next turn.
+
+Env:
+    CHAT_SUMMARY_TRIGGER_CHARS   history size that triggers a fold (default 3000)
+    CHAT_KEEP_RECENT_TURNS       turns kept verbatim (default 4)
+"""
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from src.llm import gateway as llm_gateway
+from src.llm.scheduler import ENRICHMENT
+from src.stores.chat_store import fold_into_summary, peek_session
+
+SUMMARY_TRIGGER_CHARS = int(os.getenv("CHAT_SUMMARY_TRIGGER_CHARS", "3000"))
+KEEP_RECENT_TURNS = int(os.getenv("CHAT_KEEP_RECENT_TURNS", "4"))
+SUMMARY_MAX_TOKENS = 300
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+_inflight: set = set()
+_inflight_lock = threading.Lock()
+
+
+def _format_turns(turns: List[Dict]) -> str:
+    return "\n".join(
+        f"{'User' if t.get('role') == 'user' else 'Assistant'}: {t.get('content', '')}" for t in turns
+    )
+
+
+def summarize_turns(previous: str, turns: List[Dict], user: Optional[str] = None) -> str:
+    """New rolling summary = previous summary + `turns`, condensed."""
+    sys_prompt = (
+        "You maintain the running memory of a crypto research chat. Merge the previous summary and "
+        "the new turns into one concise summary (max ~150 words). Keep the user's goals, positions, "
+        "tokens discussed, figures and conclusions; drop pleasantries."
+    )
+    user_prompt = (
+        f"Previous summary:\n{previous or '(none)'}\n\n"
+        f"New turns:\n{_format_turns(turns)}\n\n"
+        "Updated summary:"
+    )
+    return llm_gateway.complete(
+        sys_prompt,
+        user_prompt,
+        temperature=0,
+        max_tokens=SUMMARY_MAX_TOKENS,
+        tag="chat_summary",
+        priority=ENRICHMENT,
+        user=user,
+    ).strip()
+
+
+def _fold(session_id: str) -> None:
+    try:
+        session = peek_session(session_id)
+        if not session:
+            return
+        older = session["history"][:-KEEP_RECENT_TURNS]
+        if not older:
+            return
+        summary = summarize_turns(session.get("summary", ""), older, user=session_id)
+        if not summary:
+            return
+        folded = fold_into_summary(session_id, session.get("dropped_turns", 0), len(older), summary)
+        print(f"[{datetime.now()}] Chat memory: {session_id} folded {len(older)} turns (applied={folded}).")
+    except Exception as e:
+        print(f"[{datetime.now()}] ERROR: Chat summary failed for {session_id}: {e}", file=sys.stderr)
+    finally:
+        with _inflight_lock:
+            _inflight.discard(session_id)
+
+
+def maybe_summarize(session_id: str) -> bool:
+    """Queue a background fold if the session's history is past the trigger. Never blocks."""
+    if not llm_gateway.is_configured():
+        return False   # plain trimming in chat_store still caps the history
+    session = peek_session(session_id)
+    if (
+        not session
+        or session.get("history_chars", 0) < SUMMARY_TRIGGER_CHARS
+        or len(session["history"]) <= KEEP_RECENT_TURNS
+    ):
+        return False
+    with _inflight_lock:
+        if session_id in _inflight:
+            return False
+        _inflight.add(session_id)
+    _executor.submit(_fold, session_id)
+    return True
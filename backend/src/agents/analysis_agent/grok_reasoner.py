@@ -1,24 +1,14 @@
 # src/agents/analysis_agent/grok_reasoner.py
-import os
-import re
 import json
-import requests
-from typing import List, Dict, Tuple, Optional
-from dotenv import load_dotenv
+from typing import Dict, Iterator, List, Optional, Tuple
 
-# --------- Config (env) ----------
-load_dotenv()
-XAI_API_KEY = os.getenv("XAI_API_KEY")
-XAI_MODEL   = os.getenv("XAI_MODEL", "grok-3-mini")
+from src.agents.analysis_agent import retrieval
+from src.llm import gateway as llm_gateway
+from src.llm.json_stream import parse_json_object
+from src.llm.tokenizer import count_tokens, truncate_to_tokens
+from src.text_utils import strip_noise
 
 # --------- Small helpers ----------
-EMOJI_RE = re.compile(r"[\U00010000-\U0010ffff]")
-
-def _strip_noise(text: str) -> str:
-    """Light cleaner to keep answers/context tidy (docs already cleaned at ingestion)."""
-    t = EMOJI_RE.sub("", text or "")
-    return re.sub(r"\s+", " ", t).strip()
-
 def _smart_trim(s: str, limit: int) -> str:
     s = (s or "").strip()
     if len(s) <= limit:
@@ -26,9 +16,14 @@ def _smart_trim(s: str, limit: int) -> str:
     cut = s[:limit].rsplit(" ", 1)[0]
     return (cut or s[:limit]).rstrip(".,;:-") + "…"
 
-def _approx_tokens(s: str) -> int:
-    # Very rough: ~4 chars ≈ 1 token; good enough for budgeting
-    return max(1, len((s or "")) // 4)
+def _trim_to_tokens(s: str, limit: int) -> str:
+    """Like _smart_trim, but the limit is measured in tokens."""
+    s = (s or "").strip()
+    if count_tokens(s) <= limit:
+        return s
+    cut = truncate_to_tokens(s, max(1, limit - 1))  # leave room for the ellipsis
+    head = cut.rsplit(" ", 1)[0] if " " in cut else cut
+    return (head or cut).rstrip(".,;:-") + "…"
 
 def _format_history(history: List[Dict]) -> str:
     if not history:
@@ -36,63 +31,183 @@ def _format_history(history: List[Dict]) -> str:
     lines = []
     for msg in history:
         role = "User" if msg.get("role") == "user" else "Assistant"
-        lines.append(f"{role}: {_strip_noise(msg.get('content', ''))}")
+        lines.append(f"{role}: {strip_noise(msg.get('content', ''))}")
     return "\n".join(lines)
 
 # --------- Dynamic context sizing ----------
-def _choose_doc_char_budget(
+SYS_AND_INSTR_TOKENS = 250   # approx cost for system/instructions
+MAX_CONTEXT_DOCS = 12        # keep list manageable for the model
+MIN_DOC_BODY_TOKENS = 55     # ≈220 chars, still readable
+MAX_DOC_BODY_TOKENS = 175    # ≈700 chars, avoid bloat per doc
+
+def _allocate_budget(needs: List[int], budget: int) -> List[int]:
+    """
+    Water-filling split of `budget` across docs: the shortest docs get all they
+    need, and whatever they leave over is shared among the longer ones.
+    """
+    alloc = [0] * len(needs)
+    remaining = budget
+    order = sorted(range(len(needs)), key=lambda i: needs[i])
+    for pos, i in enumerate(order):
+        share = remaining // (len(order) - pos)
+        alloc[i] = min(needs[i], share)
+        remaining -= alloc[i]
+    return alloc
+
+def _build_context_dynamic(
     docs: List[Dict],
-    total_ctx_tokens: int,
-    sys_and_instr_tokens: int,
+    total_ctx_tokens: int = 3800,
     reserve_answer_tokens: int = 500,
-) -> Tuple[int, int]:
+    query: Optional[str] = None,
+) -> Tuple[str, List[Dict], int]:
     """
-    Decide how many docs and how many chars per doc we can include.
-    Returns: (#docs_to_use, per_doc_char_limit)
+    Build a numbered context string, packing doc bodies into the token budget.
+    Token counts come from the tokenizer (memoized per text), not a char ratio.
+    With a `query`, docs are ordered by BM25 relevance and trimmed docs keep
+    their best-matching sentences (see retrieval.py).
+    Returns: (context_text, sources_list, context_tokens)
+      - sources_list: [{idx,id,title,link,snippet}]
+      - context_tokens: exact token count of context_text
     """
-    available_tokens = max(250, total_ctx_tokens - sys_and_instr_tokens - reserve_answer_tokens)
-    MAX_DOCS = min(12, len(docs))   # keep list manageable for the model
-    MIN_PER_DOC_CHARS = 220         # still readable
-    MAX_PER_DOC_CHARS = 700         # avoid bloat per doc
+    available = max(250, total_ctx_tokens - SYS_AND_INSTR_TOKENS - reserve_answer_tokens)
 
-    for k in range(MAX_DOCS, 0, -1):
-        available_chars = available_tokens * 4  # chars ≈ tokens*4
-        per_doc_chars = available_chars // k
-        if per_doc_chars >= MIN_PER_DOC_CHARS:
-            return k, min(per_doc_chars, MAX_PER_DOC_CHARS)
+    # docs from the doc store were cleaned once at upload
+    cleaned = [d["context"] if d.get("cleaned") else strip_noise(d.get("context", "")) for d in docs]
+    index, sent_scores = None, None
+    order = list(range(len(docs)))
+    if query and docs:
+        index = retrieval.get_index(cleaned)
+        order = retrieval.rank_docs(index, query)
+        sent_scores = retrieval.sentence_scores(index, query)
 
-    return 1, MIN_PER_DOC_CHARS  # worst case
+    prepared = []
+    for i, pos in enumerate(order[:MAX_CONTEXT_DOCS], start=1):
+        d     = docs[pos]
+        ctx   = cleaned[pos]
+        title = d.get("title") or ctx[:60]
+        link  = d.get("link")
+        did   = d.get("id") or (link.split("/")[-1] if link else f"doc{i}")
+        # header/footer of the block plus the newline that joins blocks
+        overhead = count_tokens(f"[{i}] {title}\n\nLINK: {link or ''}\n") + 1
+        prepared.append({"idx": i, "pos": pos, "id": did, "title": title, "link": link, "ctx": ctx,
+                         "overhead": overhead, "body_tokens": count_tokens(ctx)})
+
+    # drop trailing docs until every kept doc can get a readable minimum
+    k = len(prepared)
+    while k > 1 and sum(p["overhead"] + min(MIN_DOC_BODY_TOKENS, p["body_tokens"]) for p in prepared[:k]) > available:
+        k -= 1
+    keep = prepared[:k]
+
+    body_budget = max(MIN_DOC_BODY_TOKENS, available - sum(p["overhead"] for p in keep))
+    alloc = _allocate_budget([min(p["body_tokens"], MAX_DOC_BODY_TOKENS) for p in keep], body_budget)
+
+    items, used = [], []
+    for p, budget in zip(keep, alloc):
+        if budget >= p["body_tokens"]:
+            snip = p["ctx"]
+        else:
+            passage = retrieval.best_passage(index, p["pos"], sent_scores, budget) if index else None
+            snip = passage or _trim_to_tokens(p["ctx"], budget)
+        items.append(f"[{p['idx']}] {p['title']}\n{snip}\nLINK: {p['link'] or ''}\n")
+        used.append({"idx": p["idx"], "id": p["id"], "title": p["title"], "link": p["link"], "snippet": snip})
+
+    context = "\n".join(items)
+    return context, used, count_tokens(context)
+
+# --------- Prompts & fallbacks ----------
+def _answer_prompts(question: str, ctx: str) -> Tuple[str, str]:
+    sys_prompt = (
+        "You are a financial information assistant. "
+        "Answer ONLY using the provided context. Do not add numbers you can’t justify from context. "
+        "Be concise, risk-aware, and cite with bracket indices like [1], [2]."
+    )
+    user_prompt = (
+        f"Question:\n{question}\n\n"
+        f"Context (numbered sources):\n{ctx}\n\n"
+        "Instructions:\n"
+        "1) Use the context only; no external facts.\n"
+        "2) Add inline citations like [1], [3] where appropriate.\n"
+        "3) If context is insufficient, say what’s missing concisely.\n"
+    )
+    return sys_prompt, user_prompt
 
-def _build_context_dynamic(docs: List[Dict], total_ctx_tokens: int = 3800) -> Tuple[str, List[Dict], int]:
+def _chat_prompts(chat_history: List[Dict], ctx: str, summary: Optional[str] = None) -> Tuple[str, str]:
     """
-    Build a numbered context string using a dynamic per-doc char budget.
-    Returns: (context_text, sources_list, used_tokens_estimate)
-      - sources_list: [{idx,id,title,link,snippet}]
+    The context and instructions go in the system prompt, which is byte-identical
+    across a session's turns, so provider-side prompt caching can reuse it.
     """
-    sys_and_instr_tokens = 250  # approx cost for system/instructions
-
-    n_keep, per_doc_chars = _choose_doc_char_budget(
-        docs,
-        total_ctx_tokens=total_ctx_tokens,
-        sys_and_instr_tokens=sys_and_instr_tokens,
-        reserve_answer_tokens=500,
+    history_block = _format_history(chat_history)
+    summary_block = f"Summary of earlier conversation:\n{summary}\n\n" if summary else ""
+    sys_prompt = (
+        "You are a financial research analyst. Use only the supplied news context when answering, "
+        "keep a professional tone, and cite sources like [1], [2].\n\n"
+        f"Market context (numbered sources):\n{ctx}\n\n"
+        "Instructions:\n"
+        "1) Respond to the latest user request while staying consistent with the conversation history.\n"
+        "2) Use the provided sources for facts; include inline citations.\n"
+        "3) Summarize risks or missing data if the context does not cover the request."
+    )
+    user_prompt = (
+        f"{summary_block}"
+        f"{'Recent conversation' if summary else 'Conversation so far'}:\n{history_block}"
     )
+    return sys_prompt, user_prompt
 
-    items, used, total_chars = [], [], 0
-    for i, d in enumerate(docs[:n_keep], start=1):
-        title = d.get("title") or _strip_noise(d.get("context", ""))[:60]
-        ctx   = _strip_noise(d.get("context", ""))
-        link  = d.get("link")
-        did   = d.get("id") or (link.split("/")[-1] if link else f"doc{i}")
-        snip  = _smart_trim(ctx, per_doc_chars)
+def _latest_user(chat_history: List[Dict]) -> Dict:
+    for msg in reversed(chat_history):
+        if msg.get("role") == "user":
+            return msg
+    raise ValueError("chat_history must include at least one user message.")
+
+def _offline_answer(sources: List[Dict]) -> str:
+    first = sources[0]
+    other = f" [{sources[1]['idx']}]" if len(sources) > 1 else ""
+    return f"Model offline. From the snippets: {_smart_trim(first['snippet'], 220)} [{first['idx']}]"+other
 
-        block = f"[{i}] {title}\n{snip}\nLINK: {link or ''}\n"
-        items.append(block)
-        used.append({"idx": i, "id": did, "title": title, "link": link, "snippet": snip})
-        total_chars += len(block)
+def _offline_chat_answer(latest_user: Dict, sources: List[Dict]) -> str:
+    first = sources[0]
+    snippet = _smart_trim(first["snippet"], 180)
+    return f"Model offline. Latest question: {latest_user['content']}\nSummary: {snippet} [{first['idx']}]"
 
-    used_tokens_est = sys_and_instr_tokens + _approx_tokens("\n".join(items))
-    return "\n".join(items), used, used_tokens_est
+def _llm_error_answer(e: Exception, sources: List[Dict], label: str = "Summary", limit: int = 220) -> str:
+    first = sources[0]
+    other = f" [{sources[1]['idx']}]" if len(sources) > 1 else ""
+    return f"Couldn’t reach the LLM ({e}). {label}: {_smart_trim(first['snippet'], limit)} [{first['idx']}]"+other
+
+def _single_answer_events(answer: str) -> Iterator[Dict]:
+    yield {"type": "token", "text": answer}
+    yield {"type": "done", "answer": answer, "cached": False}
+
+def _stream_answer_events(
+    messages: List[Dict[str, str]],
+    sources: List[Dict],
+    error_label: str = "Summary",
+    error_limit: int = 220,
+    **llm_kwargs,
+) -> Iterator[Dict]:
+    """
+    Relay gateway deltas as token events; fall back to the snippet answer on
+    failure. A failure after some tokens ends with `done` marked partial.
+    """
+    parts: List[str] = []
+    meta: Dict = {}
+    try:
+        for delta in llm_gateway.stream_chat_completion(messages, meta=meta, **llm_kwargs):
+            parts.append(delta)
+            yield {"type": "token", "text": delta}
+    except Exception as e:
+        if not parts:
+            yield from _single_answer_events(_llm_error_answer(e, sources, label=error_label, limit=error_limit))
+            return
+        yield {
+            "type": "done",
+            "answer": strip_noise("".join(parts)).strip(),
+            "cached": False,
+            "partial": True,
+            "error": str(e),
+        }
+        return
+    yield {"type": "done", "answer": strip_noise("".join(parts)).strip(), "cached": meta.get("cached", False)}
 
 # --------- Main agent ----------
 def answer_with_grok(
@@ -103,36 +218,114 @@ def answer_with_grok(
 ) -> Dict:
     """
     Dynamically sizes context to stay within token budget.
-    Returns: {"answer": str, "sources": [ {idx,id,title,link,snippet} ]}
+    Identical (model, prompt, max_tokens) requests are served from the response cache.
+    Returns: {"answer": str, "sources": [ {idx,id,title,link,snippet} ], "cached": bool, "context_tokens": int}
     """
-    ctx, sources, used_ctx_tokens = _build_context_dynamic(
+    ctx, sources, ctx_tokens = _build_context_dynamic(
         docs,
-        total_ctx_tokens=token_budget_tokens
+        total_ctx_tokens=token_budget_tokens,
+        reserve_answer_tokens=model_answer_tokens,
+        query=question,
     )
     if not sources:
-        return {"answer": "I couldn’t find relevant context.", "sources": []}
+        return {"answer": "I couldn’t find relevant context.", "sources": [], "context_tokens": 0}
 
-    sys_prompt = (
-        "You are a financial information assistant. "
-        "Answer ONLY using the provided context. Do not add numbers you can’t justify from context. "
-        "Be concise, risk-aware, and cite with bracket indices like [1], [2]."
+    sys_prompt, user_prompt = _answer_prompts(question, ctx)
+
+    if not llm_gateway.available():
+        return {"answer": _offline_answer(sources), "sources": sources, "context_tokens": ctx_tokens}
+
+    try:
+        result = llm_gateway.chat_completion(
+            [
+                {"role": "system", "content": sys_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=0.2,
+            max_tokens=model_answer_tokens,
+            tag="ask",
+            cache=True,
+        )
+        return {
+            "answer": strip_noise(result["content"]).strip(),
+            "sources": sources,
+            "cached": result["cached"],
+            "context_tokens": ctx_tokens,
+        }
+    except Exception as e:
+        return {"answer": _llm_error_answer(e, sources), "sources": sources, "context_tokens": ctx_tokens}
+
+def answer_with_grok_stream(
+    question: str,
+    docs: List[Dict],
+    token_budget_tokens: int = 3800,
+    model_answer_tokens: int = 500,
+    user: Optional[str] = None,
+) -> Iterator[Dict]:
+    """
+    Streaming variant of answer_with_grok. Yields events:
+      {"type": "sources", "sources": [...], "context_tokens": int}    before generation starts
+      {"type": "token", "text": str}           as the model produces text
+      {"type": "done", "answer": str, "cached": bool}
+    If generation fails midway, `done` carries the text so far plus
+    "partial": True and "error": str.
+    """
+    ctx, sources, ctx_tokens = _build_context_dynamic(
+        docs,
+        total_ctx_tokens=token_budget_tokens,
+        reserve_answer_tokens=model_answer_tokens,
+        query=question,
     )
-    user_prompt = (
-        f"Question:\n{question}\n\n"
-        f"Context (numbered sources):\n{ctx}\n\n"
-        "Instructions:\n"
-        "1) Use the context only; no external facts.\n"
-        "2) Add inline citations like [1], [3] where appropriate.\n"
-        "3) If context is insufficient, say what’s missing concisely.\n"
+    yield {"type": "sources", "sources": sources, "context_tokens": ctx_tokens}
+    if not sources:
+        yield from _single_answer_events("I couldn’t find relevant context.")
+        return
+    if not llm_gateway.available():
+        yield from _single_answer_events(_offline_answer(sources))
+        return
+
+    sys_prompt, user_prompt = _answer_prompts(question, ctx)
+    yield from _stream_answer_events(
+        [
+            {"role": "system", "content": sys_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        sources,
+        max_tokens=model_answer_tokens,
+        temperature=0.2,
+        tag="ask",
+        cache=True,
+        user=user,
     )
 
-    if not XAI_API_KEY:
-        first = sources[0]
-        other = f" [{sources[1]['idx']}]" if len(sources) > 1 else ""
+def _is_json_object(content: str) -> bool:
+    """Is this answer a complete JSON object (no repair needed)? Only those are cached."""
+    try:
+        parse_json_object(content, strict=True)
+    except ValueError:
+        return False
+    return True
+
+TRADE_SIDES = ("buy", "hold", "sell")
+
+def _checked_trade_plan(trade_plan: object, token: str) -> Dict:
+    """The model's trade plan if side is buy/hold/sell and amount/confidence are numbers, else a hold."""
+    plan = dict(trade_plan) if isinstance(trade_plan, dict) else {}
+    side = str(plan.get("side") or "").lower()
+    numeric = all(
+        isinstance(plan.get(k), (int, float)) and not isinstance(plan.get(k), bool) for k in ("amount", "confidence")
+    )
+    if side not in TRADE_SIDES or not numeric:
         return {
-            "answer": f"Model offline. From the snippets: {_smart_trim(first['snippet'], 220)} [{first['idx']}]"+other,
-            "sources": sources
+            "side": "hold",
+            "asset": token,
+            "amount": 0,
+            "confidence": 0.0,
+            "notes": "Incomplete or invalid trade plan from the model; defaulting to hold.",
         }
+    plan["side"] = side
+    plan.setdefault("asset", token)
+    return plan
 
 def live_trade_recommendation(
     token: str,
@@ -151,7 +344,7 @@ def live_trade_recommendation(
             },
         }
 
-    ctx, sources, _ = _build_context_dynamic(docs)
+    ctx, sources, _ = _build_context_dynamic(docs, query=question)
     system_prompt = (
         "You are a live-trading strategist. Read the provided context and output a structured trade idea.\n"
         "Respond in STRICT JSON like:\n"
@@ -177,7 +370,7 @@ def live_trade_recommendation(
         "3) If context is neutral or conflicting, choose HOLD with low confidence.\n"
     )
 
-    if not XAI_API_KEY:
+    if not llm_gateway.available():
         return {
             "analysis": f"Model offline. Latest snippet: {_smart_trim(sources[0]['snippet'], 200)}",
             "trade_plan": {
@@ -190,38 +383,30 @@ def live_trade_recommendation(
         }
 
     try:
-        resp = requests.post(
-            "https://api.x.ai/v1/chat/completions",
-            headers={"Authorization": f"Bearer {XAI_API_KEY}", "Content-Type": "application/json"},
-            json={
-                "model": XAI_MODEL,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                "temperature": 0.15,
-                "max_tokens": 420,
-            },
-            timeout=20,
+        result = llm_gateway.chat_completion(
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=0.15,
+            max_tokens=420,
+            tag="live_trade",
+            cache=True,
+            hedge=True,   # latency-critical: race a backup request past the p95
+            cache_if=_is_json_object,   # never cache an answer that would fail below
         )
-        if resp.status_code != 200:
-            raise RuntimeError(resp.text)
-        data = resp.json()
-        text = (data.get("choices") or [{}])[0].get("message", {}).get("content", "") or ""
-        cleaned = text.strip().strip("`")
-        if cleaned.startswith("json"):
-            cleaned = cleaned[4:].strip()
-        payload = json.loads(cleaned)
+        # repairs fences, trailing commas and an answer cut off at max_tokens (cut-off values are dropped)
+        payload = parse_json_object(result["content"])
         analysis = payload.get("analysis") or "No analysis provided."
-        trade_plan = payload.get("trade_plan") or {}
-        trade_plan.setdefault("asset", token)
-        if trade_plan.get("side") == "sell":
+        trade_plan = _checked_trade_plan(payload.get("trade_plan"), token)
+        if trade_plan["side"] == "sell":
             trade_plan["side"] = "hold"
             trade_plan["amount"] = 0
             trade_plan["notes"] = "Sell signals are disabled; defaulting to hold."
         return {
-            "analysis": _strip_noise(analysis),
+            "analysis": strip_noise(analysis),
             "trade_plan": trade_plan,
+            "cached": result["cached"],
         }
     except Exception as e:
         return {
@@ -235,110 +420,113 @@ def live_trade_recommendation(
             },
         }
 
-    try:
-        resp = requests.post(
-            "https://api.x.ai/v1/chat/completions",
-            headers={"Authorization": f"Bearer {XAI_API_KEY}", "Content-Type": "application/json"},
-            json={
-                "model": XAI_MODEL,
-                "messages": [
-                    {"role": "system", "content": sys_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                "temperature": 0.2,
-                "max_tokens": model_answer_tokens,
-            },
-            timeout=20,
-        )
-        if resp.status_code != 200:
-            raise RuntimeError(f"xAI status {resp.status_code}: {resp.text}")
-        data = resp.json()
-        content = (data.get("choices") or [{}])[0].get("message", {}).get("content", "") or ""
-        return {"answer": _strip_noise(content).strip(), "sources": sources}
-    except Exception as e:
-        first = sources[0]
-        other = f" [{sources[1]['idx']}]" if len(sources) > 1 else ""
-        return {
-            "answer": f"Couldn’t reach the LLM ({e}). Summary: {_smart_trim(first['snippet'], 220)} [{first['idx']}]"+other,
-            "sources": sources
-        }
+def chat_context_key(docs: List[Dict], token_budget_tokens: int, model_answer_tokens: int) -> str:
+    """Cache key for build_chat_context: the doc set's content hash plus the budget."""
+    texts = [d.get("context", "") for d in docs]
+    return f"{retrieval.doc_set_key(texts)}:{token_budget_tokens}:{model_answer_tokens}"
+
+def build_chat_context(
+    docs: List[Dict],
+    token_budget_tokens: int = 3800,
+    model_answer_tokens: int = 500,
+    query: Optional[str] = None,
+) -> Tuple[str, List[Dict], int]:
+    """
+    Chat context for a session's doc set. Docs are chosen and ordered by BM25
+    against `query` (the session token plus the question that brought this doc
+    set in), not against every new question, so the context stays identical
+    turn after turn and can be memoized on the session with chat_context_key.
+    """
+    return _build_context_dynamic(
+        docs,
+        total_ctx_tokens=token_budget_tokens,
+        reserve_answer_tokens=model_answer_tokens,
+        query=query,
+    )
 
 def chat_with_grok(
     docs: List[Dict],
     chat_history: List[Dict],
     token_budget_tokens: int = 3800,
     model_answer_tokens: int = 500,
+    summary: Optional[str] = None,
+    context: Optional[Tuple[str, List[Dict], int]] = None,
 ) -> Dict:
     """
     Conversational flow that reuses cached docs and prior turns.
-    chat_history should already include the most recent user turn.
+    chat_history should already include the most recent user turn; `summary`
+    is the session's rolling summary of older turns (see chat_memory.py).
+    `context` is a memoized build_chat_context result, if the caller has one.
     """
-    ctx, sources, _ = _build_context_dynamic(
-        docs,
-        total_ctx_tokens=token_budget_tokens
+    latest_user = _latest_user(chat_history)
+    ctx, sources, ctx_tokens = context or build_chat_context(
+        docs, token_budget_tokens, model_answer_tokens, query=latest_user["content"]
     )
     if not sources:
-        return {"answer": "I couldn’t find relevant context.", "sources": []}
+        return {"answer": "I couldn’t find relevant context.", "sources": [], "context_tokens": 0}
 
-    latest_user = None
-    for msg in reversed(chat_history):
-        if msg.get("role") == "user":
-            latest_user = msg
-            break
-    if not latest_user:
-        raise ValueError("chat_history must include at least one user message.")
+    sys_prompt, user_prompt = _chat_prompts(chat_history, ctx, summary)
 
-    history_block = _format_history(chat_history)
-
-    sys_prompt = (
-        "You are a financial research analyst. Use only the supplied news context when answering, "
-        "keep a professional tone, and cite sources like [1], [2]."
-    )
-    user_prompt = (
-        f"Conversation so far:\n{history_block}\n\n"
-        f"Market context (numbered sources):\n{ctx}\n\n"
-        "Instructions:\n"
-        "1) Respond to the latest user request while staying consistent with the conversation history.\n"
-        "2) Use the provided sources for facts; include inline citations.\n"
-        "3) Summarize risks or missing data if the context does not cover the request."
-    )
-
-    if not XAI_API_KEY:
-        first = sources[0]
-        snippet = _smart_trim(first["snippet"], 180)
-        return {
-            "answer": f"Model offline. Latest question: {latest_user['content']}\nSummary: {snippet} [{first['idx']}]",
-            "sources": sources,
-        }
+    if not llm_gateway.available():
+        return {"answer": _offline_chat_answer(latest_user, sources), "sources": sources, "context_tokens": ctx_tokens}
 
     try:
-        resp = requests.post(
-            "https://api.x.ai/v1/chat/completions",
-            headers={"Authorization": f"Bearer {XAI_API_KEY}", "Content-Type": "application/json"},
-            json={
-                "model": XAI_MODEL,
-                "messages": [
-                    {"role": "system", "content": sys_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                "temperature": 0.25,
-                "max_tokens": model_answer_tokens,
-            },
-            timeout=20,
+        content = llm_gateway.complete(
+            sys_prompt,
+            user_prompt,
+            temperature=0.25,
+            max_tokens=model_answer_tokens,
+            tag="chat",
         )
-        if resp.status_code != 200:
-            raise RuntimeError(f"xAI status {resp.status_code}: {resp.text}")
-        data = resp.json()
-        content = (data.get("choices") or [{}])[0].get("message", {}).get("content", "") or ""
-        return {"answer": _strip_noise(content).strip(), "sources": sources}
+        return {"answer": strip_noise(content).strip(), "sources": sources, "context_tokens": ctx_tokens}
     except Exception as e:
-        first = sources[0]
-        other = f" [{sources[1]['idx']}]" if len(sources) > 1 else ""
         return {
-            "answer": f"Couldn’t reach the LLM ({e}). Latest snippet: {_smart_trim(first['snippet'], 200)} [{first['idx']}]"+other,
-            "sources": sources
+            "answer": _llm_error_answer(e, sources, label="Latest snippet", limit=200),
+            "sources": sources,
+            "context_tokens": ctx_tokens,
         }
 
+def chat_with_grok_stream(
+    docs: List[Dict],
+    chat_history: List[Dict],
+    token_budget_tokens: int = 3800,
+    model_answer_tokens: int = 500,
+    user: Optional[str] = None,
+    summary: Optional[str] = None,
+    context: Optional[Tuple[str, List[Dict], int]] = None,
+) -> Iterator[Dict]:
+    """
+    Streaming variant of chat_with_grok; yields the same events as
+    answer_with_grok_stream. The caller stores the final answer.
+    `user` is passed explicitly because llm_request scopes can't span yields.
+    """
+    latest_user = _latest_user(chat_history)
+    ctx, sources, ctx_tokens = context or build_chat_context(
+        docs, token_budget_tokens, model_answer_tokens, query=latest_user["content"]
+    )
+    yield {"type": "sources", "sources": sources, "context_tokens": ctx_tokens}
+    if not sources:
+        yield from _single_answer_events("I couldn’t find relevant context.")
+        return
+    if not llm_gateway.available():
+        yield from _single_answer_events(_offline_chat_answer(latest_user, sources))
+        return
+
+    sys_prompt, user_prompt = _chat_prompts(chat_history, ctx, summary)
+    yield from _stream_answer_events(
+        [
+            {"role": "system", "content": sys_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        sources,
+        max_tokens=model_answer_tokens,
+        temperature=0.25,
+        tag="chat",
+        error_label="Latest snippet",
+        error_limit=200,
+        user=user,
+    )
+
 # --------- Simple local test ---------
 if __name__ == "__main__":
     question = "What is the sentiment of the latest BTC accumulation news?"
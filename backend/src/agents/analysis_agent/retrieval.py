@@ -0,0 +1,151 @@
+# src/agents/analysis_agent/retrieval.py
+"""
+Question-aware BM25 retrieval over a request's docs.
+
+Each doc set gets one index (cached by a hash of its cleaned texts) holding a
+doc-level BM25 and a sentence-level BM25. grok_reasoner uses it to order docs
+by relevance to the question / latest chat turn and, when a doc has to be
+trimmed, to keep its best-matching sentences instead of its first characters.
+"""
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import List, Optional
+
+from src.llm.tokenizer import count_tokens
+
+TERM_RE = re.compile(r"[a-z0-9]+")
+SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "how", "i", "in",
+    "is", "it", "its", "me", "my", "of", "on", "or", "so", "that", "the", "this", "to", "was", "we",
+    "what", "when", "where", "which", "who", "why", "will", "with", "you", "about", "can", "do", "does",
+}
+INDEX_CACHE_SIZE = 64
+MIN_RELEVANT_DOCS = 3   # below this many matching docs, keep non-matching ones too
+
+
+def terms(text: str) -> List[str]:
+    return [t for t in TERM_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in SENTENCE_RE.split(text or "") if s.strip()]
+
+
+class BM25:
+    def __init__(self, corpus: List[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.tfs = [Counter(doc) for doc in corpus]
+        self.lengths = [len(doc) for doc in corpus]
+        self.avg_len = (sum(self.lengths) / len(corpus)) if corpus else 0.0
+        df: Counter = Counter()
+        for tf in self.tfs:
+            df.update(tf.keys())
+        n = len(corpus)
+        self.idf = {term: math.log(1 + (n - f + 0.5) / (f + 0.5)) for term, f in df.items()}
+
+    def scores(self, query: List[str]) -> List[float]:
+        q_terms = [t for t in set(query) if t in self.idf]
+        out = []
+        for tf, length in zip(self.tfs, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * (length / self.avg_len if self.avg_len else 0))
+            score = 0.0
+            for t in q_terms:
+                f = tf.get(t)
+                if f:
+                    score += self.idf[t] * f * (self.k1 + 1) / (f + norm)
+            out.append(score)
+        return out
+
+
+class DocSetIndex:
+    def __init__(self, texts: List[str]):
+        self.doc_bm25 = BM25([terms(t) for t in texts])
+        self.sentences: List[List[str]] = [split_sentences(t) for t in texts]
+        # sentences of doc d sit at offsets[d] : offsets[d] + len(sentences[d]) in the flat index
+        self.offsets: List[int] = []
+        flat: List[List[str]] = []
+        for sents in self.sentences:
+            self.offsets.append(len(flat))
+            flat.extend(terms(s) for s in sents)
+        self.sent_bm25 = BM25(flat)
+
+
+_cache: "OrderedDict[str, DocSetIndex]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def doc_set_key(texts: List[str]) -> str:
+    h = hashlib.sha1()
+    for t in texts:
+        h.update(t.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def get_index(texts: List[str]) -> DocSetIndex:
+    """Index for this doc set, built once and reused while it stays in the LRU."""
+    key = doc_set_key(texts)
+    with _cache_lock:
+        index = _cache.get(key)
+        if index is not None:
+            _cache.move_to_end(key)
+            return index
+    index = DocSetIndex(texts)
+    with _cache_lock:
+        _cache[key] = index
+        while len(_cache) > INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
+
+def rank_docs(index: DocSetIndex, query: str) -> List[int]:
+    """
+    Doc positions ordered by BM25 score (ties keep arrival order). Docs with no
+    match are dropped when enough docs do match.
+    """
+    scores = index.doc_bm25.scores(terms(query))
+    order = sorted(range(len(scores)), key=lambda i: (-scores[i], i))
+    matched = [i for i in order if scores[i] > 0]
+    return matched if len(matched) >= MIN_RELEVANT_DOCS else order
+
+
+def sentence_scores(index: DocSetIndex, query: str) -> List[float]:
+    """BM25 score of every sentence in the doc set (flat order, see DocSetIndex.offsets)."""
+    return index.sent_bm25.scores(terms(query))
+
+
+def best_passage(index: DocSetIndex, doc_pos: int, sent_scores: List[float], budget_tokens: int) -> Optional[str]:
+    """
+    Highest-scoring sentences of one doc that fit `budget_tokens`, re-joined in
+    their original order ("…" marks skipped text). None if nothing matches.
+    """
+    sentences = index.sentences[doc_pos]
+    if len(sentences) < 2:
+        return None
+    start = index.offsets[doc_pos]
+    mine = [(sent_scores[start + s], s) for s in range(len(sentences))]
+    if not any(score > 0 for score, _ in mine):
+        return None
+    picked, used = [], 0
+    for score, s in sorted(mine, key=lambda x: (-x[0], x[1])):
+        cost = count_tokens(sentences[s]) + 2  # joining space and a possible "…"
+        if used + cost > budget_tokens:
+            continue
+        picked.append(s)
+        used += cost
+    if not picked:
+        return None
+    picked.sort()
+    parts = []
+    for prev, s in zip([-1] + picked, picked):
+        if s != prev + 1:   # also marks skipped leading sentences
+            parts.append("…")
+        parts.append(sentences[s])
+    if picked[-1] != len(sentences) - 1:
+        parts.append("…")
+    return " ".join(parts)
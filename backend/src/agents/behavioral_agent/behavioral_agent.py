@@ -2,24 +2,28 @@ from __future__ import annotations
 
 import json
 import math
-import os
 import sys
-import requests
+from collections import Counter
 from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
 import snowflake.connector
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
+from src.agents.behavioral_agent.coin_index import get_coin_index, top_k as coin_top_k
 from src.deps import get_db_connection
+from src.llm import context as llm_context
+from src.llm import gateway as llm_gateway
 
 DB_PATH = Path(__file__).with_name("db.json")
 _behavior_db: Optional[List[Dict[str, Any]]] = None
 
 
+class TransactionsUnavailable(RuntimeError):
+    """The history couldn't be read (Snowflake error or timeout, deadline passed), as opposed to empty."""
+
+
 @contextmanager
 def open_db():
     """Reuse FastAPI's generator dependency in scripts/agents."""
@@ -35,35 +39,27 @@ def open_db():
 
 
 def _call_grok(system_prompt: str, user_prompt: str, max_tokens: int = 450) -> str:
-    api_key = os.getenv("XAI_API_KEY")
-    if not api_key:
+    if not llm_gateway.is_configured():
         raise RuntimeError("Missing XAI_API_KEY for Grok.")
-    model = os.getenv("XAI_MODEL", "grok-3-mini")
-
     try:
-        resp = requests.post(
-            "https://api.x.ai/v1/chat/completions",
-            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-            json={
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                "temperature": 0.25,
-                "max_tokens": max_tokens,
-            },
-            timeout=20,
+        content = llm_gateway.complete(
+            system_prompt,
+            user_prompt,
+            temperature=0.25,
+            max_tokens=max_tokens,
+            tag="behavioral",
         )
-    except requests.RequestException as exc:
+    except (llm_gateway.DeadlineExceeded, llm_gateway.CircuitOpen):
+        raise
+    except llm_gateway.LLMError as exc:
         raise RuntimeError(f"Grok request failed: {exc}") from exc
+    return (content or "").strip()
 
-    if resp.status_code != 200:
-        raise RuntimeError(f"Grok status {resp.status_code}: {resp.text}")
 
-    data = resp.json()
-    content = (data.get("choices") or [{}])[0].get("message", {}).get("content", "")
-    return (content or "").strip()
+def _query_timeout() -> Optional[int]:
+    """Snowflake statement timeout (whole seconds) left under the request deadline, if any."""
+    left = llm_context.remaining()
+    return None if left is None else max(1, int(left))
 
 
 def _query_transactions_for_user(user_id: str) -> List[Dict[str, Any]]:
@@ -81,18 +77,23 @@ def _query_transactions_for_user(user_id: str) -> List[Dict[str, Any]]:
         WHERE USER_ID = %s
         ORDER BY "TIMESTAMP" DESC
     """
+    if llm_context.expired():
+        raise TransactionsUnavailable("Request deadline passed before the transaction query.")
     try:
         with open_db() as db:
             with db.cursor(snowflake.connector.DictCursor) as cur:
-                cur.execute(sql, (user_id,))
+                cur.execute(sql, (user_id,), timeout=_query_timeout())
                 return [dict(r) for r in cur.fetchall()]
     except snowflake.connector.Error as e:
         print(f"[{datetime.now()}] ❌ Snowflake error in _query_transactions_for_user: {e}", file=sys.stderr)
-        return []
+        raise TransactionsUnavailable(f"Transaction query failed for {user_id}: {e}") from e
 
 
 def fetch_transactions_for_user(user_id: str) -> Tuple[str, List[Dict[str, Any]]]:
-    """Fetch the user's history, falling back to U01 if no rows exist."""
+    """
+    Fetch the user's history, falling back to U01 only if the user has no rows.
+    Raises TransactionsUnavailable if a query fails or times out.
+    """
     target = (user_id or "").upper() or "U01"
     rows = _query_transactions_for_user(target)
     if rows:
@@ -103,6 +104,35 @@ def fetch_transactions_for_user(user_id: str) -> Tuple[str, List[Dict[str, Any]]
     return target, []
 
 
+def latest_transaction_marker(user_id: str) -> Tuple[str, Optional[str]]:
+    """
+    (resolved user, "<TRANSACTION_ID>@<TIMESTAMP>" of their newest transaction).
+    One-row query, so callers can tell whether anything derived from the
+    history is stale without fetching it. Same U01 fallback as
+    fetch_transactions_for_user; the marker is None if nothing was found.
+    """
+    sql = """
+        SELECT TRANSACTION_ID, "TIMESTAMP" AS TIMESTAMP
+        FROM TRANSACTION_HISTORY
+        WHERE USER_ID = %s
+        ORDER BY "TIMESTAMP" DESC
+        LIMIT 1
+    """
+    target = (user_id or "").upper() or "U01"
+    for candidate in dict.fromkeys([target, "U01"]):
+        try:
+            with open_db() as db:
+                with db.cursor(snowflake.connector.DictCursor) as cur:
+                    cur.execute(sql, (candidate,), timeout=_query_timeout())
+                    row = cur.fetchone()
+        except snowflake.connector.Error as e:
+            print(f"[{datetime.now()}] ❌ Snowflake error in latest_transaction_marker: {e}", file=sys.stderr)
+            return target, None
+        if row:
+            return candidate, f"{row['TRANSACTION_ID']}@{row['TIMESTAMP']}"
+    return target, None
+
+
 def get_all_transactions(limit: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
     """Existing helper for API pagination."""
     base_sql = """
@@ -149,7 +179,12 @@ def _format_transactions_for_prompt(transactions: List[Dict[str, Any]]) -> str:
     return "\n".join(lines)
 
 
-def analyze_trading_style(transactions: List[Dict[str, Any]]) -> str:
+def analyze_trading_style(transactions: List[Dict[str, Any]], fallback: bool = True) -> str:
+    """
+    Grok's summary of the trading style. When the deadline is reached or the
+    breaker is open it falls back to summarize_style_locally, unless
+    `fallback` is False, in which case DeadlineExceeded / CircuitOpen propagate.
+    """
     if not transactions:
         raise ValueError("No transactions provided for analysis.")
 
@@ -165,7 +200,31 @@ def analyze_trading_style(transactions: List[Dict[str, Any]]) -> str:
         "Summarize their trading style in 3-5 sentences. Mention risk appetite, time horizon, favorite assets, "
         "and any behavioral cues (e.g., chasing breakouts, mean reversion, panic selling)."
     )
-    return _call_grok(system_prompt, user_prompt)
+    try:
+        return _call_grok(system_prompt, user_prompt)
+    except llm_gateway.DeadlineExceeded:
+        if not fallback:
+            raise
+        print(f"[{datetime.now()}] Behavioral: deadline reached, using the local style summary.")
+        return summarize_style_locally(transactions)
+    except llm_gateway.CircuitOpen:
+        if not fallback:
+            raise
+        print(f"[{datetime.now()}] Behavioral: Grok breaker open, using the local style summary.")
+        return summarize_style_locally(transactions)
+
+
+def summarize_style_locally(transactions: List[Dict[str, Any]]) -> str:
+    """Rough persona from the raw numbers, used when Grok is out of time or unavailable."""
+    sides = Counter((t.get("TRANSACTION_TYPE") or "").lower() for t in transactions)
+    symbols = [s for s, _ in Counter(t.get("SYMBOL") for t in transactions if t.get("SYMBOL")).most_common(3)]
+    sizes = [float(t.get("TOTAL_USD") or 0) for t in transactions]
+    avg_size = sum(sizes) / len(sizes) if sizes else 0.0
+    return (
+        f"Trader with {len(transactions)} recent transactions ({sides.get('buy', 0)} buys, "
+        f"{sides.get('sell', 0)} sells), mostly trading {', '.join(symbols) or 'various assets'}. "
+        f"Average trade size is about ${avg_size:,.0f}."
+    )
 
 
 def _load_behavior_db() -> List[Dict[str, Any]]:
@@ -176,28 +235,27 @@ def _load_behavior_db() -> List[Dict[str, Any]]:
     return _behavior_db
 
 
-def rank_coins_by_similarity(style_summary: str) -> List[Dict[str, Any]]:
+def rank_coins_by_similarity(style_summary: str, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Coins ranked by TF-IDF cosine similarity to the style summary (best first),
+    against the precomputed coin index; `top_k` limits it to the k best.
+    """
     entries = _load_behavior_db()
     if not style_summary or not entries:
         return []
 
-    texts = [style_summary] + [entry["summary"] for entry in entries]
-    vectorizer = TfidfVectorizer(stop_words="english")
-    matrix = vectorizer.fit_transform(texts)
-    user_vec = matrix[:1]
-    coin_vecs = matrix[1:]
-    sims = cosine_similarity(user_vec, coin_vecs).flatten()
-
+    sims = get_coin_index(DB_PATH, entries).similarities(style_summary)
     if sims.size == 0:
         return []
 
-    min_sim = sims.min()
-    max_sim = sims.max()
+    min_sim = float(sims.min())
+    max_sim = float(sims.max())
     range_sim = max(max_sim - min_sim, 1e-9)
 
     ranked = []
-    for entry, score in sorted(zip(entries, sims), key=lambda x: x[1], reverse=True):
-        sim_value = float(score)
+    for idx in coin_top_k(sims, top_k):
+        entry = entries[idx]
+        sim_value = float(sims[idx])
         norm = max((sim_value - min_sim) / range_sim, 0.0)
         boosted = math.pow(norm, 0.35)  # concave scaling so leaders push toward 1
         ranked.append({
@@ -0,0 +1,130 @@
+# src/agents/behavioral_agent/coin_index.py
+"""
+Precomputed TF-IDF index over the coin summaries in db.json.
+
+The vocabulary and idf weights are fitted once, and the L2-normalized coin
+matrix is stored as plain .npy files (CSR parts) that are memory-mapped on
+load, so workers share the pages and start without refitting. The index is
+rebuilt only when db.json changes (its hash is stored alongside).
+
+A query is then: count the summary's terms over the fixed vocabulary, weight
+by idf, normalize, one sparse mat-vec against the coin matrix and a partial
+sort for the top k. Close to, but not the same as, fitting TfidfVectorizer
+per request: that fit counted the query as one more document, so every
+term it shared with the corpus got a slightly lower idf. Here idf comes from
+the corpus alone, which shifts term weights unevenly, and near-tied coins
+can swap places.
+
+Env:
+    BEHAVIOR_INDEX_DIR   where the index files live (default: db_index/ next to db.json)
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+
+INDEX_VERSION = 1
+VECTORIZER_PARAMS = {"stop_words": "english"}
+
+
+def _source_hash(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+class CoinIndex:
+    def __init__(self, vocabulary: Dict[str, int], idf: np.ndarray, matrix: sparse.csr_matrix):
+        self.idf = idf
+        self.matrix = matrix   # coins x terms, rows L2-normalized
+        self._counter = CountVectorizer(vocabulary=vocabulary, **VECTORIZER_PARAMS)
+
+    @classmethod
+    def fit(cls, summaries: List[str]) -> "CoinIndex":
+        vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS)
+        matrix = vectorizer.fit_transform(summaries).tocsr().astype(np.float32)
+        vocabulary = {term: int(idx) for term, idx in vectorizer.vocabulary_.items()}
+        return cls(vocabulary, vectorizer.idf_.astype(np.float32), matrix)
+
+    def save(self, directory: Path, source_hash: str) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        for name, array in (
+            ("data", self.matrix.data),
+            ("indices", self.matrix.indices),
+            ("indptr", self.matrix.indptr),
+            ("idf", self.idf),
+        ):
+            np.save(directory / f"{name}.npy", np.ascontiguousarray(array))
+        meta = {
+            "version": INDEX_VERSION,
+            "source_hash": source_hash,
+            "shape": list(self.matrix.shape),
+            "vocabulary": self._counter.vocabulary,
+        }
+        tmp = directory / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, directory / "meta.json")   # meta last: a half-written index is never picked up
+
+    @classmethod
+    def load(cls, directory: Path, source_hash: str) -> Optional["CoinIndex"]:
+        """Memory-mapped index from `directory`, or None if missing or built from another db.json."""
+        try:
+            meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+            if meta.get("version") != INDEX_VERSION or meta.get("source_hash") != source_hash:
+                return None
+            parts = {name: np.load(directory / f"{name}.npy", mmap_mode="r") for name in ("data", "indices", "indptr", "idf")}
+        except (OSError, ValueError):
+            return None
+        matrix = sparse.csr_matrix((parts["data"], parts["indices"], parts["indptr"]), shape=tuple(meta["shape"]))
+        return cls(meta["vocabulary"], parts["idf"], matrix)
+
+    def query_vector(self, text: str) -> sparse.csr_matrix:
+        vec = self._counter.transform([text]).astype(np.float32).multiply(self.idf).tocsr()
+        norm = np.sqrt(vec.multiply(vec).sum())
+        return vec / norm if norm > 0 else vec
+
+    def similarities(self, text: str) -> np.ndarray:
+        """Cosine similarity of `text` to every coin (1-D, in db.json order)."""
+        return np.asarray((self.matrix @ self.query_vector(text).T).todense()).ravel()
+
+
+def top_k(sims: np.ndarray, k: Optional[int]) -> np.ndarray:
+    """Indices of the k best scores, best first (all of them if k is None)."""
+    if k is None or k >= sims.size:
+        return np.argsort(-sims, kind="stable")
+    part = np.argpartition(-sims, k - 1)[:k]
+    return part[np.argsort(-sims[part], kind="stable")]
+
+
+_index: Optional[Tuple[str, CoinIndex]] = None   # (db.json hash, index)
+_index_lock = threading.Lock()
+
+
+def get_coin_index(db_path: Path, entries: List[Dict[str, Any]]) -> CoinIndex:
+    """
+    Index for `entries` (loaded once from db_path): in memory, else from disk,
+    else fitted and saved.
+    """
+    global _index
+    if _index is not None:
+        return _index[1]
+    with _index_lock:
+        if _index is not None:
+            return _index[1]
+        source_hash = _source_hash(db_path)
+        directory = Path(os.getenv("BEHAVIOR_INDEX_DIR") or db_path.with_name("db_index"))
+        index = CoinIndex.load(directory, source_hash)
+        if index is None:
+            index = CoinIndex.fit([entry["summary"] for entry in entries])
+            try:
+                index.save(directory, source_hash)
+                print(f"[{datetime.now()}] Behavioral: built coin index ({index.matrix.shape[0]} coins) in {directory}.")
+            except OSError as exc:
+                print(f"[{datetime.now()}] Behavioral: coin index kept in memory only ({exc}).")
+        _index = (source_hash, index)
+        return index
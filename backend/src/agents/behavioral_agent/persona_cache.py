@@ -0,0 +1,219 @@
+# src/agents/behavioral_agent/persona_cache.py
+"""
+Per-user persona cache (Grok style summary), keyed on the user's newest trade.
+
+A lookup costs one single-row Snowflake query (latest_transaction_marker):
+- same marker as the cached persona: served as is;
+- the user traded since: the old persona is served right away (stale=True)
+  and a background worker (enrichment priority) recomputes it;
+- nothing cached yet: computed inline, within the caller's deadline
+  (concurrent misses for the same user share that one computation).
+
+Recommendations are ranked from the cached summary against the precomputed
+coin index on every read (milliseconds, no LLM), so they always follow the
+current db.json. Entries are written to a JSON file so they survive restarts.
+A summary produced by the local fallback (deadline reached or Grok breaker
+open) is returned but not stored; a background refresh is queued instead.
+
+Env:
+    PERSONA_CACHE_PATH        JSON file (default persona_cache.json next to db.json)
+    PERSONA_CACHE_SIZE        users kept, least recently computed dropped first (default 1000)
+    PERSONA_REFRESH_DEADLINE  seconds a background refresh may take (default 60)
+"""
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from src.agents.behavioral_agent.behavioral_agent import (
+    DB_PATH,
+    analyze_trading_style,
+    fetch_transactions_for_user,
+    latest_transaction_marker,
+    summarize_style_locally,
+)
+from src.llm import gateway as llm_gateway
+from src.llm.context import llm_request, remaining
+from src.llm.scheduler import ENRICHMENT
+
+CACHE_PATH = Path(os.getenv("PERSONA_CACHE_PATH") or DB_PATH.with_name("persona_cache.json"))
+CACHE_SIZE = int(os.getenv("PERSONA_CACHE_SIZE", "1000"))
+REFRESH_DEADLINE_S = float(os.getenv("PERSONA_REFRESH_DEADLINE", "60"))
+
+# resolved user -> {"marker", "analysis", "computed_at"}
+_personas: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_loaded = False
+_lock = threading.Lock()
+_save_lock = threading.Lock()
+_stats = {"hits": 0, "stale": 0, "misses": 0, "refreshes": 0, "refresh_failures": 0}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="persona-refresh")
+_inflight: set = set()
+_inflight_lock = threading.Lock()
+_cold: Dict[str, Future] = {}   # resolved user -> inline compute that other cold misses wait on
+
+
+def _ensure_loaded() -> None:
+    """Read the persisted personas once per process (caller holds _lock)."""
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    try:
+        data = json.loads(CACHE_PATH.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        print(f"[{datetime.now()}] ERROR: Unreadable persona cache {CACHE_PATH}: {e}", file=sys.stderr)
+        return
+    for user_id, entry in sorted(data.items(), key=lambda kv: kv[1].get("computed_at", "")):
+        if entry.get("marker") and entry.get("analysis"):
+            _personas[user_id] = entry
+    print(f"[{datetime.now()}] Persona cache: loaded {len(_personas)} personas from {CACHE_PATH}.")
+
+
+def _save() -> None:
+    with _save_lock:
+        # snapshot under _save_lock too, so an older snapshot is never written last
+        with _lock:
+            snapshot = dict(_personas)
+        try:
+            tmp = CACHE_PATH.with_name(CACHE_PATH.name + ".tmp")
+            tmp.write_text(json.dumps(snapshot), encoding="utf-8")
+            os.replace(tmp, CACHE_PATH)
+        except OSError as e:
+            print(f"[{datetime.now()}] ERROR: Could not write persona cache {CACHE_PATH}: {e}", file=sys.stderr)
+
+
+def _store(user_id: str, marker: str, analysis: str) -> Dict[str, Any]:
+    entry = {"marker": marker, "analysis": analysis, "computed_at": datetime.now().isoformat()}
+    with _lock:
+        _personas[user_id] = entry
+        _personas.move_to_end(user_id)
+        while len(_personas) > CACHE_SIZE:
+            _personas.popitem(last=False)
+    _save()
+    return entry
+
+
+def _compute(user_id: str, marker: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Fresh persona for `user_id` (as of `marker`): {"user_id", "analysis",
+    "marker", "computed_at"}, stored unless it's the local fallback. None if
+    the user has no transactions. Raises TransactionsUnavailable if the
+    history can't be read.
+    """
+    resolved, rows = fetch_transactions_for_user(user_id)
+    if not rows:
+        return None
+    try:
+        analysis = analyze_trading_style(rows, fallback=False)
+        fell_back = False
+    except (llm_gateway.DeadlineExceeded, llm_gateway.CircuitOpen) as e:
+        print(f"[{datetime.now()}] Persona cache: {type(e).__name__} for {resolved}, serving the local style summary.")
+        analysis = summarize_style_locally(rows)
+        fell_back = True
+    if fell_back or not marker:
+        return {"user_id": resolved, "analysis": analysis, "marker": marker, "computed_at": None}
+    return {"user_id": resolved, **_store(resolved, marker, analysis)}
+
+
+def _compute_once(user_id: str, marker: Optional[str]) -> Optional[Dict[str, Any]]:
+    """_compute for a cold miss; concurrent misses for the same user wait on the first one's result."""
+    with _inflight_lock:
+        leader = user_id not in _cold
+        future = _cold.setdefault(user_id, Future())
+    if not leader:
+        left = remaining()
+        try:
+            return future.result(timeout=None if left is None else max(0.0, left))
+        except FutureTimeout:
+            return _compute(user_id, marker)   # out of time waiting: fails or falls back on our own deadline
+    try:
+        result = _compute(user_id, marker)
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _inflight_lock:
+            _cold.pop(user_id, None)
+
+
+def _refresh(user_id: str) -> None:
+    try:
+        with llm_request(user=user_id, priority=ENRICHMENT, deadline_s=REFRESH_DEADLINE_S):
+            result = _compute(*latest_transaction_marker(user_id))
+        if result and result.get("computed_at"):
+            with _lock:
+                _stats["refreshes"] += 1
+            print(f"[{datetime.now()}] Persona cache: refreshed {user_id} at {result['marker']}.")
+        else:
+            with _lock:
+                _stats["refresh_failures"] += 1
+    except Exception as e:
+        with _lock:
+            _stats["refresh_failures"] += 1
+        print(f"[{datetime.now()}] ERROR: Persona refresh failed for {user_id}: {e}", file=sys.stderr)
+    finally:
+        with _inflight_lock:
+            _inflight.discard(user_id)
+
+
+def _schedule_refresh(user_id: str) -> bool:
+    """Queue a background recompute for `user_id` unless one is already running. Never blocks."""
+    with _inflight_lock:
+        if user_id in _inflight:
+            return False
+        _inflight.add(user_id)
+    _executor.submit(_refresh, user_id)
+    return True
+
+
+def get_persona(user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Persona for `user_id`: {"user_id", "analysis", "marker", "computed_at",
+    "cached", "stale"}, or None if there are no transactions for the user
+    (or the U01 fallback). Raises TransactionsUnavailable on a cold miss whose
+    history can't be read.
+    """
+    resolved, marker = latest_transaction_marker(user_id)
+    with _lock:
+        _ensure_loaded()
+        entry = _personas.get(resolved)
+        if entry is not None:
+            # marker None = Snowflake unreachable: keep serving what we have
+            stale = marker is not None and entry["marker"] != marker
+            _stats["stale" if stale else "hits"] += 1
+            entry = dict(entry)
+    if entry is not None:
+        if stale:
+            _schedule_refresh(resolved)
+        return {"user_id": resolved, **entry, "cached": True, "stale": stale}
+
+    with _lock:
+        _stats["misses"] += 1
+    result = _compute_once(resolved, marker)
+    if result is None:
+        return None
+    if not result["computed_at"] and result["marker"]:
+        _schedule_refresh(result["user_id"])   # local fallback was served; get the real one for next time
+    return {**result, "cached": False, "stale": False}
+
+
+def persona_cache_stats() -> Dict[str, Any]:
+    with _lock:
+        _ensure_loaded()
+        stats = dict(_stats, size=len(_personas), max_size=CACHE_SIZE)
+    with _inflight_lock:
+        stats["refreshing"] = len(_inflight)
+    lookups = stats["hits"] + stats["stale"] + stats["misses"]
+    stats["hit_rate"] = round((stats["hits"] + stats["stale"]) / lookups, 3) if lookups else None
+    return stats
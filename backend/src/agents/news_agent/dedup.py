@@ -0,0 +1,96 @@
+# news_agent/dedup.py
+"""
+Near-duplicate suppression for scored posts.
+
+64-bit SimHash over the cleaned text (links, handles, tags and emojis removed)
+plus LSH banding: the fingerprint is split into `bands` chunks, and two posts
+are only compared when at least one chunk matches exactly. With 4 bands of 16
+bits any pair within Hamming distance 3 shares a band, so lookups stay O(1)
+per post and a whole batch dedupes in linear time.
+"""
+import hashlib
+import re
+from typing import Dict, Hashable, List, Optional
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+FP_BITS = 64
+
+
+def _feature_hash(feature: str) -> int:
+    # stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(clean_text: str) -> int:
+    """
+    64-bit SimHash over word unigrams and bigrams of already-cleaned text;
+    0 when there are no words left (e.g. a link-only post).
+    """
+    words = WORD_RE.findall((clean_text or "").lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not features:
+        return 0
+    weights = [0] * FP_BITS
+    for f in features:
+        h = _feature_hash(f)
+        for bit in range(FP_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    fp = 0
+    for bit, w in enumerate(weights):
+        if w > 0:
+            fp |= 1 << bit
+    return fp
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class NearDuplicateIndex:
+    """LSH index over SimHash fingerprints."""
+
+    def __init__(self, max_distance: int = 3, bands: int = 4):
+        if FP_BITS % bands:
+            raise ValueError("bands must divide 64")
+        self.max_distance = max_distance
+        self.bands = bands
+        self._width = FP_BITS // bands
+        self._mask = (1 << self._width) - 1
+        self._buckets: List[Dict[int, List[Hashable]]] = [{} for _ in range(bands)]
+        self._fps: Dict[Hashable, int] = {}
+
+    def _band_values(self, fp: int) -> List[int]:
+        return [(fp >> (i * self._width)) & self._mask for i in range(self.bands)]
+
+    def find(self, fp: int) -> Optional[Hashable]:
+        """Return the key of an indexed near-duplicate of `fp`, if any."""
+        for i, value in enumerate(self._band_values(fp)):
+            for key in self._buckets[i].get(value, ()):
+                if hamming(fp, self._fps[key]) <= self.max_distance:
+                    return key
+        return None
+
+    def add(self, key: Hashable, fp: int) -> None:
+        self._fps[key] = fp
+        for i, value in enumerate(self._band_values(fp)):
+            self._buckets[i].setdefault(value, []).append(key)
+
+
+def dedupe_best(docs: List[Dict], max_distance: int = 3) -> List[Dict]:
+    """
+    Keep the best-scored representative of each near-duplicate cluster.
+    Docs need {"id", "score", "simhash"}; input order is kept. Docs without
+    a fingerprint (simhash 0: nothing left after cleaning) are never merged.
+    """
+    index = NearDuplicateIndex(max_distance=max_distance)
+    keep_ids = set()
+    for d in sorted(docs, key=lambda d: d["score"], reverse=True):
+        fp = d["simhash"]
+        if not fp:
+            keep_ids.add(d["id"])
+            continue
+        if index.find(fp) is not None:
+            continue
+        index.add(d["id"], fp)
+        keep_ids.add(d["id"])
+    return [d for d in docs if d["id"] in keep_ids]
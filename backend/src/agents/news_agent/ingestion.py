@@ -2,11 +2,15 @@
 import os
 import re
 import json
-import requests
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 from xdk import Client
 
+from src.agents.news_agent.dedup import dedupe_best, simhash
+from src.llm import context as llm_context
+from src.llm import gateway as llm_gateway
+from src.llm.scheduler import ENRICHMENT
+
 
 # ------------ helpers ------------
 URL_RE    = re.compile(r"https?://\S+")
@@ -36,12 +40,10 @@ def generate_title_with_xai(text: str) -> str:
     Create a concise title using xAI; fall back to a local heuristic on any error.
     Env: XAI_API_KEY (required for remote), XAI_MODEL (optional; default: grok-3-mini)
     """
-    api_key = os.getenv("XAI_API_KEY")
-    model   = os.getenv("XAI_MODEL", "grok-3-mini")
     base    = _strip_noise(text).split("\n", 1)[0] or text.split("\n", 1)[0]
     fallback = _smart_trim(base)
 
-    if not api_key:
+    if not llm_gateway.available():
         return fallback
 
     clean = _strip_noise(text) or text  # keep raw if all noise
@@ -51,64 +53,113 @@ def generate_title_with_xai(text: str) -> str:
     )
 
     try:
-        resp = requests.post(
-            "https://api.x.ai/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": "You write crisp, factual headlines."},
-                    {"role": "user", "content": prompt},
-                ],
-                "temperature": 0.2,
-                "max_tokens": 48,
-            },
+        title = llm_gateway.complete(
+            "You write crisp, factual headlines.",
+            prompt,
+            temperature=0.2,
+            max_tokens=48,
             timeout=15,
+            tag="news_title",
+            priority=ENRICHMENT,
         )
-        if resp.status_code != 200:
-            return fallback
-        data = resp.json()
-        title = (data.get("choices") or [{}])[0].get("message", {}).get("content", "") or ""
         return _smart_trim(_strip_noise(title)) or fallback
     except Exception:
         return fallback
 
 # ------------ fetch + rerank + shape ------------
-def ingest_news(token: str, top_k: int = 6) -> List[Dict[str, str]]:
-    """
-    Fetch recent originals about `token`, title with xAI, return up to `top_k` items:
-    [{title, context, link}]
-    Env: BEARER_TOKEN (X API), XAI_API_KEY (optional)
-    """
+NEG_WORDS = "-pump -signal -copytrading -copy -giveaway -airdrop -scalp -memecoin"
+QUERY_FILTERS = f"lang:en has:links -is:retweet -is:quote -is:reply {NEG_WORDS}"
+MAX_RESULTS_PER_PAGE = 100
+X_QUERY_MAX_LEN = int(os.getenv("X_QUERY_MAX_LEN", "512"))   # 512 on basic access, 4096 on pro
+BATCH_MAX_PAGES = int(os.getenv("NEWS_BATCH_MAX_PAGES", "3"))
+
+def _x_client() -> Client:
     load_dotenv()
     bearer = os.getenv("BEARER_TOKEN")
     if not bearer:
         raise RuntimeError("Missing BEARER_TOKEN in environment.")
-    client = Client(bearer_token=bearer)
+    return Client(bearer_token=bearer)
 
-    neg_words = "-pump -signal -copytrading -copy -giveaway -airdrop -scalp -memecoin"
-    query = f"({token} OR #{token} OR ${token}) lang:en has:links -is:retweet -is:quote -is:reply {neg_words}"
+def _token_clause(token: str) -> str:
+    return f"{token} OR #{token} OR ${token}"
 
-    resp = client.posts.search_recent(query=query, max_results=100)
-    if not getattr(resp, "data", None):
-        return []
+def _build_query(token: str) -> str:
+    return _combined_query([token])
 
-    token_l = token.lower()
+def _combined_query(tokens: List[str]) -> str:
+    return "(" + " OR ".join(_token_clause(t) for t in tokens) + ") " + QUERY_FILTERS
 
-    def score(text: str) -> float:
-        t = text.lower()
-        return (
-            min(len(text) / 280.0, 1.0) +            # length bonus
-            (0.3 if "http" in t else 0.0) +          # link bonus
-            0.4 * t.count(token_l) +                 # keyword hits
-            (-0.4 if len(text) < 40 else 0.0)        # short penalty
-        )
+def pack_token_queries(tokens: List[str], max_len: int = X_QUERY_MAX_LEN) -> List[Tuple[List[str], str]]:
+    """
+    Greedily pack tokens into combined OR queries that fit X's query-length limit.
+    Returns: [(tokens_in_query, query)]
+    """
+    groups: List[List[str]] = []
+    for token in tokens:
+        if len(_combined_query([token])) > max_len:
+            raise ValueError(f"Query for token '{token}' exceeds {max_len} characters.")
+        if groups and len(_combined_query(groups[-1] + [token])) <= max_len:
+            groups[-1].append(token)
+        else:
+            groups.append([token])
+    return [(group, _combined_query(group)) for group in groups]
 
-    seen, docs = set(), []
-    for p in resp.data:
+def _meta_value(resp, key: str) -> Optional[str]:
+    """Read a field from the response `meta`, which may be a dict or an object."""
+    meta = getattr(resp, "meta", None)
+    if meta is None:
+        return None
+    if isinstance(meta, dict):
+        return meta.get(key)
+    return getattr(meta, key, None)
+
+def search_posts(
+    client: Client,
+    query: str,
+    since_id: Optional[str] = None,
+    max_pages: int = 1,
+    until_id: Optional[str] = None,
+) -> Tuple[List[Dict], Optional[str], bool]:
+    """
+    Run a recent search, following `next_token` for up to `max_pages` pages.
+    Returns: (posts, newest_id, complete) where newest_id is the newest post of
+    the result set and complete is False when pages were left unread.
+    """
+    posts: List[Dict] = []
+    newest_id: Optional[str] = None
+    next_token: Optional[str] = None
+    for _ in range(max(1, max_pages)):
+        kwargs = {"query": query, "max_results": MAX_RESULTS_PER_PAGE}
+        if since_id:
+            kwargs["since_id"] = since_id
+        if until_id:
+            kwargs["until_id"] = until_id
+        if next_token:
+            kwargs["next_token"] = next_token
+        resp = client.posts.search_recent(**kwargs)
+        posts.extend(getattr(resp, "data", None) or [])
+        # the first page carries the newest id of the whole result set
+        newest_id = newest_id or _meta_value(resp, "newest_id")
+        next_token = _meta_value(resp, "next_token")
+        if not next_token:
+            break
+    return posts, newest_id, not next_token
+
+def _score_post(text: str, token_l: str) -> float:
+    t = text.lower()
+    return (
+        min(len(text) / 280.0, 1.0) +            # length bonus
+        (0.3 if "http" in t else 0.0) +          # link bonus
+        0.4 * t.count(token_l) +                 # keyword hits
+        (-0.4 if len(text) < 40 else 0.0)        # short penalty
+    )
+
+def _filter_and_score(posts: List[Dict], token: str, seen: Optional[set] = None) -> List[Dict]:
+    """Drop repeated ids and spammy posts; return [{id, text, score, simhash}] in input order."""
+    token_l = token.lower()
+    seen = set() if seen is None else seen
+    docs = []
+    for p in posts:
         pid = p.get("id")
         if not pid or pid in seen:
             continue
@@ -116,28 +167,31 @@ def ingest_news(token: str, top_k: int = 6) -> List[Dict[str, str]]:
         text = (p.get("text") or "").strip()
         if text.lower().count("@") >= 3:
             continue
-        if len(re.findall(r"[#\$][A-Za-z0-9_]+", text)) > 6:
+        if len(HASH_RE.findall(text)) > 6:
             continue
-        docs.append({"id": pid, "text": text, "score": score(text)})
-
-    if not docs:
-        return []
+        docs.append({
+            "id": pid,
+            "text": text,
+            "score": _score_post(text, token_l),
+            "simhash": simhash(_strip_noise(text)),
+        })
+    return docs
 
-    docs.sort(key=lambda d: d["score"], reverse=True)
-    top = docs[:top_k]
+def _enrich_docs(docs: List[Dict]) -> List[Dict]:
+    """Title + sentiment for scored docs; the expensive (LLM) step of the pipeline.
+    Sentiment for the whole list is classified in one batched call."""
+    from src.agents.sentiment_agent.sentiment_agent import sentiment_analysis_batch
 
-    from src.agents.sentiment_agent.sentiment_agent import sentiment_analysis
+    neutral = {"positive": 0.0, "negative": 0.0, "neutral": 0.0}
+    try:
+        emotions_list = sentiment_analysis_batch([d["text"] for d in docs])
+    except Exception:
+        emotions_list = [neutral] * len(docs)  # keep zeros if model/env fails
 
     out = []
-    for d in top:
-        emotions = {"positive": 0.0, "negative": 0.0, "neutral": 0.0}
-        try:
-            emotions = sentiment_analysis(d["text"]) or emotions
-        except Exception:
-            pass  # keep zeros if model/env fails
-
+    for d, emotions in zip(docs, emotions_list):
+        emotions = emotions or neutral
         sentiment_score = emotions["positive"] - emotions["negative"]
-
         out.append({
             "id":       d["id"],
             "title":    generate_title_with_xai(d["text"]),
@@ -148,6 +202,64 @@ def ingest_news(token: str, top_k: int = 6) -> List[Dict[str, str]]:
         })
     return out
 
+def ingest_news(token: str, top_k: int = 6) -> List[Dict[str, str]]:
+    """
+    Fetch recent originals about `token`, title with xAI, return up to `top_k` items:
+    [{title, context, link}]
+    Under a request deadline the enrichment calls are capped by the time left and
+    fall back to local titles / neutral sentiment once it has passed.
+    Env: BEARER_TOKEN (X API), XAI_API_KEY (optional)
+    """
+    if llm_context.expired():
+        return []
+    client = _x_client()
+    posts, _, _ = search_posts(client, _build_query(token))
+    if not posts:
+        return []
+
+    docs = _filter_and_score(posts, token)
+    if not docs:
+        return []
+
+    # collapse copy-paste variants before spending LLM calls on them
+    docs = dedupe_best(docs)
+    docs.sort(key=lambda d: d["score"], reverse=True)
+    return _enrich_docs(docs[:top_k])
+
+def _attribution_re(tokens: List[str]) -> re.Pattern:
+    alts = "|".join(re.escape(t) for t in sorted(tokens, key=len, reverse=True))
+    return re.compile(rf"(?<![A-Za-z0-9_])[#\$]?({alts})(?![A-Za-z0-9_])", re.IGNORECASE)
+
+def ingest_news_batch(tokens: List[str], top_k: int = 6) -> Dict[str, List[Dict]]:
+    """
+    Multi-token variant of ingest_news: one combined search per packed query,
+    posts attributed to every token they mention, then scored and deduped per
+    token. Enrichment runs once per distinct post with one batched sentiment call.
+    Returns: {TOKEN: [{id, title, context, link, sentiment, sentiment_score}]}
+    """
+    tokens = list(dict.fromkeys(t.upper() for t in tokens if t and t.strip()))
+    if not tokens:
+        return {}
+    client = _x_client()
+
+    by_token: Dict[str, List[Dict]] = {t: [] for t in tokens}
+    for group, query in pack_token_queries(tokens):
+        posts, _, _ = search_posts(client, query, max_pages=min(len(group), BATCH_MAX_PAGES))
+        match_re = _attribution_re(group)
+        for p in posts:
+            for hit in {m.group(1).upper() for m in match_re.finditer(p.get("text") or "")}:
+                by_token[hit].append(p)
+
+    selected: Dict[str, List[Dict]] = {}
+    for token, posts in by_token.items():
+        docs = dedupe_best(_filter_and_score(posts, token))
+        docs.sort(key=lambda d: d["score"], reverse=True)
+        selected[token] = docs[:top_k]
+
+    unique = {d["id"]: d for docs in selected.values() for d in docs}
+    enriched = {e["id"]: e for e in _enrich_docs(list(unique.values()))}
+    return {token: [dict(enriched[d["id"]]) for d in docs] for token, docs in selected.items()}
+
 if __name__ == "__main__":
     result = ingest_news("BTC", top_k=6)
     print(json.dumps(result, indent=2, ensure_ascii=False))
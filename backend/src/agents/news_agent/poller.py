@@ -0,0 +1,199 @@
+# news_agent/poller.py
+"""
+Background poller that keeps a rolling, already-enriched document window per
+watchlist token, so request handlers can serve news without calling X or xAI.
+
+Env:
+    NEWS_WATCHLIST       comma-separated tokens to poll (poller is off when empty)
+    NEWS_POLL_INTERVAL   seconds between polls (default 60)
+    NEWS_POLL_MAX_PAGES  max `next_token` pages per poll (default 5)
+    NEWS_WINDOW_SIZE     max docs kept per token (default 50)
+    NEWS_WINDOW_MAX_AGE  seconds a doc stays in the window (default 6h)
+    NEWS_ENRICH_TOP      how many best-scored docs are kept enriched (default 10)
+"""
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from src.agents.news_agent.dedup import dedupe_best
+from src.agents.news_agent.ingestion import (
+    _build_query,
+    _enrich_docs,
+    _filter_and_score,
+    _x_client,
+    ingest_news,
+    ingest_news_batch,
+    search_posts,
+)
+from src.llm.context import llm_request
+
+WATCHLIST = [t.strip().upper() for t in os.getenv("NEWS_WATCHLIST", "").split(",") if t.strip()]
+POLL_INTERVAL = int(os.getenv("NEWS_POLL_INTERVAL", "60"))
+POLL_MAX_PAGES = int(os.getenv("NEWS_POLL_MAX_PAGES", "5"))
+WINDOW_SIZE = int(os.getenv("NEWS_WINDOW_SIZE", "50"))
+WINDOW_MAX_AGE = int(os.getenv("NEWS_WINDOW_MAX_AGE", str(6 * 3600)))
+ENRICH_TOP = int(os.getenv("NEWS_ENRICH_TOP", "10"))
+
+# token -> {"since_id": str | None, "until_id": str | None, "resume_id": str | None,
+#           "docs": [{id, text, score, simhash, fetched_at, enriched}], "updated_at": float}
+# since_id: everything up to it has been read. A poll cut off by POLL_MAX_PAGES
+# leaves a gap (since_id, until_id) that the next polls read before moving on to
+# posts newer than resume_id.
+_windows: Dict[str, Dict] = {}
+_lock = threading.Lock()
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _post_key(pid: str) -> int:
+    """X ids are time-ordered snowflakes; larger means newer."""
+    try:
+        return int(pid)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _roll_window(docs: List[Dict], now: float) -> List[Dict]:
+    """Keep the newest WINDOW_SIZE docs that are younger than WINDOW_MAX_AGE."""
+    fresh = [d for d in docs if now - d["fetched_at"] <= WINDOW_MAX_AGE]
+    fresh.sort(key=lambda d: _post_key(d["id"]), reverse=True)
+    return fresh[:WINDOW_SIZE]
+
+
+def poll_token(token: str, client=None) -> int:
+    """
+    Fetch posts newer than the token's watermark, merge them into its window and
+    enrich any doc that entered the top ENRICH_TOP. Returns #new docs kept.
+    """
+    token = token.upper()
+    client = client or _x_client()
+    with _lock:
+        window = _windows.get(token) or {"since_id": None, "docs": [], "updated_at": 0.0}
+        since_id = window["since_id"]
+        until_id = window.get("until_id")
+        resume_id = window.get("resume_id")
+        current = list(window["docs"])
+    seen = {d["id"] for d in current}
+
+    # cold start seeds from a single page; afterwards follow pagination through bursts
+    posts, newest_id, complete = search_posts(
+        client,
+        _build_query(token),
+        since_id=since_id,
+        max_pages=POLL_MAX_PAGES if since_id else 1,
+        until_id=until_id,
+    )
+    now = time.time()
+    fresh = _filter_and_score(posts, token, seen=seen)
+    for d in fresh:
+        d["fetched_at"] = now
+        d["enriched"] = None
+
+    # near-duplicates are resolved across the whole window, not just this batch;
+    # docs are copied so the published window is never mutated outside _lock
+    docs = [dict(d) for d in _roll_window(dedupe_best(current + fresh), now)]
+    to_enrich = [d for d in sorted(docs, key=lambda d: d["score"], reverse=True)[:ENRICH_TOP] if not d["enriched"]]
+    for d, enriched in zip(to_enrich, _enrich_docs(to_enrich) if to_enrich else []):
+        d["enriched"] = enriched
+
+    ids = [p.get("id") for p in posts if p.get("id")]
+    if not newest_id and ids:
+        newest_id = max(ids, key=_post_key)
+    oldest_id = min(ids, key=_post_key, default=None)
+    # results come newest first: pages left unread hold posts older than oldest_id
+    truncated = bool(since_id and not complete and oldest_id)
+    if until_id:
+        if truncated:
+            until_id = oldest_id
+        else:
+            since_id, until_id, resume_id = resume_id, None, None
+    elif truncated:
+        until_id, resume_id = oldest_id, newest_id
+        print(f"[{datetime.now()}] News poller: {token} hit {POLL_MAX_PAGES} pages, reading the rest next poll.")
+    else:
+        since_id = newest_id or since_id
+
+    with _lock:
+        _windows[token] = {
+            "since_id": since_id,
+            "until_id": until_id,
+            "resume_id": resume_id,
+            "docs": docs,
+            "updated_at": now,
+        }
+    kept = {d["id"] for d in docs}
+    return sum(1 for d in fresh if d["id"] in kept)
+
+
+def latest_news(token: str, top_k: int = 6) -> Optional[List[Dict]]:
+    """
+    Freshest enriched top-k for a watched token, straight from memory.
+    Returns None when the token is not watched, has not been polled yet, or
+    more docs are asked for than the window keeps enriched (ENRICH_TOP).
+    """
+    if top_k > ENRICH_TOP:
+        return None
+    with _lock:
+        window = _windows.get(token.upper())
+        if not window:
+            return None
+        ranked = sorted(window["docs"], key=lambda d: d["score"], reverse=True)
+        return [dict(d["enriched"]) for d in ranked if d["enriched"]][:top_k]
+
+
+def get_news(token: str, top_k: int = 6) -> List[Dict]:
+    """Serve from the poller window when possible; otherwise (or for top_k > ENRICH_TOP) fetch live."""
+    cached = latest_news(token, top_k)
+    if cached:
+        return cached
+    return ingest_news(token, top_k=top_k)
+
+
+def get_news_batch(tokens: List[str], top_k: int = 6) -> Dict[str, List[Dict]]:
+    """Batch variant of get_news: watched tokens from memory, the rest in combined queries."""
+    tokens = list(dict.fromkeys(t.upper() for t in tokens if t and t.strip()))
+    results: Dict[str, List[Dict]] = {}
+    missing = []
+    for token in tokens:
+        cached = latest_news(token, top_k)
+        if cached:
+            results[token] = cached
+        else:
+            missing.append(token)
+    if missing:
+        results.update(ingest_news_batch(missing, top_k=top_k))
+    return {token: results.get(token, []) for token in tokens}
+
+
+def _run() -> None:
+    client = None
+    while not _stop.is_set():
+        for token in WATCHLIST:
+            if _stop.is_set():
+                break
+            try:
+                client = client or _x_client()
+                with llm_request(user="news-poller"):
+                    added = poll_token(token, client)
+                print(f"[{datetime.now()}] News poller: {token} +{added} docs.")
+            except Exception as e:
+                print(f"[{datetime.now()}] ERROR: News poller failed for {token}: {e}", file=sys.stderr)
+        _stop.wait(POLL_INTERVAL)
+
+
+def start_news_poller() -> bool:
+    """Start the daemon poller thread if a watchlist is configured."""
+    global _thread
+    if not WATCHLIST or (_thread and _thread.is_alive()):
+        return False
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name="news-poller", daemon=True)
+    _thread.start()
+    return True
+
+
+def stop_news_poller() -> None:
+    _stop.set()
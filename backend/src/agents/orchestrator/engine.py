@@ -0,0 +1,126 @@
+# src/agents/orchestrator/engine.py
+"""
+Async driver for streamed orchestration runs.
+
+The planner is synchronous (blocking LLM and tool calls), so each run executes
+on its own worker thread and hands events to the event loop through a bounded
+asyncio.Queue: a slow consumer fills the queue and the worker blocks before
+its next step (backpressure) instead of buffering the whole run.
+
+The consumer side emits a heartbeat whenever nothing happened for
+ORCH_HEARTBEAT_SECONDS and checks whether the client is still there. When it
+is gone (or the response task is cancelled), the run's cancel event is set:
+the planner stops at its next step, pending tool calls are cancelled and
+in-flight LLM calls, streams included, are abandoned by the gateway.
+
+Env:
+    ORCH_HEARTBEAT_SECONDS   idle time before a heartbeat event (default 10)
+    ORCH_STREAM_QUEUE_SIZE   events buffered per run before the planner waits (default 8)
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from src.agents.orchestrator.llm_planner import _planner_loop
+from src.llm.context import llm_request
+from src.llm.gateway import LLMCancelled
+from src.llm.scheduler import PLANNER
+
+HEARTBEAT_SECONDS = float(os.getenv("ORCH_HEARTBEAT_SECONDS", "10"))
+STREAM_QUEUE_SIZE = int(os.getenv("ORCH_STREAM_QUEUE_SIZE", "8"))
+PUT_POLL_SECONDS = 0.5
+
+_DONE = object()
+_run_stats = {"started": 0, "completed": 0, "cancelled": 0, "failed": 0, "heartbeats": 0, "active": 0}
+_run_lock = threading.Lock()
+
+
+def _count(field: str, delta: int = 1) -> None:
+    with _run_lock:
+        _run_stats[field] += delta
+
+
+def stream_stats() -> Dict[str, int]:
+    with _run_lock:
+        return dict(_run_stats)
+
+
+async def orchestration_events(
+    goal: str,
+    token: Optional[str],
+    user_id: Optional[str],
+    max_steps: int = 4,
+    stop_score: float = 0.55,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    deadline_s: Optional[float] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Planner events (step/final, plus heartbeat and error) for one run.
+    `is_disconnected` is typically `request.is_disconnected`; `deadline_s`
+    bounds the run end to end (see llm_request).
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    cancel = threading.Event()
+
+    def _put(item: Any) -> bool:
+        """Blocking put from the worker; False if the run was cancelled while waiting."""
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=PUT_POLL_SECONDS)
+                return True
+            except FutureTimeout:
+                if cancel.is_set():
+                    future.cancel()
+                    return False
+
+    def _worker() -> None:
+        outcome = "completed"
+        try:
+            with llm_request(user=user_id, priority=PLANNER, cancel=cancel, deadline_s=deadline_s):
+                for event in _planner_loop(goal, token, user_id, max_steps, stop_score):
+                    if cancel.is_set() or not _put(event):
+                        outcome = "cancelled"
+                        break
+        except LLMCancelled:
+            outcome = "cancelled"
+        except Exception as exc:
+            outcome = "failed"
+            print(f"[{datetime.now()}] ERROR: Orchestration run failed: {exc}", file=sys.stderr)
+            _put({"type": "error", "message": str(exc)})
+        finally:
+            _count(outcome)
+            _count("active", -1)
+            if not cancel.is_set():
+                _put(_DONE)
+
+    _count("started")
+    _count("active")
+    started = time.monotonic()
+    threading.Thread(target=_worker, name="orch-run", daemon=True).start()
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if is_disconnected is not None and await is_disconnected():
+                    break
+                _count("heartbeats")
+                yield {"type": "heartbeat", "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+                continue
+            if item is _DONE:
+                break
+            yield item
+            if item.get("type") == "final":
+                break
+            if is_disconnected is not None and await is_disconnected():
+                break
+    finally:
+        # client gone, response task cancelled or run finished: stop any remaining work
+        cancel.set()
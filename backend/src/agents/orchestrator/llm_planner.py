@@ -1,16 +1,29 @@
+import contextvars
+import hashlib
 import json
 import os
-from typing import Any, Dict, List, Tuple, Optional
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Deque, Dict, List, Tuple, Optional
 
-import requests
-
-from src.agents.news_agent.ingestion import ingest_news
+from src.agents.news_agent.poller import get_news
 from src.agents.analysis_agent.grok_reasoner import answer_with_grok
-from src.agents.behavioral_agent.behavioral_agent import (
-    fetch_transactions_for_user,
-    analyze_trading_style,
-    rank_coins_by_similarity,
+from src.agents.analysis_agent.retrieval import doc_set_key
+from src.agents.behavioral_agent.behavioral_agent import rank_coins_by_similarity
+from src.agents.behavioral_agent.persona_cache import get_persona
+from src.llm import gateway as llm_gateway
+from src.llm.context import (
+    cancelled as llm_cancelled,
+    expired as llm_expired,
+    llm_request,
+    time_left as llm_time_left,
 )
+from src.llm.json_stream import StreamingJSONParser
+from src.llm.scheduler import PLANNER
+from src.llm.tokenizer import count_tokens
 
 def _fallback_trade_plan(message: str, token: Optional[str]) -> Dict[str, Any]:
     return {
@@ -27,10 +40,13 @@ Available tools:
 2) reasoning_agent(question) -> Uses Grok with cached docs to answer financial questions.
 3) behavioral_agent(user_id) -> Reads user transaction history, summarizes persona and recommends tokens.
 When you have sufficient information, respond with action "final_answer".
+Tools that don't depend on each other (e.g. news_agent and behavioral_agent) can run
+in the same step: list them under "actions" instead of a single "action".
 Return JSON:
 {
   "action": "tool_name or final_answer",
   "params": {...},
+  "actions": [{"action": "news_agent", "params": {...}}, {"action": "behavioral_agent", "params": {...}}],
   "thought": "reasoning",
   "candidate_tools": [
      {"name":"news_agent","score":0.72,"reason":"..."},
@@ -41,31 +57,114 @@ Return JSON:
 Scores must be between 0 and 1.
 """
 
+VALID_TOOLS = {"news_agent", "reasoning_agent", "behavioral_agent"}
+# tools that read other tools' output (docs), so they run after the rest of their batch
+DEPENDENT_TOOLS = {"reasoning_agent"}
+TOOL_TIMEOUTS = {
+    "news_agent": float(os.getenv("ORCH_NEWS_TIMEOUT", "20")),
+    "behavioral_agent": float(os.getenv("ORCH_BEHAVIORAL_TIMEOUT", "60")),
+    "reasoning_agent": float(os.getenv("ORCH_REASONING_TIMEOUT", "60")),
+}
+MAX_PARALLEL_TOOLS = int(os.getenv("ORCH_MAX_PARALLEL_TOOLS", "4"))   # per run
+PREFETCH_WORKERS = 2   # per run, separate from the planner's own tool calls
+CANCEL_POLL_SECONDS = 0.25   # how often a waiting run checks whether it was cancelled
+PREFETCH_ENABLED = os.getenv("ORCH_PREFETCH", "1") != "0"
+FAST_PATH_ENABLED = os.getenv("ORCH_FAST_PATH", "1") != "0"
+DECISION_CACHE_TTL = float(os.getenv("ORCH_DECISION_CACHE_TTL", "600"))
+DECISION_CACHE_SIZE = 512
+DECISION_LATENCY_WINDOW = 200   # recent LLM decision calls behind the latency-saved estimate
+# how long a tool result is reused across runs (personas live in the persona cache instead)
+TOOL_CACHE_TTLS = {
+    "news_agent": float(os.getenv("ORCH_NEWS_CACHE_TTL", "300")),
+    "reasoning_agent": float(os.getenv("ORCH_REASONING_CACHE_TTL", "300")),
+}
+TOOL_CACHE_SIZE = int(os.getenv("ORCH_TOOL_CACHE_SIZE", "256"))
+
+_prefetch_stats = {"launched": 0, "adopted": 0, "cancelled": 0, "wasted": 0}
+_prefetch_lock = threading.Lock()
+# normalized (goal, token, user, state) -> (expires_at, planner decision)
+_decision_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_decision_stats = {
+    "runs": 0, "fast_path": 0, "cache": 0, "llm": 0,
+    "prompt_tokens": 0, "cached_prompt_tokens": 0, "latency_saved_ms": 0.0,
+}
+# wall time (ms) of recent LLM planner decisions, streams closed early included
+_decision_latencies: Deque[float] = deque(maxlen=DECISION_LATENCY_WINDOW)
+_decision_lock = threading.Lock()
+# (tool, normalized params) -> (expires_at, summary, patch)
+_tool_cache: "OrderedDict[Tuple, Tuple[float, str, Dict[str, Any]]]" = OrderedDict()
+_tool_cache_stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+_tool_cache_lock = threading.Lock()
+
+
+PLANNER_SYSTEM_PROMPT = (
+    "You are an orchestration planner. Decide which tool to run next. "
+    "Always respond with JSON: {\"action\": \"tool_name\", \"params\": {...}, \"thought\": \"...\"}, "
+    "or list independent tools to run together under \"actions\". "
+    "Valid actions: news_agent, reasoning_agent, behavioral_agent, final_answer.\n"
+    f"{TOOLS_DESCRIPTION}"
+)
+MAX_RESULT_CHARS = 400   # tool output echoed back into the planner conversation
+
+
+def _decision_ready(fields: Dict[str, Any]) -> bool:
+    """
+    True once a streamed tool decision has everything the loop uses: the
+    action, its params (or the `actions` batch) and the candidate scores, which
+    the schema puts after them. Final answers stream to the end for the message.
+    """
+    action = str(fields.get("action") or "").lower()
+    if not action or action == "final_answer":
+        return False
+    return ("params" in fields or "actions" in fields) and "candidate_tools" in fields
+
 
-def _call_grok(system_prompt: str, user_prompt: str, max_tokens: int = 400) -> str:
-    api_key = os.getenv("XAI_API_KEY")
-    if not api_key:
+def _call_grok(
+    messages: List[Dict[str, str]],
+    on_fields: Optional[Any] = None,
+    max_tokens: int = 400,
+) -> Dict[str, Any]:
+    """
+    One planner turn over the running conversation, streamed through the
+    incremental JSON parser. `on_fields(fields)` sees the top-level fields
+    completed so far after each delta (used to dispatch tools early), and the
+    stream is closed as soon as the decision is complete.
+    Returns {decision, content, usage, stopped_early}; `decision` is None if
+    the output couldn't be parsed even after repair.
+    """
+    if not llm_gateway.is_configured():
         raise RuntimeError("Missing XAI_API_KEY for orchestration.")
-    model = os.getenv("XAI_MODEL", "grok-3-mini")
-
-    resp = requests.post(
-        "https://api.x.ai/v1/chat/completions",
-        headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-        json={
-            "model": model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            "temperature": 0.2,
-            "max_tokens": max_tokens,
-        },
-        timeout=20,
+    parser = StreamingJSONParser()
+    meta: Dict[str, Any] = {}
+    stream = llm_gateway.stream_chat_completion(
+        messages,
+        temperature=0.2,
+        max_tokens=max_tokens,
+        tag="planner",
+        meta=meta,
+        priority=PLANNER,
     )
-    if resp.status_code != 200:
-        raise RuntimeError(f"Grok planner status {resp.status_code}: {resp.text}")
-    data = resp.json()
-    return (data.get("choices") or [{}])[0].get("message", {}).get("content", "") or ""
+    seen = 0
+    try:
+        for delta in stream:
+            fields = parser.feed(delta)
+            if on_fields is not None and len(fields) != seen:
+                seen = len(fields)
+                on_fields(fields)
+            if parser.done or _decision_ready(fields):
+                break
+    finally:
+        stream.close()   # stops generation if we broke out early
+    try:
+        decision = parser.result()
+    except ValueError:
+        decision = None
+    return {
+        "decision": decision,
+        "content": parser.buffer,
+        "usage": meta.get("usage") or {},
+        "stopped_early": bool(meta.get("stopped_early")),
+    }
 
 
 def _summarize_state(state: Dict[str, Any]) -> str:
@@ -81,64 +180,438 @@ def _summarize_state(state: Dict[str, Any]) -> str:
     return "\n".join(notes)
 
 
-def _execute_tool(
+def _opening_message(goal: str, token: Optional[str], user_id: Optional[str], state: Dict[str, Any]) -> str:
+    return (
+        f"User goal: {goal}\n"
+        f"Preferred token (optional): {token or 'unspecified'}\n"
+        f"User id (optional): {user_id or 'unspecified'}\n"
+        f"Current context:\n{_summarize_state(state)}\n\n"
+        "Respond with the next action."
+    )
+
+
+def _step_update(outcomes: List[Dict[str, Any]], before: str, state: Dict[str, Any]) -> str:
+    """Compact follow-up turn: each tool's result plus the context lines that changed."""
+    lines = ["Results:"]
+    for outcome in outcomes:
+        result = outcome["result"]
+        if len(result) > MAX_RESULT_CHARS:
+            result = result[:MAX_RESULT_CHARS].rsplit(" ", 1)[0] + "…"
+        lines.append(f"- {outcome['action']}: {result}")
+    old = set(before.splitlines())
+    changed = [line for line in _summarize_state(state).splitlines() if line not in old and line.startswith("- ")]
+    if changed:
+        lines.append("Context changes:")
+        lines.extend(changed)
+    lines.append("Respond with the next action.")
+    return "\n".join(lines)
+
+
+def _run_tool(
     name: str,
     params: Dict[str, Any],
     state: Dict[str, Any],
 ) -> Tuple[str, Dict[str, Any]]:
+    """
+    Run one tool against a read-only view of `state`. Returns (summary, patch);
+    the caller merges the patch, so tools in a batch can run concurrently.
+    """
     if name == "news_agent":
         token = params.get("token") or state.get("token")
         if not token:
-            return "news_agent requires a token parameter.", state
-        docs = ingest_news(token, top_k=params.get("top_k", 4))
-        state["token"] = token
-        state["docs"] = docs
-        return f"Fetched {len(docs)} docs for {token}.", state
+            return "news_agent requires a token parameter.", {}
+        docs = get_news(token, top_k=params.get("top_k", 4))
+        return f"Fetched {len(docs)} docs for {token}.", {"token": token, "docs": docs}
 
     if name == "reasoning_agent":
         question = params.get("question")
         docs = state.get("docs")
         if not question:
-            return "reasoning_agent requires a 'question' parameter.", state
+            return "reasoning_agent requires a 'question' parameter.", {}
         if not docs:
-            return "No cached docs to reason over. Run news_agent first.", state
+            return "No cached docs to reason over. Run news_agent first.", {}
         result = answer_with_grok(question=question, docs=docs)
-        state["analysis"] = result
-        return f"Answer: {result['answer']}", state
+        return f"Answer: {result['answer']}", {"analysis": result}
 
     if name == "behavioral_agent":
         user_id = params.get("user_id") or state.get("user_id")
         if not user_id:
-            return "behavioral_agent requires user_id.", state
-        resolved_user, txs = fetch_transactions_for_user(user_id)
-        if not txs:
-            return f"No transactions found for {resolved_user}.", state
-        style = analyze_trading_style(txs)
-        recs = rank_coins_by_similarity(style)
+            return "behavioral_agent requires user_id.", {}
+        cached = get_persona(user_id)
+        if cached is None:
+            return f"No transactions found for {user_id.upper()}.", {}
+        style = cached["analysis"]
+        recs = rank_coins_by_similarity(style, top_k=1)
         top = recs[0] if recs else {}
-        state["persona"] = {"summary": style, "top": top, "user_id": resolved_user}
-        return f"Persona summary generated. Top match: {top.get('symbol')} ({top.get('trader_type')}).", state
-
-    return f"Unknown tool '{name}'.", state
-
-
-def _parse_action(raw: str) -> Dict[str, Any]:
-    text = raw.strip()
-    if "```" in text:
-        # attempt to extract json block
-        start = text.find("```")
-        end = text.rfind("```")
-        if start != -1 and end != -1 and end > start:
-            text = text[start + 3 : end]
-            if text.strip().startswith("json"):
-                text = text[text.find("\n") + 1 :]
-    try:
-        data = json.loads(text)
-        if isinstance(data, dict):
-            return data
-    except json.JSONDecodeError:
-        pass
-    raise ValueError(f"Unable to parse planner response as JSON: {raw}")
+        persona = {
+            "summary": style,
+            "top": top,
+            "user_id": cached["user_id"],
+            "cached": cached["cached"],
+            "stale": cached["stale"],
+        }
+        return f"Persona summary generated. Top match: {top.get('symbol')} ({top.get('trader_type')}).", {"persona": persona}
+
+    return f"Unknown tool '{name}'.", {}
+
+
+# ------------ tool result cache ------------
+def _cache_key(name: str, params: Dict[str, Any], state: Dict[str, Any]) -> Optional[Tuple]:
+    """(tool, normalized params) for results that can be shared across runs, else None."""
+    if name not in TOOL_CACHE_TTLS:
+        return None
+    if name == "reasoning_agent":
+        question = re.sub(r"\s+", " ", str(params.get("question") or "").lower()).strip()
+        docs = state.get("docs") or []
+        if not question or not docs:
+            return None
+        return (name, question, doc_set_key([d.get("context", "") for d in docs]))
+    return _tool_key(name, params, state)
+
+
+def _execute_tool(
+    name: str,
+    params: Dict[str, Any],
+    state: Dict[str, Any],
+) -> Tuple[str, Dict[str, Any], bool]:
+    """
+    _run_tool behind a cross-run cache keyed on (tool, normalized params) with
+    per-tool TTLs. Returns (summary, patch, cached). Failed or empty results
+    (no patch) aren't stored. Personas come from the persona cache, which
+    tracks the user's trades itself.
+    """
+    key = _cache_key(name, params, state)
+    if key is None:
+        summary, patch = _run_tool(name, params, state)
+        return summary, patch, bool((patch.get("persona") or {}).get("cached"))
+    now = time.time()
+    with _tool_cache_lock:
+        entry = _tool_cache.get(key)
+        if entry is not None and entry[0] > now:
+            _tool_cache.move_to_end(key)
+            _tool_cache_stats["hits"] += 1
+            return entry[1], dict(entry[2]), True
+        if entry is not None:
+            del _tool_cache[key]
+            _tool_cache_stats["stale"] += 1
+        else:
+            _tool_cache_stats["misses"] += 1
+
+    summary, patch = _run_tool(name, params, state)
+    # a cancelled or out-of-time run may have produced a fallback instead of the real result
+    if patch and not llm_cancelled() and not llm_expired():
+        with _tool_cache_lock:
+            _tool_cache[key] = (now + TOOL_CACHE_TTLS[name], summary, dict(patch))
+            _tool_cache.move_to_end(key)
+            while len(_tool_cache) > TOOL_CACHE_SIZE:
+                _tool_cache.popitem(last=False)
+                _tool_cache_stats["evictions"] += 1
+    return summary, patch, False
+
+
+def tool_cache_stats() -> Dict[str, Any]:
+    with _tool_cache_lock:
+        stats = dict(_tool_cache_stats, size=len(_tool_cache), max_size=TOOL_CACHE_SIZE)
+    lookups = stats["hits"] + stats["misses"] + stats["stale"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+    stats["ttls"] = TOOL_CACHE_TTLS
+    return stats
+
+
+def _tool_key(name: str, params: Dict[str, Any], state: Dict[str, Any]) -> Optional[Tuple]:
+    """Identity of a tool call, used to match it against a speculative prefetch."""
+    if name == "news_agent":
+        token = params.get("token") or state.get("token")
+        return (name, token.upper(), params.get("top_k", 4)) if token else None
+    if name == "behavioral_agent":
+        user_id = params.get("user_id") or state.get("user_id")
+        return (name, user_id.upper()) if user_id else None
+    return None
+
+
+def _submit_tool(pool: ThreadPoolExecutor, name: str, params: Dict[str, Any], state: Dict[str, Any]) -> Future:
+    """
+    Run _execute_tool on `pool`. The returned future's `clock["started"]` is set
+    when a worker actually picks the call up, so time spent queued isn't
+    charged to the tool's timeout.
+    """
+    # copy_context per call so llm_request attribution reaches the worker threads
+    ctx = contextvars.copy_context()
+    clock: Dict[str, float] = {}
+
+    def _run() -> Tuple[str, Dict[str, Any], bool]:
+        clock["started"] = time.monotonic()
+        return ctx.run(_execute_tool, name, params, state)
+
+    future = pool.submit(_run)
+    future.clock = clock
+    return future
+
+
+class _Prefetch:
+    """
+    Tool calls started speculatively when a run begins (news for the run's
+    token, persona for its user) or as soon as a streamed planner decision
+    names them, on the run's own small pool so they never hold up the
+    planner's calls. A matching planner request adopts the future if it is
+    already running (or done); one still queued is cancelled and run directly
+    instead. Whatever is left when the run ends is cancelled if it hasn't
+    started, otherwise it is counted as waste (its result still lands in the
+    tool cache for later runs).
+    """
+
+    def __init__(self) -> None:
+        self._futures: Dict[Tuple, Future] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.launched = self.adopted = self.cancelled = self.wasted = 0
+
+    def _submit(self, key: Tuple, name: str, params: Dict[str, Any], state: Dict[str, Any]) -> None:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="orch-prefetch")
+        self._futures[key] = _submit_tool(self._pool, name, params, state)
+        self.launched += 1
+
+    def start(self, token: Optional[str], user_id: Optional[str]) -> None:
+        seed = {"token": token, "user_id": user_id}
+        for name in ("news_agent", "behavioral_agent"):
+            key = _tool_key(name, {}, seed)
+            if key is not None:
+                self._submit(key, name, {}, seed)
+
+    def launch(self, name: str, params: Dict[str, Any], state: Dict[str, Any]) -> None:
+        """Start a call the planner is still streaming its decision for."""
+        key = _tool_key(name, params, state)
+        if key is not None and key not in self._futures:
+            self._submit(key, name, params, state)
+
+    def take(self, key: Optional[Tuple]) -> Optional[Future]:
+        future = self._futures.pop(key, None) if key else None
+        if future is None:
+            return None
+        if future.cancel():   # still queued behind other prefetches: the caller runs it itself
+            self.cancelled += 1
+            return None
+        self.adopted += 1
+        return future
+
+    def finish(self) -> Dict[str, int]:
+        """Settle leftovers and add this run to the global stats (only once); returns the run's counts."""
+        for future in self._futures.values():
+            if future.cancel():
+                self.cancelled += 1
+            else:
+                self.wasted += 1
+        self._futures.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)   # running calls finish on their own and fill the tool cache
+            self._pool = None
+        run = {"launched": self.launched, "adopted": self.adopted, "cancelled": self.cancelled, "wasted": self.wasted}
+        with _prefetch_lock:
+            for field, count in run.items():
+                _prefetch_stats[field] += count
+        self.launched = self.adopted = self.cancelled = self.wasted = 0
+        return run
+
+
+def prefetch_stats() -> Dict[str, Any]:
+    """Totals across runs: how often speculative tool calls were used vs. thrown away."""
+    with _prefetch_lock:
+        stats = dict(_prefetch_stats)
+    launched = stats["launched"]
+    stats["hit_rate"] = round(stats["adopted"] / launched, 3) if launched else None
+    stats["waste_rate"] = round(stats["wasted"] / launched, 3) if launched else None
+    stats["enabled"] = PREFETCH_ENABLED
+    return stats
+
+
+def _requested_actions(action_obj: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Tool calls asked for in this step: the `actions` batch if given, else the single `action`."""
+    batch = action_obj.get("actions")
+    if not isinstance(batch, list) or not batch:
+        batch = [{"action": action_obj.get("action"), "params": action_obj.get("params")}]
+    actions: List[Tuple[str, Dict[str, Any]]] = []
+    for item in batch:
+        if not isinstance(item, dict):
+            continue
+        name = (item.get("action") or item.get("name") or "").lower()
+        params = item.get("params") if isinstance(item.get("params"), dict) else {}
+        if name and (name, params) not in actions:
+            actions.append((name, params))
+    return actions
+
+
+def _await_tool(future: Future, timeout: float, budget_deadline: float) -> Tuple[str, Dict[str, Any], bool]:
+    """
+    future.result() within `timeout` seconds of the call starting (time queued
+    doesn't count) and before `budget_deadline`, giving up early if the run is
+    cancelled. A call that never started is cancelled when the wait ends.
+    """
+    while True:
+        if llm_cancelled():
+            future.cancel()
+            raise llm_gateway.LLMCancelled("Orchestration run cancelled.")
+        started = future.clock.get("started")
+        deadline = budget_deadline if started is None else min(started + timeout, budget_deadline)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            future.cancel()
+            raise FutureTimeout()
+        try:
+            return future.result(timeout=min(remaining, CANCEL_POLL_SECONDS))
+        except FutureTimeout:
+            continue
+
+
+def _run_actions(
+    actions: List[Tuple[str, Dict[str, Any]]],
+    state: Dict[str, Any],
+    prefetch: Optional[_Prefetch] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Execute a batch of tool calls: independent tools concurrently, then the
+    ones that read their output, on a pool owned by this run (at most
+    MAX_PARALLEL_TOOLS), so other runs can't queue ahead of them. Each call gets
+    its own timeout, counted from when it starts and capped by the request
+    deadline; calls already running as a prefetch are adopted instead of
+    started again.
+    Patches are merged into `state`; returns one
+    {action, params, result, elapsed_ms, prefetched, cached} per call.
+    """
+    independent = [a for a in actions if a[0] not in DEPENDENT_TOOLS]
+    dependent = [a for a in actions if a[0] in DEPENDENT_TOOLS]
+    outcomes: List[Dict[str, Any]] = []
+    for phase in (independent, dependent):
+        if not phase:
+            continue
+        snapshot = dict(state)
+        started = time.monotonic()
+        budget = llm_time_left(float("inf"))   # what's left of the request deadline
+        pool = ThreadPoolExecutor(max_workers=min(len(phase), MAX_PARALLEL_TOOLS), thread_name_prefix="orch-tool")
+        futures = []
+        try:
+            for name, params in phase:
+                future = prefetch.take(_tool_key(name, params, snapshot)) if prefetch else None
+                adopted = future is not None
+                if future is None:
+                    future = _submit_tool(pool, name, params, snapshot)
+                futures.append((name, params, future, adopted))
+            for name, params, future, adopted in futures:
+                timeout = min(TOOL_TIMEOUTS.get(name, 30.0), budget)
+                cached = False
+                try:
+                    summary, patch, cached = _await_tool(future, timeout, started + budget)
+                    state.update(patch)
+                except FutureTimeout:
+                    summary = f"{name} timed out after {timeout:.1f}s."
+                except llm_gateway.LLMCancelled:
+                    raise
+                except Exception as exc:
+                    summary = f"{name} failed: {exc}"
+                outcomes.append({
+                    "action": name,
+                    "params": params,
+                    "result": summary,
+                    "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+                    "prefetched": adopted,
+                    "cached": cached,
+                })
+        finally:
+            for _, _, pending, _ in futures:
+                pending.cancel()   # no-op for calls that finished or are running
+            pool.shutdown(wait=False)   # a timed-out call keeps only this run's worker until it returns
+    return outcomes
+
+
+# ------------ planner decisions ------------
+def _fast_path(goal: str, state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Deterministic decision for the predictable transitions: fetch news for the
+    token and the persona for the user if they're missing, then answer the
+    goal over the docs. Returns None (ask the LLM) for anything else, including
+    the final synthesis and retries of a tool that already ran.
+    """
+    ran = {s.get("action") for s in state["steps"]}
+    actions = []
+    if state.get("token") and not state.get("docs") and "news_agent" not in ran:
+        actions.append({"action": "news_agent", "params": {"token": state["token"]}})
+    if state.get("user_id") and not state.get("persona") and "behavioral_agent" not in ran:
+        actions.append({"action": "behavioral_agent", "params": {"user_id": state["user_id"]}})
+    will_have_docs = state.get("docs") or any(a["action"] == "news_agent" for a in actions)
+    if will_have_docs and not state.get("analysis") and "reasoning_agent" not in ran:
+        actions.append({"action": "reasoning_agent", "params": {"question": goal}})
+    if not actions:
+        return None
+    names = ", ".join(a["action"] for a in actions)
+    return {
+        "action": actions[0]["action"],
+        "actions": actions,
+        "thought": f"Fast path: {names}.",
+        "candidate_tools": [{"name": a["action"], "score": 1.0, "reason": "fast path"} for a in actions],
+    }
+
+
+def _decision_key(goal: str, token: Optional[str], user_id: Optional[str], state: Dict[str, Any]) -> str:
+    ran = sorted({s.get("action") or "" for s in state["steps"]})
+    raw = json.dumps([
+        re.sub(r"\s+", " ", goal.lower()).strip(),
+        (token or "").upper(),
+        (user_id or "").upper(),
+        _summarize_state(state),
+        ran,
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _cached_decision(key: str) -> Optional[Dict[str, Any]]:
+    with _decision_lock:
+        entry = _decision_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del _decision_cache[key]
+            return None
+        _decision_cache.move_to_end(key)
+        return entry[1]
+
+
+def _store_decision(key: str, decision: Dict[str, Any]) -> None:
+    # final answers carry text built from this run's results, so only tool choices are reused
+    if (decision.get("action") or "").lower() == "final_answer":
+        return
+    with _decision_lock:
+        _decision_cache[key] = (time.time() + DECISION_CACHE_TTL, decision)
+        _decision_cache.move_to_end(key)
+        while len(_decision_cache) > DECISION_CACHE_SIZE:
+            _decision_cache.popitem(last=False)
+
+
+def _decision_summary(counts: Dict[str, int]) -> Dict[str, Any]:
+    """
+    Per-run decision sources and planner prompt tokens, with the saved LLM time
+    estimated from the median of recent LLM decisions as the planner actually
+    makes them (streams closed as soon as the decision is complete, not the
+    gateway's planner p50, which only sees calls that ran to the end).
+    """
+    total = counts["fast_path"] + counts["cache"] + counts["llm"]
+    avoided = counts["fast_path"] + counts["cache"]
+    with _decision_lock:
+        recent = sorted(_decision_latencies)
+    p50 = recent[len(recent) // 2] if recent else None
+    return {
+        **counts,
+        "fast_path_ratio": round(avoided / total, 3) if total else None,
+        "latency_saved_ms": round(avoided * p50, 1) if p50 is not None else None,
+    }
+
+
+def planner_decision_stats() -> Dict[str, Any]:
+    with _decision_lock:
+        stats = dict(_decision_stats, cache_size=len(_decision_cache))
+    total = stats["fast_path"] + stats["cache"] + stats["llm"]
+    stats["fast_path_ratio"] = round((stats["fast_path"] + stats["cache"]) / total, 3) if total else None
+    stats["latency_saved_ms"] = round(stats["latency_saved_ms"], 1)
+    stats["fast_path_enabled"] = FAST_PATH_ENABLED
+    return stats
 
 
 def _planner_loop(
@@ -148,6 +621,45 @@ def _planner_loop(
     max_steps: int,
     stop_score: float,
 ):
+    """Planner steps with news/persona prefetched from the start; reports prefetch use on the final event."""
+    prefetch = _Prefetch()
+    decisions = {"fast_path": 0, "cache": 0, "llm": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0}
+    if PREFETCH_ENABLED:
+        with llm_request(user=user_id, priority=PLANNER):
+            prefetch.start(token, user_id)
+    try:
+        for event in _planner_steps(goal, token, user_id, max_steps, stop_score, prefetch, decisions):
+            if event["type"] == "final":
+                event["prefetch"] = prefetch.finish()
+                event["planner"] = _decision_summary(decisions)
+                with _decision_lock:
+                    _decision_stats["runs"] += 1
+                    for field, count in decisions.items():
+                        _decision_stats[field] += count
+                    _decision_stats["latency_saved_ms"] += event["planner"]["latency_saved_ms"] or 0.0
+            yield event
+    finally:
+        prefetch.finish()   # run abandoned (client gone) or failed
+
+
+def _planner_steps(
+    goal: str,
+    token: Optional[str],
+    user_id: Optional[str],
+    max_steps: int,
+    stop_score: float,
+    prefetch: Optional[_Prefetch] = None,
+    decisions: Optional[Dict[str, int]] = None,
+):
+    """
+    The planner keeps one conversation per run: a constant system prompt
+    (instructions + tool list), the opening goal/context turn, then per step
+    its own decision and a compact results/diff turn. Earlier turns are never
+    rewritten, so each call shares its prefix with the previous one.
+    """
+    decisions = decisions if decisions is not None else {
+        "fast_path": 0, "cache": 0, "llm": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0,
+    }
     state: Dict[str, Any] = {
         "token": token,
         "user_id": user_id,
@@ -156,29 +668,80 @@ def _planner_loop(
         "persona": None,
         "steps": [],
     }
-
-    system_prompt = (
-        "You are an orchestration planner. Decide which tool to run next. "
-        "Always respond with JSON: {\"action\": \"tool_name\", \"params\": {...}, \"thought\": \"...\"}. "
-        "Valid actions: news_agent, reasoning_agent, behavioral_agent, final_answer."
-    )
+    messages: List[Dict[str, str]] = [
+        {"role": "system", "content": PLANNER_SYSTEM_PROMPT},
+        {"role": "user", "content": _opening_message(goal, token, user_id, state)},
+    ]
+    sent_tokens = 0   # prompt tokens already seen by the planner (the shared prefix)
+    out_of_time = False   # the request deadline ended the run; answer with what we have
 
     for step in range(max_steps):
-        context = _summarize_state(state)
-        user_prompt = (
-            f"User goal: {goal}\n"
-            f"Preferred token (optional): {token or 'unspecified'}\n"
-            f"User id (optional): {user_id or 'unspecified'}\n"
-            f"Current context:\n{context}\n\n"
-            f"{TOOLS_DESCRIPTION}\n"
-            "Respond with the next action."
-        )
-        raw = _call_grok(system_prompt, user_prompt)
-        try:
-            action_obj = _parse_action(raw)
-        except ValueError as exc:
-            state["steps"].append({"action": "error", "thought": str(exc), "result": raw})
+        if llm_cancelled():
+            raise llm_gateway.LLMCancelled("Orchestration run cancelled.")
+        if llm_expired():
+            out_of_time = True
             break
+        decision_key = _decision_key(goal, token, user_id, state)
+        action_obj = _fast_path(goal, state) if FAST_PATH_ENABLED else None
+        source = "fast_path"
+        planner_tokens: Dict[str, Any] = {}
+        if action_obj is None:
+            action_obj, source = _cached_decision(decision_key), "cache"
+        if action_obj is None:
+            source = "llm"
+            snapshot = dict(state)
+
+            def _dispatch_early(fields: Dict[str, Any]) -> None:
+                # tools start while the rest of the decision (thought, scores) is still streaming
+                if prefetch is None or not ("params" in fields or "actions" in fields):
+                    return
+                for name, params in _requested_actions(fields):
+                    if name in VALID_TOOLS:
+                        prefetch.launch(name, params, snapshot)
+
+            for attempt in range(2):
+                call_started = time.perf_counter()
+                try:
+                    with llm_request(user=user_id, priority=PLANNER):
+                        reply = _call_grok(messages, on_fields=_dispatch_early)
+                except llm_gateway.DeadlineExceeded:
+                    out_of_time = True
+                    break
+                except llm_gateway.CircuitOpen:
+                    break   # xAI is failing fast; answer from what the tools produced
+                with _decision_lock:
+                    _decision_latencies.append((time.perf_counter() - call_started) * 1000)
+                usage = reply["usage"]
+                prompt_tokens = int(usage.get("prompt_tokens") or 0) or sum(count_tokens(m["content"]) for m in messages)
+                planner_tokens = {
+                    "prompt": prompt_tokens,
+                    "new": max(0, prompt_tokens - sent_tokens),
+                    "cached": llm_gateway.cached_prompt_tokens(usage),
+                    "completion": int(usage.get("completion_tokens") or 0) or count_tokens(reply["content"]),
+                }
+                if reply["stopped_early"]:
+                    planner_tokens["stopped_early"] = True
+                sent_tokens = prompt_tokens
+                decisions["prompt_tokens"] += prompt_tokens
+                decisions["cached_prompt_tokens"] += planner_tokens["cached"]
+                action_obj = reply["decision"]
+                if action_obj is not None:
+                    break
+                state["steps"].append({
+                    "action": "error",
+                    "thought": "Unable to parse planner response as JSON.",
+                    "result": reply["content"],
+                })
+                if attempt == 0:
+                    messages.append({"role": "assistant", "content": reply["content"]})
+                    messages.append({"role": "user", "content": "That was not valid JSON. Reply with the JSON object only."})
+            if action_obj is None:
+                break   # unparseable twice or out of time
+            _store_decision(decision_key, action_obj)
+        # the planner sees its decision as parsed (streams may stop early or be repaired),
+        # and rule/cached decisions as its own, so the conversation stays coherent
+        messages.append({"role": "assistant", "content": json.dumps(action_obj, separators=(",", ":"))})
+        decisions[source] += 1
 
         candidate_tools = action_obj.get("candidate_tools") or []
         best_score = 0.0
@@ -191,9 +754,14 @@ def _planner_loop(
                 except (TypeError, ValueError):
                     continue
 
+        actions = _requested_actions(action_obj)
+        tool_actions = [a for a in actions if a[0] in VALID_TOOLS]
         action = (action_obj.get("action") or "").lower()
+        if tool_actions and action not in VALID_TOOLS | {"final_answer"}:
+            action = tool_actions[0][0]
+        elif not tool_actions and actions:
+            action = actions[0][0]
         thought = action_obj.get("thought", "")
-        params = action_obj.get("params") or {}
 
         if best_score < stop_score and action not in {"final_answer"}:
             action = "final_answer"
@@ -204,7 +772,7 @@ def _planner_loop(
             trade_plan = action_obj.get("trade_plan")
             if not isinstance(trade_plan, dict):
                 trade_plan = _fallback_trade_plan(message, token)
-            yield {
+            final_event = {
                 "type": "final",
                 "goal": goal,
                 "final_answer": message,
@@ -214,28 +782,48 @@ def _planner_loop(
                     "persona": state.get("persona"),
                 },
             }
+            if planner_tokens:
+                final_event["planner_tokens"] = planner_tokens
+            yield final_event
             return
 
-        result_summary, state = _execute_tool(action, params, state)
-        step_entry = {
-            "step": step + 1,
-            "action": action,
-            "thought": thought,
-            "result": result_summary,
-        }
-        if candidate_tools:
-            step_entry["candidate_tools"] = candidate_tools
-        step_entry["score"] = best_score
-        state["steps"].append(step_entry)
-        yield {"type": "step", "data": step_entry}
+        before = _summarize_state(state)
+        # tool LLM calls (reasoning, persona) queue in the planner class for this user
+        with llm_request(user=user_id, priority=PLANNER):
+            outcomes = _run_actions(tool_actions or actions[:1] or [(action, {})], state, prefetch)
+        messages.append({"role": "user", "content": _step_update(outcomes, before, state)})
+        for outcome in outcomes:
+            step_entry = {
+                "step": step + 1,
+                "action": outcome["action"],
+                "thought": thought,
+                "result": outcome["result"],
+                "elapsed_ms": outcome["elapsed_ms"],
+            }
+            if len(outcomes) > 1:
+                step_entry["parallel"] = len(outcomes)
+            if outcome["prefetched"]:
+                step_entry["prefetched"] = True
+            if outcome["cached"]:
+                step_entry["cached"] = True
+            step_entry["decided_by"] = source
+            if planner_tokens:
+                step_entry["planner_tokens"] = planner_tokens
+            if candidate_tools:
+                step_entry["candidate_tools"] = candidate_tools
+            step_entry["score"] = best_score
+            state["steps"].append(step_entry)
+            yield {"type": "step", "data": step_entry}
 
     final_answer = (
         state.get("analysis", {}).get("answer")
         if state.get("analysis")
+        else "Plan ran out of time before reaching an answer."
+        if out_of_time
         else "Plan ended without a final answer."
     )
     fallback_plan = _fallback_trade_plan(final_answer, token)
-    yield {
+    final_event = {
         "type": "final",
         "goal": goal,
         "final_answer": final_answer,
@@ -245,6 +833,9 @@ def _planner_loop(
             "persona": state.get("persona"),
         },
     }
+    if out_of_time:
+        final_event["deadline_exceeded"] = True
+    yield final_event
 
 
 def run_orchestration(
@@ -253,15 +844,18 @@ def run_orchestration(
     user_id: Optional[str],
     max_steps: int = 4,
     stop_score: float = 0.55,
+    deadline_s: Optional[float] = None,
 ) -> Dict[str, Any]:
+    """Whole run; `deadline_s` bounds it end to end (planner, tools and every LLM call)."""
     final_payload: Dict[str, Any] | None = None
     steps: List[Dict[str, Any]] = []
-    for event in _planner_loop(goal, token, user_id, max_steps, stop_score):
-        if event["type"] == "step":
-            steps.append(event["data"])
-        elif event["type"] == "final":
-            final_payload = event
-            break
+    with llm_request(deadline_s=deadline_s):
+        for event in _planner_loop(goal, token, user_id, max_steps, stop_score):
+            if event["type"] == "step":
+                steps.append(event["data"])
+            elif event["type"] == "final":
+                final_payload = event
+                break
     if not final_payload:
         raise RuntimeError("Planner failed to produce a final answer.")
     final_payload["steps"] = steps
@@ -272,14 +866,3 @@ def run_orchestration(
         )
     return final_payload
 
-
-def orchestration_stream(
-    goal: str,
-    token: Optional[str],
-    user_id: Optional[str],
-    max_steps: int = 4,
-    stop_score: float = 0.55,
-):
-    yield json.dumps({"type": "status", "message": "Planner started."}) + "\n"
-    for event in _planner_loop(goal, token, user_id, max_steps, stop_score):
-        yield json.dumps(event) + "\n"
@@ -1,10 +1,8 @@
-import os
 import json
-from typing import Dict
-from xai_sdk import Client
-from xai_sdk.chat import system, user
-from dotenv import load_dotenv
-load_dotenv()
+from typing import Dict, List
+
+from src.llm import gateway as llm_gateway
+from src.llm.scheduler import ENRICHMENT
 
 class Emotion(str):
     POSITIVE = "positive"
@@ -15,40 +13,74 @@ class Emotion(str):
 
 def sentiment_analysis(text: str) -> Dict[str, float]:
     """
-    Perform sentiment analysis using Grok via xAI SDK.
+    Perform sentiment analysis using Grok via the shared LLM gateway.
     Env vars required:
         XAI_API_KEY   - your xAI API key
         XAI_MODEL     - optional, default "grok-3-mini"
     Returns:
         {'positive': float, 'negative': float, 'neutral': float}
     """
-    api_key = os.getenv("XAI_API_KEY")
-    model   = os.getenv("XAI_MODEL", "grok-3-mini")
-
-    if not api_key:
+    if not llm_gateway.is_configured():
         raise RuntimeError("Missing XAI_API_KEY in environment.")
 
-    client = Client(api_key=api_key)
-    chat = client.chat.create(model=model)
-
-    chat.append(system(
+    response = llm_gateway.complete(
         "You are an emotion classifier. "
         "Output valid JSON in the format: "
-        '{"positive": float, "negative": float, "neutral": float}'
-    ))
-    chat.append(user(f"Text: {text}"))
-
-    response = chat.sample().content.strip()
+        '{"positive": float, "negative": float, "neutral": float}',
+        f"Text: {text}",
+        temperature=0.0,
+        max_tokens=60,
+        tag="sentiment",
+        priority=ENRICHMENT,
+    ).strip()
 
     # Safe JSON parsing
     try:
-        data = json.loads(response)
-        # Ensure all emotions exist, fill missing with 0
-        return {k: float(data.get(k, 0.0)) for k in Emotion.Emotions}
+        return _normalize(json.loads(response))
     except Exception:
         return {"positive": 0.0, "negative": 0.0, "neutral": 0.0}
 
 
+def _normalize(data: Dict) -> Dict[str, float]:
+    # Ensure all emotions exist, fill missing with 0
+    return {k: float(data.get(k, 0.0)) for k in Emotion.Emotions}
+
+
+def sentiment_analysis_batch(texts: List[str]) -> List[Dict[str, float]]:
+    """
+    Classify several texts with a single Grok call.
+    Returns one {'positive', 'negative', 'neutral'} dict per input, in order.
+    Falls back to per-text calls if the batched reply can't be aligned.
+    """
+    if not texts:
+        return []
+    if len(texts) == 1:
+        return [sentiment_analysis(texts[0])]
+
+    if not llm_gateway.is_configured():
+        raise RuntimeError("Missing XAI_API_KEY in environment.")
+
+    numbered = "\n".join(f"{i}. {t}" for i, t in enumerate(texts, start=1))
+    response = llm_gateway.complete(
+        "You are an emotion classifier. You receive numbered texts. "
+        "Output a valid JSON array with exactly one object per text, in the same order, each in the format: "
+        '{"positive": float, "negative": float, "neutral": float}',
+        f"Texts:\n{numbered}",
+        temperature=0.0,
+        max_tokens=40 * len(texts) + 20,
+        tag="sentiment",
+        priority=ENRICHMENT,
+    ).strip()
+
+    try:
+        data = json.loads(response)
+        if isinstance(data, list) and len(data) == len(texts):
+            return [_normalize(d if isinstance(d, dict) else {}) for d in data]
+    except Exception:
+        pass
+    return [sentiment_analysis(t) for t in texts]
+
+
 def __main__():
     sample_text = "I love using this new AI tool! It's fantastic."
     result = sentiment_analysis(sample_text)
@@ -0,0 +1,154 @@
+# src/llm/breaker.py
+"""
+Circuit breaker in front of the xAI endpoint.
+
+Every network attempt reports its outcome. When, over the last
+LLM_BREAKER_WINDOW seconds, at least LLM_BREAKER_MIN_CALLS attempts were seen
+and either the error rate or the share of slow calls (>= LLM_BREAKER_SLOW_MS)
+passes its threshold, the breaker opens: calls fail fast (the gateway raises
+CircuitOpen, an LLMError, so agents take their offline fallbacks) instead of
+each one waiting out a full timeout. After LLM_BREAKER_COOLDOWN seconds one
+probe call is let through (half-open); success closes the breaker, failure
+re-opens it for another cooldown.
+
+Env:
+    LLM_BREAKER_ENABLED      0 disables the breaker (default 1)
+    LLM_BREAKER_WINDOW       rolling window in seconds (default 60)
+    LLM_BREAKER_MIN_CALLS    attempts needed before it can trip (default 10)
+    LLM_BREAKER_ERROR_RATE   error share that trips it (default 0.5)
+    LLM_BREAKER_SLOW_MS      latency counted as slow (default 12000)
+    LLM_BREAKER_SLOW_RATE    slow share that trips it (default 0.6)
+    LLM_BREAKER_COOLDOWN     seconds open before a probe (default 30)
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        window: float = 60.0,
+        min_calls: int = 10,
+        error_rate: float = 0.5,
+        slow_ms: float = 12000.0,
+        slow_rate: float = 0.6,
+        cooldown: float = 30.0,
+        enabled: bool = True,
+    ):
+        self.window = window
+        self.min_calls = max(1, min_calls)
+        self.error_rate = error_rate
+        self.slow_ms = slow_ms
+        self.slow_rate = slow_rate
+        self.cooldown = cooldown
+        self.enabled = enabled
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_at: Optional[float] = None   # when the in-flight half-open probe started
+        self._events: Deque[Tuple[float, bool, bool]] = deque()   # (time, ok, slow)
+        self._lock = threading.Lock()
+        self._stats = {"opened": 0, "rejected": 0, "probes": 0, "last_reason": None}
+
+    def _prune(self, now: float) -> None:
+        while self._events and self._events[0][0] < now - self.window:
+            self._events.popleft()
+
+    def allow(self) -> Tuple[bool, Optional[float]]:
+        """
+        (may a call go out now?, probe id if it is the half-open probe). Only
+        one probe is in flight at a time; pass its id back to record().
+        """
+        if not self.enabled:
+            return True, None
+        now = time.monotonic()
+        with self._lock:
+            if self._state == OPEN and now - self._opened_at >= self.cooldown:
+                self._state = HALF_OPEN
+            if self._state == CLOSED:
+                return True, None
+            if self._state == HALF_OPEN and (self._probe_at is None or now - self._probe_at >= self.cooldown):
+                self._probe_at = now   # a probe that never reports back is replaced after a cooldown
+                self._stats["probes"] += 1
+                return True, now
+            self._stats["rejected"] += 1
+            return False, None
+
+    def is_open(self) -> bool:
+        """Open and still cooling down (does not claim a probe, unlike allow())."""
+        with self._lock:
+            return self.enabled and self._state == OPEN and time.monotonic() - self._opened_at < self.cooldown
+
+    def record(self, ok: bool, latency_ms: Optional[float] = None, probe: Optional[float] = None) -> None:
+        """
+        Outcome of one network attempt (ok = the endpoint answered, whatever the
+        content). Only the claimed probe (`probe` from allow()) closes or
+        re-opens a half-open breaker; calls started before the trip don't.
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        slow = latency_ms is not None and latency_ms >= self.slow_ms
+        with self._lock:
+            if self._state == HALF_OPEN and probe is not None and probe == self._probe_at:
+                self._probe_at = None
+                if ok and not slow:
+                    self._state = CLOSED
+                    self._events.clear()
+                else:
+                    self._trip(now, "probe failed" if not ok else "probe slow")
+                return
+            self._events.append((now, ok, slow))
+            self._prune(now)
+            if self._state != CLOSED or len(self._events) < self.min_calls:
+                return
+            total = len(self._events)
+            errors = sum(1 for _, good, _ in self._events if not good)
+            slows = sum(1 for _, _, was_slow in self._events if was_slow)
+            if errors / total >= self.error_rate:
+                self._trip(now, f"error rate {errors}/{total}")
+            elif slows / total >= self.slow_rate:
+                self._trip(now, f"slow calls {slows}/{total}")
+
+    def _trip(self, now: float, reason: str) -> None:
+        self._state = OPEN
+        self._opened_at = now
+        self._stats["opened"] += 1
+        self._stats["last_reason"] = reason
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            total = len(self._events)
+            errors = sum(1 for _, ok, _ in self._events if not ok)
+            slows = sum(1 for _, _, slow in self._events if slow)
+            state = self._state
+            if state == OPEN and now - self._opened_at >= self.cooldown:
+                state = HALF_OPEN
+            return dict(
+                self._stats,
+                enabled=self.enabled,
+                state=state,
+                window_calls=total,
+                error_rate=round(errors / total, 3) if total else None,
+                slow_rate=round(slows / total, 3) if total else None,
+                open_for_s=round(max(0.0, self.cooldown - (now - self._opened_at)), 1) if state == OPEN else 0.0,
+            )
+
+
+breaker = CircuitBreaker(
+    window=float(os.getenv("LLM_BREAKER_WINDOW", "60")),
+    min_calls=int(os.getenv("LLM_BREAKER_MIN_CALLS", "10")),
+    error_rate=float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5")),
+    slow_ms=float(os.getenv("LLM_BREAKER_SLOW_MS", "12000")),
+    slow_rate=float(os.getenv("LLM_BREAKER_SLOW_RATE", "0.6")),
+    cooldown=float(os.getenv("LLM_BREAKER_COOLDOWN", "30")),
+    enabled=os.getenv("LLM_BREAKER_ENABLED", "1") != "0",
+)
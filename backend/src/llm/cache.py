@@ -0,0 +1,113 @@
+# src/llm/cache.py
+"""
+Exact-match response cache for LLM completions.
+
+Keyed on a hash of (model, messages, max_tokens). Entries live in a size-bound
+in-memory LRU with a TTL; when LLM_CACHE_PATH is set, they are also written to
+a SQLite file so they survive restarts and are shared between workers; expired
+disk rows are purged at most once every PURGE_INTERVAL seconds.
+
+Env:
+    LLM_CACHE_MAX_ENTRIES   in-memory entries (default 512)
+    LLM_CACHE_TTL           seconds an answer stays valid (default 900)
+    LLM_CACHE_PATH          optional SQLite file for the disk tier
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+PURGE_INTERVAL = 60.0
+
+
+def cache_key(model: str, messages: List[Dict[str, str]], max_tokens: int) -> str:
+    raw = json.dumps([model, messages, max_tokens], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 512, ttl: float = 900, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._mem: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+        self._purged_at = 0.0
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, expires_at REAL, value TEXT)"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires ON llm_cache (expires_at)")
+            self._disk.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._mem.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._mem[key]
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT expires_at, value FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[0] > now:
+                    value = json.loads(row[1])
+                    self._put_mem(key, row[0], value)
+                    self._stats["disk_hits"] += 1
+                    return value
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._put_mem(key, expires_at, value)
+            self._stats["writes"] += 1
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, expires_at, value) VALUES (?, ?, ?)",
+                    (key, expires_at, json.dumps(value, ensure_ascii=False)),
+                )
+                now = time.time()
+                if now - self._purged_at >= PURGE_INTERVAL:
+                    self._disk.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+                    self._purged_at = now
+                self._disk.commit()
+
+    def _put_mem(self, key: str, expires_at: float, value: Any) -> None:
+        self._mem[key] = (expires_at, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            hit_rate = (self._stats["hits"] + self._stats["disk_hits"]) / lookups if lookups else None
+            return dict(
+                self._stats,
+                size=len(self._mem),
+                max_entries=self.max_entries,
+                ttl=self.ttl,
+                disk=self._disk is not None,
+                hit_rate=round(hit_rate, 3) if hit_rate is not None else None,
+            )
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")),
+    ttl=float(os.getenv("LLM_CACHE_TTL", "900")),
+    disk_path=os.getenv("LLM_CACHE_PATH") or None,
+)
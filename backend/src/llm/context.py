@@ -0,0 +1,89 @@
+# src/llm/context.py
+"""
+Request-scoped attributes for LLM calls (who is asking, at which priority,
+whether the caller has gone away and how much time the request has left).
+
+Routers open a scope with `llm_request(...)`; the gateway reads it so agents
+don't have to thread these values through every call. Scopes must not span a
+`yield` of a generator that Starlette iterates in a threadpool — pass values
+explicitly there instead.
+
+A `cancel` event set on the scope makes the gateway abandon calls made inside
+it (before admission, between retries and mid-stream). Nested scopes add
+their event to the outer ones: setting any of them cancels the call.
+
+`deadline_s` bounds the whole request: every hop sizes its timeout with
+`time_left(default)` and the gateway refuses calls once it has passed, so
+callers fall back instead of overrunning. Nested scopes can only tighten it.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional, Tuple
+
+_user: ContextVar[Optional[str]] = ContextVar("llm_user", default=None)
+_priority: ContextVar[Optional[int]] = ContextVar("llm_priority", default=None)
+_cancel: ContextVar[Tuple[threading.Event, ...]] = ContextVar("llm_cancel", default=())
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)   # time.monotonic()
+
+
+@contextmanager
+def llm_request(
+    user: Optional[str] = None,
+    priority: Optional[int] = None,
+    cancel: Optional[threading.Event] = None,
+    deadline_s: Optional[float] = None,
+) -> Iterator[None]:
+    """
+    Attribute LLM calls made inside the block to `user` at `priority`,
+    cancellable via `cancel` and due within `deadline_s` seconds.
+    """
+    user_token = _user.set(user) if user is not None else None
+    prio_token = _priority.set(priority) if priority is not None else None
+    cancel_token = _cancel.set(_cancel.get() + (cancel,)) if cancel is not None else None
+    deadline_token = None
+    if deadline_s is not None:
+        due = time.monotonic() + deadline_s
+        current = _deadline.get()
+        deadline_token = _deadline.set(due if current is None else min(current, due))
+    try:
+        yield
+    finally:
+        if deadline_token is not None:
+            _deadline.reset(deadline_token)
+        if cancel_token is not None:
+            _cancel.reset(cancel_token)
+        if prio_token is not None:
+            _priority.reset(prio_token)
+        if user_token is not None:
+            _user.reset(user_token)
+
+
+def current_user() -> Optional[str]:
+    return _user.get()
+
+
+def current_priority() -> Optional[int]:
+    return _priority.get()
+
+
+def cancelled() -> bool:
+    return any(event.is_set() for event in _cancel.get())
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the request's deadline (negative once passed), or None without one."""
+    due = _deadline.get()
+    return None if due is None else due - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def time_left(default: float) -> float:
+    """`default` capped by the remaining deadline budget (never negative)."""
+    left = remaining()
+    return default if left is None else max(0.0, min(default, left))
@@ -0,0 +1,627 @@
+# src/llm/gateway.py
+"""
+Single entry point for xAI chat completions.
+
+One pooled keep-alive HTTP client (HTTP/2 when `h2` is installed) shared by
+every agent, uniform timeouts, retry with jittered backoff on 429/5xx and
+per-tag latency / token-usage accounting. Callers that opt in with
+`cache=True` are served from the exact-match response cache (src.llm.cache).
+Every network call is admitted by the priority scheduler (src.llm.scheduler);
+user and default priority come from the request scope (src.llm.context).
+A circuit breaker (src.llm.breaker) fails calls fast while xAI is erroring or
+slow. Latency-critical callers can pass `hedge=True`: if no answer arrived
+within the tag's recent p95, a second identical request is sent, the first
+response wins and the other one is abandoned.
+
+Env:
+    XAI_API_KEY       required for remote calls
+    XAI_MODEL         default model (default: grok-3-mini)
+    XAI_BASE_URL      default: https://api.x.ai/v1
+    LLM_TIMEOUT       default per-call timeout in seconds (default 20)
+    LLM_MAX_RETRIES   retries on 429/5xx/transport errors (default 2)
+    LLM_HEDGE_PERCENTILE    latency percentile that triggers the hedge (default 95)
+    LLM_HEDGE_MIN_SAMPLES   latency samples a tag needs before hedging (default 20)
+"""
+import json
+import os
+import random
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from src.llm import context as llm_context
+from src.llm.breaker import breaker
+from src.llm.cache import cache_key, response_cache
+from src.llm.scheduler import INTERACTIVE, QueueTimeout, scheduler
+from src.llm.tokenizer import tokenizer_info
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_ENABLED = True
+except ImportError:
+    HTTP2_ENABLED = False
+
+load_dotenv()
+XAI_BASE_URL = os.getenv("XAI_BASE_URL", "https://api.x.ai/v1")
+DEFAULT_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+LATENCY_WINDOW = 200
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_POLL_S = 0.1   # how often a hedged call checks the caller's scope while waiting
+# what reading a 200 body that isn't the expected JSON can raise
+MALFORMED_BODY = (ValueError, AttributeError, IndexError, TypeError)
+
+
+class LLMError(RuntimeError):
+    """Raised when a completion can't be produced; callers fall back on it."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class LLMCancelled(LLMError):
+    """The llm_request scope was cancelled (e.g. the client disconnected)."""
+
+
+class DeadlineExceeded(LLMError):
+    """The llm_request scope's deadline passed before the call could finish."""
+
+
+class CircuitOpen(LLMError):
+    """The circuit breaker is open: xAI is failing or slow, so the call fails fast."""
+
+
+def _check_breaker(attempt: int) -> Optional[float]:
+    """Fail fast while the breaker is open; returns the probe id if this call is the half-open probe."""
+    # the first attempt may be the half-open probe; retries only stop if the breaker opened meanwhile
+    allowed, probe = (not breaker.is_open(), None) if attempt else breaker.allow()
+    if not allowed:
+        raise CircuitOpen("xAI circuit breaker is open; failing fast.")
+    return probe
+
+
+def _check_scope() -> None:
+    if llm_context.cancelled():
+        raise LLMCancelled("LLM call cancelled: the request was abandoned.")
+    if llm_context.expired():
+        raise DeadlineExceeded("LLM call skipped: the request deadline has passed.")
+
+
+def _sleep_before_retry(delay: float) -> bool:
+    """Back off unless that would run past the deadline; False means stop retrying."""
+    left = llm_context.remaining()
+    if left is not None and delay >= left:
+        return False
+    time.sleep(delay)
+    return True
+
+
+def api_key() -> Optional[str]:
+    return os.getenv("XAI_API_KEY")
+
+
+def is_configured() -> bool:
+    return bool(api_key())
+
+
+def available() -> bool:
+    """Configured and not failing fast: callers with an offline answer should use it otherwise."""
+    return is_configured() and not breaker.is_open()
+
+
+def default_model() -> str:
+    return os.getenv("XAI_MODEL", "grok-3-mini")
+
+
+# ------------ pooled client ------------
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+
+def _http() -> httpx.Client:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    base_url=XAI_BASE_URL,
+                    http2=HTTP2_ENABLED,
+                    timeout=DEFAULT_TIMEOUT,
+                    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=90),
+                )
+    return _client
+
+
+def close() -> None:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+# ------------ metrics ------------
+_stats: Dict[str, Dict[str, Any]] = {}
+_stats_lock = threading.Lock()
+# tag -> {"calls", "hedged", "hedge_wins"}
+_hedge_stats: Dict[str, Dict[str, int]] = {}
+# both attempts of a hedged call run here; a loser holds its thread until its next check
+_hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+
+def cached_prompt_tokens(usage: Optional[Dict]) -> int:
+    """Prompt tokens the provider served from its prefix cache (0 if not reported)."""
+    details = (usage or {}).get("prompt_tokens_details") or {}
+    return int(details.get("cached_tokens") or 0)
+
+
+def _record(
+    tag: str,
+    latency_ms: float,
+    usage: Optional[Dict] = None,
+    error: bool = False,
+    retries: int = 0,
+    stopped_early: bool = False,
+) -> None:
+    with _stats_lock:
+        s = _stats.setdefault(tag, {
+            "calls": 0,
+            "errors": 0,
+            "retries": 0,
+            "prompt_tokens": 0,
+            "cached_prompt_tokens": 0,
+            "completion_tokens": 0,
+            "stopped_early": 0,
+            "latency_ms_total": 0.0,
+            "latencies": deque(maxlen=LATENCY_WINDOW),
+        })
+        s["calls"] += 1
+        s["retries"] += retries
+        s["latency_ms_total"] += latency_ms
+        if error:
+            s["errors"] += 1
+            return
+        if stopped_early:
+            s["stopped_early"] += 1   # partial latency; kept out of the percentiles
+            return
+        s["latencies"].append(latency_ms)
+        usage = usage or {}
+        s["prompt_tokens"] += int(usage.get("prompt_tokens") or 0)
+        s["cached_prompt_tokens"] += cached_prompt_tokens(usage)
+        s["completion_tokens"] += int(usage.get("completion_tokens") or 0)
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return round(ordered[idx], 1)
+
+
+def latency_percentile(tag: str, pct: float) -> Optional[float]:
+    """Recent successful-call latency percentile (ms) for a tag, or None."""
+    with _stats_lock:
+        s = _stats.get(tag)
+        values = list(s["latencies"]) if s else []
+    return _percentile(values, pct)
+
+
+def _hedge_delay(tag: str) -> Optional[float]:
+    """Seconds to wait before hedging a call for `tag`, or None (too few samples, breaker not closed)."""
+    with _stats_lock:
+        s = _stats.get(tag)
+        values = list(s["latencies"]) if s else []
+    if len(values) < HEDGE_MIN_SAMPLES or breaker.is_open():
+        return None
+    return _percentile(values, HEDGE_PERCENTILE) / 1000.0
+
+
+def _hedged(call, tag: str) -> Dict[str, Any]:
+    """
+    Run `call` (a cancellable chat completion) on the hedge pool; if it hasn't
+    returned within the tag's latency percentile, start an identical backup
+    and return whichever answers first. Each attempt runs under its own
+    cancel event, so the loser is abandoned at its next check (queue,
+    backoff or stream line) while the caller moves on. A failure only wins
+    if the other attempt fails too.
+    """
+    delay = _hedge_delay(tag)
+    with _stats_lock:
+        h = _hedge_stats.setdefault(tag, {"calls": 0, "hedged": 0, "hedge_wins": 0})
+        h["calls"] += 1
+    if delay is None:
+        return call()
+
+    def attempt(cancel: threading.Event) -> Dict[str, Any]:
+        with llm_context.llm_request(cancel=cancel):
+            return call()
+
+    cancels: Dict[Future, threading.Event] = {}
+
+    def start() -> Future:
+        cancel = threading.Event()
+        # copy_context so user/priority/deadline/cancel reach the pool thread
+        future = _hedge_pool.submit(contextvars.copy_context().run, attempt, cancel)
+        cancels[future] = cancel
+        return future
+
+    primary = start()
+    backup: Optional[Future] = None
+    pending = {primary}
+    hedge_at = time.monotonic() + delay
+    failure: Optional[LLMError] = None
+    try:
+        while pending:
+            poll = HEDGE_POLL_S if backup else min(HEDGE_POLL_S, max(0.0, hedge_at - time.monotonic()))
+            done, pending = wait(pending, timeout=poll, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except LLMError as exc:
+                    failure = failure or exc
+                    continue
+                if future is backup:
+                    with _stats_lock:
+                        h["hedge_wins"] += 1
+                return result
+            _check_scope()   # a stalled attempt doesn't see the caller's cancel or deadline
+            if backup is None and pending and time.monotonic() >= hedge_at:
+                with _stats_lock:
+                    h["hedged"] += 1
+                backup = start()
+                pending.add(backup)
+    finally:
+        for cancel in cancels.values():
+            cancel.set()   # a running loser stops at its next check; its answer is dropped
+    raise failure
+
+
+def hedge_stats() -> Dict[str, Any]:
+    """Per tag: calls that could hedge, how many did, and how often the backup answered first."""
+    with _stats_lock:
+        snapshot = {tag: dict(h) for tag, h in _hedge_stats.items()}
+    for h in snapshot.values():
+        h["hedge_rate"] = round(h["hedged"] / h["calls"], 3) if h["calls"] else None
+        h["hedge_win_rate"] = round(h["hedge_wins"] / h["hedged"], 3) if h["hedged"] else None
+    return snapshot
+
+
+def get_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        snapshot = {tag: dict(s, latencies=list(s["latencies"])) for tag, s in _stats.items()}
+    out = {}
+    for tag, s in snapshot.items():
+        lat = s.pop("latencies")
+        calls = s["calls"]
+        s["avg_latency_ms"] = round(s.pop("latency_ms_total") / calls, 1) if calls else None
+        s["p50_latency_ms"] = _percentile(lat, 50)
+        s["p95_latency_ms"] = _percentile(lat, 95)
+        out[tag] = s
+    return {
+        "http2": HTTP2_ENABLED,
+        "tags": out,
+        "cache": response_cache.stats(),
+        "scheduler": scheduler.stats(),
+        "tokenizer": tokenizer_info(),
+        "breaker": breaker.stats(),
+        "hedging": hedge_stats(),
+    }
+
+
+# ------------ completions ------------
+def _admission(messages: List[Dict[str, str]], max_tokens: int, priority: Optional[int], user: Optional[str]):
+    """Scheduler slot for this call; prompt size is estimated at ~4 chars/token."""
+    if priority is None:
+        priority = llm_context.current_priority()
+    est_tokens = sum(len(m.get("content") or "") for m in messages) // 4 + max_tokens
+    return scheduler.slot(
+        priority=INTERACTIVE if priority is None else priority,
+        user=user or llm_context.current_user(),
+        est_tokens=est_tokens,
+        timeout=llm_context.time_left(scheduler.queue_timeout),
+    )
+
+
+def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+    if retry_after:
+        try:
+            return min(float(retry_after), 10.0)
+        except ValueError:
+            pass
+    return min(8.0, 0.5 * (2 ** attempt)) * (0.5 + random.random() / 2)
+
+
+def chat_completion(
+    messages: List[Dict[str, str]],
+    *,
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    max_tokens: int = 400,
+    timeout: Optional[float] = None,
+    tag: str = "default",
+    cache: bool = False,
+    priority: Optional[int] = None,
+    user: Optional[str] = None,
+    hedge: bool = False,
+    cache_if: Optional[Callable[[str], bool]] = None,
+) -> Dict[str, Any]:
+    """
+    Run one chat completion.
+    `priority` / `user` default to the current llm_request scope.
+    `hedge=True` streams the call and sends a backup request if it is slower than the tag's p95.
+    `cache_if` decides whether a fresh answer may be cached (e.g. only if it parses).
+    Returns: {"content": str, "usage": {...}, "latency_ms": float, "queue_ms": float, "model": str, "cached": bool}
+    Raises LLMError when the key is missing, the queue wait times out or all attempts fail
+    (DeadlineExceeded / LLMCancelled when the llm_request scope runs out of time or is cancelled).
+    Timeouts, queue wait included, are capped by the scope's remaining deadline.
+    """
+    key = api_key()
+    if not key:
+        raise LLMError("Missing XAI_API_KEY in environment.")
+    model = model or default_model()
+    if hedge:
+        # streamed, so whichever attempt loses can be abandoned mid-answer
+        return _hedged(
+            lambda: _collect_stream(
+                messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout,
+                tag=tag,
+                cache=cache,
+                priority=priority,
+                user=user,
+                cache_if=cache_if,
+            ),
+            tag,
+        )
+
+    ckey = cache_key(model, messages, max_tokens) if cache else None
+    if ckey:
+        started = time.perf_counter()
+        hit = response_cache.get(ckey)
+        if hit is not None:
+            latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            return {
+                "content": hit,
+                "usage": {},
+                "latency_ms": latency_ms,
+                "queue_ms": 0.0,
+                "model": model,
+                "cached": True,
+            }
+
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    headers = {"Authorization": f"Bearer {key}", "Content-Type": "application/json"}
+
+    _check_scope()
+    probe = _check_breaker(0)
+    try:
+        with _admission(messages, max_tokens, priority, user) as ticket:
+            started = time.perf_counter()
+            last_error: Optional[LLMError] = None
+            for attempt in range(MAX_RETRIES + 1):
+                _check_scope()   # also covers the time spent queued and backing off
+                if attempt:
+                    _check_breaker(attempt)
+                retry_after = None
+                attempt_started = time.perf_counter()
+                try:
+                    resp = _http().post(
+                        "/chat/completions", json=payload, headers=headers, timeout=llm_context.time_left(timeout or DEFAULT_TIMEOUT)
+                    )
+                except httpx.HTTPError as exc:
+                    breaker.record(False, probe=probe)
+                    last_error = LLMError(f"xAI request failed: {exc}")
+                else:
+                    # 4xx other than 429 is our request's fault, not the endpoint's
+                    breaker.record(
+                        resp.status_code not in RETRY_STATUSES, (time.perf_counter() - attempt_started) * 1000, probe=probe
+                    )
+                    if resp.status_code == 200:
+                        try:
+                            data = resp.json()
+                            content = (data.get("choices") or [{}])[0].get("message", {}).get("content", "") or ""
+                            usage = data.get("usage") or {}
+                        except MALFORMED_BODY as exc:
+                            _record(tag, (time.perf_counter() - started) * 1000, error=True, retries=attempt)
+                            raise LLMError(f"xAI returned a malformed response: {exc}") from exc
+                        ticket["actual_tokens"] = usage.get("total_tokens")
+                        latency_ms = (time.perf_counter() - started) * 1000
+                        _record(tag, latency_ms, usage=usage, retries=attempt)
+                        if ckey and content and (cache_if is None or cache_if(content)):
+                            response_cache.set(ckey, content)
+                        return {
+                            "content": content,
+                            "usage": usage,
+                            "latency_ms": round(latency_ms, 1),
+                            "queue_ms": ticket["queue_ms"],
+                            "model": model,
+                            "cached": False,
+                        }
+                    last_error = LLMError(f"xAI status {resp.status_code}: {resp.text}", status=resp.status_code)
+                    if resp.status_code not in RETRY_STATUSES:
+                        break
+                    retry_after = resp.headers.get("retry-after")
+                if attempt < MAX_RETRIES and not _sleep_before_retry(_backoff(attempt, retry_after)):
+                    break
+    except QueueTimeout as exc:
+        if llm_context.expired():
+            raise DeadlineExceeded(f"{exc} (request deadline)") from exc
+        raise LLMError(str(exc)) from exc
+
+    _record(tag, (time.perf_counter() - started) * 1000, error=True, retries=attempt)
+    raise last_error
+
+
+def stream_chat_completion(
+    messages: List[Dict[str, str]],
+    *,
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    max_tokens: int = 400,
+    timeout: Optional[float] = None,
+    tag: str = "default",
+    cache: bool = False,
+    meta: Optional[Dict[str, Any]] = None,
+    priority: Optional[int] = None,
+    user: Optional[str] = None,
+    cache_if: Optional[Callable[[str], bool]] = None,
+) -> Iterator[str]:
+    """
+    Stream a chat completion, yielding content deltas as the model produces them.
+    Retries (same policy as chat_completion) only happen before the first byte.
+    If `meta` is given it is filled with {"cached", "usage", "latency_ms",
+    "first_token_ms", "queue_ms", "model"} once the stream ends. The scheduler
+    slot is held until the stream finishes.
+    Closing the generator early (the caller has what it needs) aborts the HTTP
+    stream, so the provider stops generating; meta then has "stopped_early".
+    A cancelled llm_request scope raises LLMCancelled, mid-stream included.
+    A cache hit yields the whole answer as a single delta; `cache_if` works
+    as in chat_completion.
+    """
+    key = api_key()
+    if not key:
+        raise LLMError("Missing XAI_API_KEY in environment.")
+    model = model or default_model()
+    meta = meta if meta is not None else {}
+    meta.update({"cached": False, "usage": {}, "model": model})
+
+    ckey = cache_key(model, messages, max_tokens) if cache else None
+    if ckey:
+        hit = response_cache.get(ckey)
+        if hit is not None:
+            meta.update({"cached": True, "latency_ms": 0.0, "first_token_ms": 0.0})
+            yield hit
+            return
+
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    headers = {"Authorization": f"Bearer {key}", "Content-Type": "application/json"}
+
+    _check_scope()
+    probe = _check_breaker(0)
+    try:
+        with _admission(messages, max_tokens, priority, user) as ticket:
+            meta["queue_ms"] = ticket["queue_ms"]
+            started = time.perf_counter()
+            last_error: Optional[LLMError] = None
+            for attempt in range(MAX_RETRIES + 1):
+                _check_scope()
+                if attempt:
+                    _check_breaker(attempt)
+                retry_after = None
+                attempt_started = time.perf_counter()
+                try:
+                    with _http().stream(
+                        "POST", "/chat/completions", json=payload, headers=headers, timeout=llm_context.time_left(timeout or DEFAULT_TIMEOUT)
+                    ) as resp:
+                        # time to response headers is what the breaker watches for streams
+                        breaker.record(
+                            resp.status_code not in RETRY_STATUSES, (time.perf_counter() - attempt_started) * 1000, probe=probe
+                        )
+                        if resp.status_code == 200:
+                            parts: List[str] = []
+                            usage: Dict[str, Any] = {}
+                            for line in resp.iter_lines():
+                                # leaving the `with` aborts the HTTP stream, so generation stops
+                                _check_scope()
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    break
+                                try:
+                                    chunk = json.loads(data)
+                                    usage = chunk.get("usage") or usage
+                                    delta = ((chunk.get("choices") or [{}])[0].get("delta") or {}).get("content") or ""
+                                except MALFORMED_BODY as exc:
+                                    _record(tag, (time.perf_counter() - started) * 1000, error=True, retries=attempt)
+                                    raise LLMError(f"xAI sent a malformed stream chunk: {exc}") from exc
+                                if not delta:
+                                    continue
+                                if not parts:
+                                    meta["first_token_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                                parts.append(delta)
+                                try:
+                                    yield delta
+                                except GeneratorExit:
+                                    latency_ms = (time.perf_counter() - started) * 1000
+                                    _record(tag, latency_ms, retries=attempt, stopped_early=True)
+                                    meta.update({"latency_ms": round(latency_ms, 1), "stopped_early": True})
+                                    raise
+                            ticket["actual_tokens"] = usage.get("total_tokens")
+                            latency_ms = (time.perf_counter() - started) * 1000
+                            _record(tag, latency_ms, usage=usage, retries=attempt)
+                            meta.update({"usage": usage, "latency_ms": round(latency_ms, 1)})
+                            content = "".join(parts)
+                            if ckey and content and (cache_if is None or cache_if(content)):
+                                response_cache.set(ckey, content)
+                            return
+                        resp.read()
+                        last_error = LLMError(f"xAI status {resp.status_code}: {resp.text}", status=resp.status_code)
+                        retry_after = resp.headers.get("retry-after")
+                        retryable = resp.status_code in RETRY_STATUSES
+                except httpx.HTTPError as exc:
+                    breaker.record(False, probe=probe)
+                    if meta.get("first_token_ms") is not None:
+                        _record(tag, (time.perf_counter() - started) * 1000, error=True, retries=attempt)
+                        raise LLMError(f"xAI stream interrupted: {exc}") from exc
+                    last_error = LLMError(f"xAI request failed: {exc}")
+                    retryable = True
+                if not retryable:
+                    break
+                if attempt < MAX_RETRIES and not _sleep_before_retry(_backoff(attempt, retry_after)):
+                    break
+    except QueueTimeout as exc:
+        if llm_context.expired():
+            raise DeadlineExceeded(f"{exc} (request deadline)") from exc
+        raise LLMError(str(exc)) from exc
+
+    _record(tag, (time.perf_counter() - started) * 1000, error=True, retries=attempt)
+    raise last_error
+
+
+def _collect_stream(messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+    """A streamed completion returned in chat_completion's shape."""
+    meta: Dict[str, Any] = {}
+    content = "".join(stream_chat_completion(messages, meta=meta, **kwargs))
+    return {
+        "content": content,
+        "usage": meta["usage"],
+        "latency_ms": meta.get("latency_ms", 0.0),
+        "queue_ms": meta.get("queue_ms", 0.0),
+        "model": meta["model"],
+        "cached": meta["cached"],
+    }
+
+
+def complete(system_prompt: str, user_prompt: str, **kwargs) -> str:
+    """System + user prompt convenience wrapper; returns the message content."""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+    return chat_completion(messages, **kwargs)["content"]
@@ -0,0 +1,221 @@
+# src/llm/json_stream.py
+"""
+Incremental, forgiving JSON parsing for model outputs.
+
+StreamingJSONParser is fed completion deltas as they arrive and exposes each
+top-level field of the object as soon as its value is complete, so callers can
+act on (or stop generating after) the fields they need. Leading prose and
+```json fences are skipped.
+
+repair_json / parse_json_object handle a finished (or cut-off) completion:
+fences, trailing commas and unclosed brackets. A value cut off by the
+truncation is dropped rather than closed, so `"amount": 12` never stands in
+for `"amount": 125`; callers still validate what they act on.
+"""
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+FENCE_RE = re.compile(r"```(?:json)?", re.IGNORECASE)
+
+
+def _strip_trailing_commas(text: str) -> str:
+    """Drop commas directly before a closing bracket, leaving string contents alone."""
+    out: List[str] = []
+    in_string = escape = False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+        out.append(ch)
+    return "".join(out)
+
+
+def _close_open(text: str) -> str:
+    """
+    Close a truncated document. The innermost member is dropped if it was cut
+    off (an unterminated string, a number or literal that may be missing
+    characters, a key without a value), then open arrays/objects are closed.
+    """
+    # per open container: [closer, start of its current member, member complete, after the colon]
+    stack: List[list] = []
+    in_string = escape = scalar = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                if stack and (stack[-1][0] == "]" or stack[-1][3]):
+                    stack[-1][2] = True   # a string value (not a key) ended
+            continue
+        if scalar and (ch.isspace() or ch in ",]}"):
+            scalar = False
+            stack[-1][2] = True
+        if ch.isspace():
+            continue
+        top = stack[-1] if stack else None
+        if top is not None and top[1] is None and ch not in ",]}":
+            top[1], top[2] = i, False   # a member starts
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(["}" if ch == "{" else "]", None, True, False])
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if stack:
+                stack[-1][2] = True   # the container was the parent's value
+        elif ch == ",":
+            if top is not None:
+                top[1:] = [None, True, False]
+        elif ch == ":":
+            if top is not None:
+                top[3] = True
+        elif top is not None:
+            scalar = True
+    out = text
+    if stack and not stack[-1][2] and stack[-1][1] is not None:
+        out = text[: stack[-1][1]]
+    out = out.rstrip().rstrip(",").rstrip()
+    return out + "".join(entry[0] for entry in reversed(stack))
+
+
+def repair_json(text: str) -> str:
+    """Best-effort cleanup of model JSON: fences, leading prose, trailing commas, truncation."""
+    cleaned = FENCE_RE.sub("", text or "").strip()
+    start = cleaned.find("{")
+    if start == -1:
+        return cleaned
+    cleaned = cleaned[start:]
+    end = cleaned.rfind("}")
+    closed = _strip_trailing_commas(cleaned[: end + 1])
+    try:
+        json.loads(closed)
+        return closed
+    except ValueError:
+        return _strip_trailing_commas(_close_open(cleaned))
+
+
+def _json_span(text: str) -> str:
+    """Text from the first "{" to the last "}", fences removed."""
+    cleaned = FENCE_RE.sub("", text or "").strip()
+    return cleaned[cleaned.find("{") : cleaned.rfind("}") + 1]
+
+
+def parse_json_object(text: str, strict: bool = False) -> Dict[str, Any]:
+    """
+    Parse a model's JSON object, repairing it if needed; with `strict`, only
+    fences and surrounding prose are tolerated. Raises ValueError if that fails.
+    """
+    candidates = (text.strip(), _json_span(text)) if strict else (text.strip(), repair_json(text))
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            return data
+    raise ValueError(f"Unable to parse model output as a JSON object: {text[:200]}")
+
+
+class StreamingJSONParser:
+    """
+    Feed text chunks of a JSON object; `fields` holds every top-level key whose
+    value has been fully received (parsed), `done` flips when the object closes.
+    Work is linear in the input: each character is scanned once.
+    """
+
+    def __init__(self) -> None:
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._key: Optional[str] = None
+        self._expect_key = True
+        self._value_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        self.buffer += chunk
+        buf = self.buffer
+        while self._pos < len(buf) and not self.done:
+            ch = buf[self._pos]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                self._pos += 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key and self._value_start is None:
+                        self._key = json.loads(buf[self._string_start : self._pos + 1])
+                self._pos += 1
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._close_value(self._pos)
+                    self.done = True
+            elif self._depth == 1:
+                if ch == ":" and self._key is not None:
+                    self._expect_key = False
+                    self._value_start = self._pos + 1
+                elif ch == ",":
+                    self._close_value(self._pos)
+            self._pos += 1
+        return self.fields
+
+    def _close_value(self, end: int) -> None:
+        if self._key is not None and self._value_start is not None:
+            raw = self.buffer[self._value_start : end].strip()
+            try:
+                self.fields[self._key] = json.loads(raw)
+            except ValueError:
+                try:
+                    self.fields[self._key] = json.loads(_strip_trailing_commas(raw))
+                except ValueError:
+                    pass   # malformed value; the final repair pass may still recover it
+        self._key = None
+        self._value_start = None
+        self._expect_key = True
+
+    def has(self, keys: Iterable[str]) -> bool:
+        return all(k in self.fields for k in keys)
+
+    def result(self) -> Dict[str, Any]:
+        """Whole object: the strict parse if it closed cleanly, else repaired, else the fields seen so far."""
+        try:
+            return {**parse_json_object(self.buffer), **self.fields}
+        except ValueError:
+            if self.fields:
+                return dict(self.fields)
+            raise
@@ -0,0 +1,170 @@
+# src/llm/scheduler.py
+"""
+Admission control in front of every xAI call.
+
+Calls wait in one queue per priority class (interactive > planner > enrichment).
+Inside a class, users are served round-robin so one user's burst can't starve
+another. A call is admitted when it is at the head of the highest non-empty
+class and both the global concurrency limit and the tokens-per-minute budget
+allow it. Queue time is recorded per class.
+
+Agent code runs on FastAPI's threadpool, so this is a thread-based scheduler
+(condition variable) rather than an asyncio one.
+
+Env:
+    LLM_MAX_CONCURRENCY     max in-flight calls (default 8)
+    LLM_TOKENS_PER_MINUTE   token budget per minute, 0 = unlimited (default 0)
+    LLM_QUEUE_TIMEOUT       max seconds a call may wait (default 30)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+INTERACTIVE = 0
+PLANNER = 1
+ENRICHMENT = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", PLANNER: "planner", ENRICHMENT: "enrichment"}
+
+ANONYMOUS = "anonymous"
+
+
+class QueueTimeout(TimeoutError):
+    pass
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int = 8, tokens_per_minute: int = 0, queue_timeout: float = 30.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.tokens_per_minute = max(0, tokens_per_minute)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        # priority -> user -> FIFO of tickets; OrderedDict order is the round-robin order
+        self._queues: List["OrderedDict[str, Deque[Dict]]"] = [OrderedDict() for _ in PRIORITY_NAMES]
+        self._tokens = float(self.tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._metrics = {
+            p: {"admitted": 0, "timeouts": 0, "queue_ms_total": 0.0, "queue_ms": deque(maxlen=200)}
+            for p in PRIORITY_NAMES
+        }
+
+    # ---- token bucket ----
+    def _refill(self) -> None:
+        if not self.tokens_per_minute:
+            return
+        now = time.monotonic()
+        rate = self.tokens_per_minute / 60.0
+        self._tokens = min(float(self.tokens_per_minute), self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def _budget_wait(self, need: int) -> float:
+        """Seconds until `need` tokens are available (0 when they already are)."""
+        if not self.tokens_per_minute:
+            return 0.0
+        need = min(need, self.tokens_per_minute)
+        if self._tokens >= need:
+            return 0.0
+        return (need - self._tokens) / (self.tokens_per_minute / 60.0)
+
+    # ---- queueing ----
+    def _head(self) -> Optional[Dict]:
+        for queue in self._queues:
+            for tickets in queue.values():
+                if tickets:
+                    return tickets[0]
+        return None
+
+    def _dequeue(self, ticket: Dict) -> None:
+        queue = self._queues[ticket["priority"]]
+        tickets = queue[ticket["user"]]
+        tickets.remove(ticket)
+        if tickets:
+            queue.move_to_end(ticket["user"])   # next turn goes to another user
+        else:
+            del queue[ticket["user"]]
+
+    @contextmanager
+    def slot(
+        self,
+        priority: int = INTERACTIVE,
+        user: Optional[str] = None,
+        est_tokens: int = 0,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Block until the call may run. Yields a ticket; set ticket["actual_tokens"]
+        before leaving so the budget is reconciled with real usage.
+        """
+        priority = priority if priority in PRIORITY_NAMES else INTERACTIVE
+        ticket = {"priority": priority, "user": user or ANONYMOUS, "est_tokens": est_tokens, "actual_tokens": None}
+        enqueued = time.monotonic()
+        deadline = enqueued + (self.queue_timeout if timeout is None else timeout)
+        with self._cond:
+            self._queues[priority].setdefault(ticket["user"], deque()).append(ticket)
+            while True:
+                self._refill()
+                wait = None
+                if self._head() is ticket and self._active < self.max_concurrency:
+                    wait = self._budget_wait(est_tokens)
+                    if wait == 0.0:
+                        break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._dequeue(ticket)
+                    self._metrics[priority]["timeouts"] += 1
+                    self._cond.notify_all()
+                    raise QueueTimeout(f"LLM queue wait exceeded for {PRIORITY_NAMES[priority]} call.")
+                self._cond.wait(timeout=min(remaining, wait) if wait else remaining)
+            self._dequeue(ticket)
+            self._active += 1
+            if self.tokens_per_minute:
+                self._tokens -= min(est_tokens, self.tokens_per_minute)
+            queue_ms = (time.monotonic() - enqueued) * 1000
+            m = self._metrics[priority]
+            m["admitted"] += 1
+            m["queue_ms_total"] += queue_ms
+            m["queue_ms"].append(queue_ms)
+            ticket["queue_ms"] = round(queue_ms, 1)
+            self._cond.notify_all()
+        try:
+            yield ticket
+        finally:
+            with self._cond:
+                self._active -= 1
+                actual = ticket.get("actual_tokens")
+                if self.tokens_per_minute and actual is not None:
+                    # may go negative: overspend is paid back before the next admission
+                    self._tokens -= actual - min(est_tokens, self.tokens_per_minute)
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            self._refill()
+            classes = {}
+            for p, name in PRIORITY_NAMES.items():
+                m = self._metrics[p]
+                samples = sorted(m["queue_ms"])
+                classes[name] = {
+                    "queued": sum(len(t) for t in self._queues[p].values()),
+                    "admitted": m["admitted"],
+                    "timeouts": m["timeouts"],
+                    "avg_queue_ms": round(m["queue_ms_total"] / m["admitted"], 1) if m["admitted"] else None,
+                    "p95_queue_ms": round(samples[int(0.95 * (len(samples) - 1))], 1) if samples else None,
+                }
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "tokens_per_minute": self.tokens_per_minute or None,
+                "tokens_available": round(self._tokens) if self.tokens_per_minute else None,
+                "classes": classes,
+            }
+
+
+scheduler = LLMScheduler(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "30")),
+)
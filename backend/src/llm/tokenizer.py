@@ -0,0 +1,80 @@
+# src/llm/tokenizer.py
+"""
+Token counting for prompt budgeting.
+
+Uses a real BPE tokenizer (tiktoken, `o200k_base` by default) with counts
+memoized per text. If tiktoken or its encoding file is unavailable, falls back
+to a UTF-8-aware estimate that charges non-ASCII characters (CJK, emoji,
+accents) about one token each instead of the old `len // 4`.
+
+Env:
+    LLM_TOKENIZER   tiktoken encoding name (default: o200k_base)
+"""
+import os
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+TOKENIZER_NAME = os.getenv("LLM_TOKENIZER", "o200k_base")
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding(TOKENIZER_NAME)
+        except Exception:
+            _encoding_failed = True  # e.g. offline and encoding not cached
+    return _encoding
+
+
+def tokenizer_name() -> str:
+    return TOKENIZER_NAME if _get_encoding() is not None else "heuristic"
+
+
+def _estimate(text: str) -> int:
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """Token count for `text` (memoized, so repeated docs are measured once)."""
+    if not text:
+        return 0
+    enc = _get_encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return _estimate(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of `text` that fits in `max_tokens`."""
+    if max_tokens <= 0 or not text:
+        return ""
+    enc = _get_encoding()
+    if enc is not None:
+        ids = enc.encode(text, disallowed_special=())
+        if len(ids) <= max_tokens:
+            return text
+        return enc.decode(ids[:max_tokens])
+    if _estimate(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:  # largest prefix whose estimate fits
+        mid = (lo + hi + 1) // 2
+        if _estimate(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def tokenizer_info() -> dict:
+    info = count_tokens.cache_info()
+    return {"tokenizer": tokenizer_name(), "cache_hits": info.hits, "cache_misses": info.misses, "cache_size": info.currsize}
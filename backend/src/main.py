@@ -11,9 +11,14 @@ import snowflake.connector
 from src.routers import news
 from src.routers import ask
 from src.routers import chat
+from src.routers import docs
 from src.routers import behavioral
 from src.routers import orchestrator
 from src.routers import live_trade
+from src.routers import llm
+from src.agents.news_agent.poller import start_news_poller, stop_news_poller
+from src.llm import gateway as llm_gateway
+from src.stores.chat_store import start_chat_sweeper, stop_chat_sweeper
 
 # Create FastAPI app
 app = FastAPI(title="CoinCard API | Replica Coinbase", version="0.1.0")
@@ -34,13 +39,29 @@ app.include_router(portfolio.router, prefix="/portfolio")
 app.include_router(news.router)
 app.include_router(ask.router)
 app.include_router(chat.router)
+app.include_router(docs.router)
 app.include_router(behavioral.router)
 app.include_router(orchestrator.router)
 app.include_router(live_trade.router)
+app.include_router(llm.router)
 app.include_router(auth.router, prefix="/auth")
 app.include_router(anomaly.router, prefix="/anomaly")
 
 
+# Background jobs
+@app.on_event("startup")
+def start_background_jobs():
+    start_news_poller()
+    start_chat_sweeper()
+
+
+@app.on_event("shutdown")
+def stop_background_jobs():
+    stop_news_poller()
+    stop_chat_sweeper()
+    llm_gateway.close()
+
+
 # Root route
 @app.get("/")
 def home():
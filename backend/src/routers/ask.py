@@ -1,8 +1,13 @@
+import json
+
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, ConfigDict
 from typing import List, Optional
 
-from src.agents.analysis_agent.grok_reasoner import answer_with_grok
+from src.agents.analysis_agent.grok_reasoner import answer_with_grok, answer_with_grok_stream
+from src.llm.context import llm_request
+from src.stores.doc_store import put_docs, resolve_docs
 
 router = APIRouter(prefix="/ask", tags=["Ask"])
 
@@ -18,28 +23,64 @@ class AskDoc(BaseModel):
 class AskReq(BaseModel):
     token: str
     question: str
-    docs: List[AskDoc]
+    docs: Optional[List[AskDoc]] = None
+    doc_ids: Optional[List[str]] = None   # ids from POST /documents
+    user_id: Optional[str] = None
     token_budget_tokens: Optional[int] = 3800
     model_answer_tokens: Optional[int] = 500
 
-@router.post("/")
-def ask(req: AskReq):
-    if not req.docs:
+def _request_docs(req: AskReq) -> List[dict]:
+    """Inline docs go through the doc store too, so they are cleaned and deduplicated once."""
+    if not req.docs and not req.doc_ids:
         raise HTTPException(
             status_code=400,
-            detail="Provide at least one document in the `docs` field."
+            detail="Provide at least one document in the `docs` or `doc_ids` field."
         )
+    ids = list(req.doc_ids or []) + put_docs([doc.model_dump(exclude_none=True) for doc in (req.docs or [])])
+    docs, missing = resolve_docs(ids)
+    if missing:
+        raise HTTPException(status_code=404, detail={"message": "Unknown doc_ids; upload them again.", "missing": missing})
+    return docs
 
-    docs = [doc.model_dump(exclude_none=True) for doc in req.docs]
+@router.post("/")
+def ask(req: AskReq):
+    docs = _request_docs(req)
 
-    result = answer_with_grok(
-        question=req.question,
-        docs=docs,
-        token_budget_tokens=req.token_budget_tokens or 3800,
-        model_answer_tokens=req.model_answer_tokens or 500,
-    )
+    with llm_request(user=req.user_id):
+        result = answer_with_grok(
+            question=req.question,
+            docs=docs,
+            token_budget_tokens=req.token_budget_tokens or 3800,
+            model_answer_tokens=req.model_answer_tokens or 500,
+        )
     return {
         "token": req.token.upper(),
         "answer": result["answer"],
         "sources": result["sources"],
+        "cached": result.get("cached", False),
+        "context_tokens": result.get("context_tokens", 0),
     }
+
+@router.post("/stream")
+def ask_stream(req: AskReq):
+    """
+    NDJSON stream of the /ask answer: a `sources` event first, then `token`
+    events as Grok generates, then `done` with the full answer ("partial":
+    true if generation failed midway).
+    """
+    docs = _request_docs(req)
+    token = req.token.upper()
+
+    def event_gen():
+        for event in answer_with_grok_stream(
+            question=req.question,
+            docs=docs,
+            token_budget_tokens=req.token_budget_tokens or 3800,
+            model_answer_tokens=req.model_answer_tokens or 500,
+            user=req.user_id,
+        ):
+            if event["type"] == "sources":
+                event = {**event, "token": token}
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(event_gen(), media_type="application/jsonl")
@@ -1,39 +1,63 @@
+import os
+
 from fastapi import APIRouter, HTTPException, Query
 
 from src.agents.behavioral_agent.behavioral_agent import (
-    analyze_trading_style,
+    TransactionsUnavailable,
     fetch_transactions_for_user,
     rank_coins_by_similarity,
 )
+from src.agents.behavioral_agent.persona_cache import get_persona, persona_cache_stats
+from src.llm.context import llm_request
 
 router = APIRouter(prefix="/behavioral", tags=["Behavioral"])
 
+DEFAULT_DEADLINE_S = float(os.getenv("BEHAVIORAL_DEADLINE_S", "30"))
+
 
 @router.get("/transactions")
 def get_transactions(user_id: str = Query(..., description="User ID in Snowflake")):
-    resolved, rows = fetch_transactions_for_user(user_id)
+    try:
+        resolved, rows = fetch_transactions_for_user(user_id)
+    except TransactionsUnavailable as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
     if not rows:
         raise HTTPException(status_code=404, detail="No transactions found for user or fallback.")
     return {"user_id": resolved, "count": len(rows), "transactions": rows}
 
 
 @router.get("/style")
-def get_style_recommendations(user_id: str = Query(..., description="User ID in Snowflake")):
-    resolved, rows = fetch_transactions_for_user(user_id)
-    if not rows:
+def get_style_recommendations(
+    user_id: str = Query(..., description="User ID in Snowflake"),
+    deadline_s: float | None = Query(None, gt=0.0, le=300.0),
+):
+    with llm_request(user=user_id.upper(), deadline_s=deadline_s or DEFAULT_DEADLINE_S):
+        try:
+            persona = get_persona(user_id)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        except TransactionsUnavailable as exc:
+            raise HTTPException(status_code=503, detail=str(exc))
+    if persona is None:
         raise HTTPException(status_code=404, detail="No transactions found for user or fallback.")
 
-    try:
-        analysis = analyze_trading_style(rows)
-    except ValueError as exc:
-        raise HTTPException(status_code=400, detail=str(exc))
-
-    print("🎯 Behavioral analysis summary (Grok):")
-    print(analysis)
+    analysis = persona["analysis"]
+    if not persona["cached"]:
+        print("🎯 Behavioral analysis summary (Grok):")
+        print(analysis)
 
     recommendations = rank_coins_by_similarity(analysis)
     return {
-        "user_id": resolved,
+        "user_id": persona["user_id"],
         "analysis": analysis,
         "recommendations": recommendations,
+        "cached": persona["cached"],
+        "stale": persona["stale"],
+        "computed_at": persona["computed_at"],
     }
+
+
+@router.get("/stats")
+def behavioral_stats():
+    """Persona cache hits, stale serves (refreshed in the background) and cold misses."""
+    return {"personas": persona_cache_stats()}
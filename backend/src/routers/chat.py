@@ -1,18 +1,35 @@
+import json
+
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, ConfigDict
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
-from src.agents.analysis_agent.grok_reasoner import chat_with_grok
+from src.agents.analysis_agent.chat_memory import maybe_summarize
+from src.agents.analysis_agent.grok_reasoner import (
+    build_chat_context,
+    chat_context_key,
+    chat_with_grok,
+    chat_with_grok_stream,
+)
+from src.llm.context import llm_request
 from src.stores.chat_store import (
     append_message,
     create_session,
+    get_cached_context,
     get_history,
     get_session,
+    get_stats,
+    set_cached_context,
     upsert_docs,
 )
+from src.stores.doc_store import put_docs, resolve_docs
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
+# appended to a streamed answer the LLM failed to finish before it is stored
+TRUNCATED_MARKER = " [answer cut off: the model stopped responding]"
+
 
 class ChatDoc(BaseModel):
     model_config = ConfigDict(extra="allow")
@@ -28,41 +45,94 @@ class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
     docs: Optional[List[ChatDoc]] = None
+    doc_ids: Optional[List[str]] = None   # ids from POST /documents
+    user_id: Optional[str] = None
     token_budget_tokens: Optional[int] = 3800
     model_answer_tokens: Optional[int] = 500
 
 
-@router.post("/")
-def chat(req: ChatRequest):
-    docs_payload = [doc.model_dump(exclude_none=True) for doc in (req.docs or [])]
+def _attached_doc_ids(req: ChatRequest) -> List[str]:
+    return list(req.doc_ids or []) + put_docs([doc.model_dump(exclude_none=True) for doc in (req.docs or [])])
+
+
+def _load_docs(doc_ids: List[str]) -> List[dict]:
+    docs, missing = resolve_docs(doc_ids)
+    if missing:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Some docs expired from the doc store; attach them again.", "missing": missing},
+        )
+    return docs
+
+
+def _open_session(req: ChatRequest) -> Tuple[str, List[dict], str]:
+    """
+    Resolve or create the session, then record the user's turn. Sessions keep
+    doc ids only; the bodies live in the shared doc store.
+    Returns (session_id, docs, summary).
+    """
+    attached = _attached_doc_ids(req)
 
     if req.session_id:
         session = get_session(req.session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Unknown session_id. Start a new session first.")
-        docs = docs_payload or session["docs"]
-        if not docs:
+        refs = attached or session["docs"]
+        if not refs:
             raise HTTPException(status_code=400, detail="Attach docs to continue this session.")
-        if docs_payload:
-            upsert_docs(req.session_id, docs)
+        docs = _load_docs(refs)
+        if attached:
+            upsert_docs(req.session_id, attached)
         session_id = req.session_id
+        summary = session.get("summary", "")
     else:
-        if not docs_payload:
+        if not attached:
             raise HTTPException(status_code=400, detail="Docs are required to start a chat session.")
-        session_id = create_session(req.token, docs_payload)
-        docs = docs_payload
+        docs = _load_docs(attached)
+        session_id = create_session(req.token, attached)
+        summary = ""
 
     append_message(session_id, "user", req.message)
+    return session_id, docs, summary
+
+
+def _session_context(session_id: str, docs: List[dict], req: ChatRequest) -> Tuple:
+    """
+    The session's prompt context, rebuilt only when its docs or budget change.
+    Docs are ranked against the token and the question of the turn that builds it.
+    """
+    budget, reserve = req.token_budget_tokens or 3800, req.model_answer_tokens or 500
+    key = chat_context_key(docs, budget, reserve)
+    context = get_cached_context(session_id, key)
+    if context is None:
+        context = build_chat_context(docs, budget, reserve, query=f"{req.token} {req.message}")
+        set_cached_context(session_id, key, context)
+    return context
+
+
+@router.get("/stats")
+def chat_stats():
+    """Live session count, approximate memory held and eviction counters."""
+    return get_stats()
+
+
+@router.post("/")
+def chat(req: ChatRequest):
+    session_id, docs, summary = _open_session(req)
     history_for_llm = list(get_history(session_id))
 
-    result = chat_with_grok(
-        docs=docs,
-        chat_history=history_for_llm,
-        token_budget_tokens=req.token_budget_tokens or 3800,
-        model_answer_tokens=req.model_answer_tokens or 500,
-    )
+    with llm_request(user=req.user_id or session_id):
+        result = chat_with_grok(
+            docs=docs,
+            chat_history=history_for_llm,
+            token_budget_tokens=req.token_budget_tokens or 3800,
+            model_answer_tokens=req.model_answer_tokens or 500,
+            summary=summary,
+            context=_session_context(session_id, docs, req),
+        )
 
     append_message(session_id, "assistant", result["answer"])
+    maybe_summarize(session_id)
     history = list(get_history(session_id))
 
     return {
@@ -70,5 +140,43 @@ def chat(req: ChatRequest):
         "token": req.token.upper(),
         "answer": result["answer"],
         "sources": result["sources"],
+        "context_tokens": result.get("context_tokens", 0),
         "history": history,
     }
+
+
+@router.post("/stream")
+def chat_stream(req: ChatRequest):
+    """
+    NDJSON stream of a chat turn: `sources` (with session_id) first, `token`
+    events while Grok generates, then `done`. The answer is committed to the
+    session once generation completes; an answer cut off by an LLM error
+    (`done` with "partial": true) is committed with TRUNCATED_MARKER.
+    """
+    session_id, docs, summary = _open_session(req)
+    history_for_llm = list(get_history(session_id))
+    context = _session_context(session_id, docs, req)
+    token = req.token.upper()
+
+    def event_gen():
+        for event in chat_with_grok_stream(
+            docs=docs,
+            chat_history=history_for_llm,
+            token_budget_tokens=req.token_budget_tokens or 3800,
+            model_answer_tokens=req.model_answer_tokens or 500,
+            user=req.user_id or session_id,
+            summary=summary,
+            context=context,
+        ):
+            if event["type"] == "sources":
+                event = {**event, "session_id": session_id, "token": token}
+            elif event["type"] == "done":
+                answer = event["answer"]
+                if event.get("partial"):
+                    answer = f"{answer}{TRUNCATED_MARKER}"
+                append_message(session_id, "assistant", answer)
+                maybe_summarize(session_id)
+                event = {**event, "session_id": session_id}
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(event_gen(), media_type="application/jsonl")
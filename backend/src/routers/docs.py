@@ -0,0 +1,35 @@
+from fastapi import APIRouter
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional
+
+from src.stores.doc_store import doc_store
+
+router = APIRouter(prefix="/documents", tags=["Docs"])
+
+
+class UploadDoc(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    id: Optional[str] = None
+    title: Optional[str] = None
+    context: str
+    link: Optional[str] = None
+
+
+class UploadDocsRequest(BaseModel):
+    docs: List[UploadDoc] = Field(..., min_length=1, max_length=200)
+
+
+@router.post("/")
+def upload_docs(req: UploadDocsRequest):
+    """
+    Store docs once and get content ids back; pass them as `doc_ids` to /ask
+    and /chat instead of re-sending the bodies.
+    """
+    doc_ids, new = doc_store.put_many([doc.model_dump(exclude_none=True) for doc in req.docs])
+    return {"doc_ids": doc_ids, "stored": new, "deduplicated": len(doc_ids) - new}
+
+
+@router.get("/stats")
+def docs_stats():
+    return doc_store.stats()
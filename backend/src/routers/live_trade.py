@@ -1,29 +1,38 @@
+import os
+
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 
-from src.agents.news_agent.ingestion import ingest_news
+from src.agents.news_agent.poller import get_news
 from src.agents.analysis_agent.grok_reasoner import live_trade_recommendation
+from src.llm.context import llm_request
 
 router = APIRouter(prefix="/live-trade", tags=["Live Trade"])
 
+DEFAULT_DEADLINE_S = float(os.getenv("LIVE_TRADE_DEADLINE_S", "30"))
+
 
 class LiveTradeRequest(BaseModel):
     token: str
     prompt: Optional[str] = None
+    user_id: Optional[str] = None
     top_k: int = 6
+    deadline_s: Optional[float] = Field(None, gt=0, le=600)
 
 
 @router.post("/decision")
 def live_trade_decision(req: LiveTradeRequest):
     token = req.token.upper()
-    docs = ingest_news(token, top_k=req.top_k)
-    if not docs:
-        raise HTTPException(status_code=404, detail="No news context available for this token.")
-
-    recommendation = live_trade_recommendation(token, docs, question=req.prompt)
+    # one budget for news ingestion (search, titles, sentiment) and the decision
+    with llm_request(user=req.user_id, deadline_s=req.deadline_s or DEFAULT_DEADLINE_S):
+        docs = get_news(token, top_k=req.top_k)
+        if not docs:
+            raise HTTPException(status_code=404, detail="No news context available for this token.")
+        recommendation = live_trade_recommendation(token, docs, question=req.prompt)
     return {
         "token": token,
         "trade_plan": recommendation["trade_plan"],
         "analysis": recommendation["analysis"],
+        "cached": recommendation.get("cached", False),
     }
@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+
+from src.llm import gateway as llm_gateway
+
+router = APIRouter(prefix="/llm", tags=["LLM"])
+
+
+@router.get("/stats")
+def llm_stats():
+    """
+    Per-tag call counts, retries, latency percentiles and token usage for xAI
+    calls, plus circuit breaker state and hedged-request win rates.
+    """
+    return llm_gateway.get_stats()
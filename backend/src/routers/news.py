@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Optional
-from src.agents.news_agent.ingestion import ingest_news
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from src.agents.news_agent.poller import get_news, get_news_batch
 
 router = APIRouter(prefix="/news", tags=["News"])
 
@@ -10,14 +10,20 @@ class NewsRequest(BaseModel):
     top_k: Optional[int] = 3
 
 
+class NewsBatchRequest(BaseModel):
+    tokens: List[str] = Field(..., min_length=1, max_length=25)
+    top_k: Optional[int] = 3
+
+
 @router.post("/")
 def fetch_news(req: NewsRequest):
     """
     Fetch latest posts for a token, including individual sentiment scores.
-    Redis caching has been removed; callers should retain any documents they
+    Watchlist tokens are served from the background poller's in-memory window;
+    other tokens are fetched live. Callers should retain any documents they
     need client-side and pass them back to /ask when requesting suggestions.
     """
-    results = ingest_news(req.token, req.top_k or 3)
+    results = get_news(req.token, req.top_k or 3)
     if not results:
         raise HTTPException(status_code=404, detail="No posts found.")
 
@@ -29,3 +35,28 @@ def fetch_news(req: NewsRequest):
         "results": results,             # full posts with sentiment data
         "sentiment_scores": sentiment_scores  # list of scores per post
     }
+
+
+@router.post("/batch")
+def fetch_news_batch(req: NewsBatchRequest):
+    """
+    Watchlist variant of /news: tokens are packed into combined X queries so a
+    dashboard spends one search per query instead of one per token.
+    Tokens without matching posts come back with an empty result list.
+    """
+    try:
+        grouped = get_news_batch(req.tokens, req.top_k or 3)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    return {
+        "count": len(grouped),
+        "results": {
+            token: {
+                "count": len(results),
+                "results": results,
+                "sentiment_scores": [r.get("sentiment_score", 0.0) for r in results],
+            }
+            for token, results in grouped.items()
+        },
+    }
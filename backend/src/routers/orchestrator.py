@@ -1,14 +1,23 @@
-from fastapi import APIRouter, HTTPException, Query
+import json
+import os
+
+from fastapi import APIRouter, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
+from src.agents.orchestrator.engine import orchestration_events, stream_stats
 from src.agents.orchestrator.llm_planner import (
-    orchestration_stream,
+    planner_decision_stats,
+    prefetch_stats,
     run_orchestration,
+    tool_cache_stats,
 )
 
 router = APIRouter(prefix="/orchestrate", tags=["Orchestrator"])
 
+# end-to-end budget for a run when the client doesn't send one
+DEFAULT_DEADLINE_S = float(os.getenv("ORCH_DEADLINE_S", "60"))
+
 
 class PlanRequest(BaseModel):
     goal: str
@@ -16,6 +25,23 @@ class PlanRequest(BaseModel):
     user_id: str | None = None
     max_steps: int | None = 4
     stop_score: float | None = 0.55
+    deadline_s: float | None = Field(None, gt=0, le=600)
+
+
+@router.get("/stats")
+def orchestrator_stats():
+    """
+    Speculative prefetch totals (launched, adopted, cancelled, wasted), how
+    planner decisions were made (fast path, decision cache, LLM) and how often
+    tool results were served from the cross-run cache, plus streamed run
+    outcomes (completed, cancelled on disconnect, failed).
+    """
+    return {
+        "prefetch": prefetch_stats(),
+        "planner": planner_decision_stats(),
+        "tools": tool_cache_stats(),
+        "streams": stream_stats(),
+    }
 
 
 @router.post("/plan")
@@ -28,45 +54,56 @@ def orchestrate(req: PlanRequest):
         user_id=req.user_id,
         max_steps=req.max_steps or 4,
         stop_score=req.stop_score or 0.55,
+        deadline_s=req.deadline_s or DEFAULT_DEADLINE_S,
     )
     return result
 
 
 @router.post("/plan-stream")
-def orchestrate_stream(req: PlanRequest):
+async def orchestrate_stream(req: PlanRequest, request: Request):
     if not req.goal.strip():
         raise HTTPException(status_code=400, detail="Goal cannot be empty.")
 
-    generator = orchestration_stream(
-        goal=req.goal.strip(),
-        token=req.token,
-        user_id=req.user_id,
-        max_steps=req.max_steps or 4,
-        stop_score=req.stop_score or 0.55,
-    )
-    return StreamingResponse(generator, media_type="application/jsonl")
+    async def event_gen():
+        yield json.dumps({"type": "status", "message": "Planner started."}) + "\n"
+        async for event in orchestration_events(
+            goal=req.goal.strip(),
+            token=req.token,
+            user_id=req.user_id,
+            max_steps=req.max_steps or 4,
+            stop_score=req.stop_score or 0.55,
+            is_disconnected=request.is_disconnected,
+            deadline_s=req.deadline_s or DEFAULT_DEADLINE_S,
+        ):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(event_gen(), media_type="application/jsonl")
 
 
 @router.get("/plan-sse")
-def orchestrate_sse(
+async def orchestrate_sse(
+    request: Request,
     goal: str = Query(..., min_length=1),
     token: str | None = None,
     user_id: str | None = None,
     max_steps: int = Query(4, ge=1, le=10),
     stop_score: float = Query(0.55, ge=0.0, le=1.0),
+    deadline_s: float | None = Query(None, gt=0.0, le=600.0),
 ):
-    def event_gen():
+    async def event_gen():
         yield "event: status\ndata: Planner started\n\n"
-        for chunk in orchestration_stream(
+        async for event in orchestration_events(
             goal=goal.strip(),
             token=token,
             user_id=user_id,
             max_steps=max_steps,
             stop_score=stop_score,
+            is_disconnected=request.is_disconnected,
+            deadline_s=deadline_s or DEFAULT_DEADLINE_S,
         ):
-            payload = chunk.strip()
-            if not payload:
+            if event["type"] == "heartbeat":
+                yield ": heartbeat\n\n"   # SSE comment: keeps proxies from timing out, ignored by EventSource
                 continue
-            yield f"data: {payload}\n\n"
+            yield f"data: {json.dumps(event)}\n\n"
 
     return StreamingResponse(event_gen(), media_type="text/event-stream")
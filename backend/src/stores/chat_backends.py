@@ -0,0 +1,764 @@
+"""
+Storage backends for chat sessions.
+
+- MemoryChatBackend: in-process LRU (single worker, lost on restart)
+- SQLiteChatBackend: one SQLite file in WAL mode, shared by every worker on the host
+- RedisChatBackend:  any Redis-protocol server (Redis, Valkey, a local stand-in),
+                     shared across hosts; needs the optional `redis` package
+
+All backends enforce the same limits (idle TTL, max sessions, approx. max bytes)
+against a running total, so a write doesn't scan every session, and make
+`append` atomic per session: under the store lock (memory), a per-session lock
+plus a short write transaction (SQLite) or a WATCH/MULTI on the session's keys
+(Redis). A turn is stored as its own row (SQLite) or list item (Redis), so an
+append writes one message instead of rewriting the history. Docs and messages
+are stored as compact JSON.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypedDict
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+
+class ChatMessage(TypedDict):
+    role: str   # "user" or "assistant"
+    content: str
+
+
+class ChatSession(TypedDict):
+    token: str
+    docs: List[str]      # doc-store ids
+    history: List[ChatMessage]
+    updated_at: float
+    history_chars: int   # running sum of history content lengths
+    docs_bytes: int
+    history_bytes: int
+    summary: str         # rolling summary of turns folded out of `history`
+    dropped_turns: int   # turns removed from the front so far (trimmed or folded)
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _size(raw: str) -> int:
+    return len(raw.encode("utf-8"))
+
+
+def _message_size(message: ChatMessage) -> int:
+    return len(message.get("content", "").encode("utf-8")) + 16  # + role/framing
+
+
+def trim_history(history: List[ChatMessage], chars: int, max_chars: int) -> Tuple[int, int, int]:
+    """Trim history from the front until total chars fits limit. Returns (chars, bytes freed, turns dropped)."""
+    freed = dropped = 0
+    while chars > max_chars and len(history) > 2:
+        removed = history.pop(0)
+        chars -= len(removed.get("content", ""))
+        freed += _message_size(removed)
+        dropped += 1
+    return chars, freed, dropped
+
+
+def fold_history(history: List[ChatMessage], count: int) -> Tuple[int, int]:
+    """Drop the first `count` turns (already summarized). Returns (chars removed, bytes freed)."""
+    removed = history[:count]
+    del history[:count]
+    return sum(len(m.get("content", "")) for m in removed), sum(_message_size(m) for m in removed)
+
+
+class ChatBackend(ABC):
+    name = "base"
+
+    def __init__(self, ttl: int, max_sessions: int, max_bytes: int, max_history_chars: int):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_history_chars = max_history_chars
+        self._evictions = {"expired": 0, "lru": 0}
+        self._evictions_lock = threading.Lock()
+
+    @abstractmethod
+    def create(self, token: str, docs: List[str]) -> str:
+        ...
+
+    @abstractmethod
+    def get(self, session_id: str, touch: bool = True) -> Optional[ChatSession]:
+        """The live session, or None. `touch=False` reads it without renewing its TTL / LRU position."""
+
+    @abstractmethod
+    def set_docs(self, session_id: str, docs: List[str]) -> None:
+        ...
+
+    @abstractmethod
+    def append(self, session_id: str, role: str, content: str) -> None:
+        ...
+
+    @abstractmethod
+    def fold(self, session_id: str, start: int, count: int, summary: str) -> bool:
+        """
+        Replace the first `count` turns with `summary`, but only if the history
+        still starts at turn `start` (nothing was trimmed or folded meanwhile).
+        """
+
+    def history(self, session_id: str) -> List[ChatMessage]:
+        session = self.get(session_id)
+        return list(session["history"]) if session else []
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """Drop expired sessions; returns how many were removed."""
+
+    @abstractmethod
+    def _counts(self) -> Tuple[int, int]:
+        """(sessions, approx. bytes)."""
+
+    def _count_evictions(self, reason: str, count: int = 1) -> None:
+        if count:
+            with self._evictions_lock:
+                self._evictions[reason] += count
+
+    def stats(self) -> Dict[str, Any]:
+        sessions, total_bytes = self._counts()
+        return {
+            "backend": self.name,
+            "sessions": sessions,
+            "approx_bytes": total_bytes,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "session_ttl_s": self.ttl,
+            "evicted_expired": self._evictions["expired"],
+            "evicted_lru": self._evictions["lru"],
+        }
+
+    def _expired(self, updated_at: float, now: float) -> bool:
+        return self.ttl > 0 and now - updated_at > self.ttl
+
+
+# ------------ memory ------------
+class MemoryChatBackend(ChatBackend):
+    name = "memory"
+
+    def __init__(self, **limits):
+        super().__init__(**limits)
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._total_bytes = 0
+
+    def _drop(self, session_id: str, reason: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._total_bytes -= session["docs_bytes"] + session["history_bytes"]
+            self._evictions[reason] += 1
+
+    def _live(self, session_id: str) -> Optional[ChatSession]:
+        session = self._sessions.get(session_id)
+        if session is not None and self._expired(session["updated_at"], time.time()):
+            self._drop(session_id, "expired")
+            return None
+        return session
+
+    def _touch(self, session_id: str, session: ChatSession) -> None:
+        session["updated_at"] = time.time()
+        self._sessions.move_to_end(session_id)
+
+    def _enforce_limits(self) -> None:
+        """Evict least recently used sessions until both caps hold (the newest always stays)."""
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions or self._total_bytes > self.max_bytes
+        ):
+            self._drop(next(iter(self._sessions)), "lru")
+
+    def create(self, token: str, docs: List[str]) -> str:
+        session_id = str(uuid.uuid4())
+        session: ChatSession = {
+            "token": token.upper(),
+            "docs": docs,
+            "history": [],
+            "updated_at": time.time(),
+            "history_chars": 0,
+            "docs_bytes": _size(_dumps(docs)),
+            "history_bytes": 0,
+            "summary": "",
+            "dropped_turns": 0,
+        }
+        with self._lock:
+            self._sessions[session_id] = session
+            self._total_bytes += session["docs_bytes"]
+            self._enforce_limits()
+        return session_id
+
+    def get(self, session_id: str, touch: bool = True) -> Optional[ChatSession]:
+        with self._lock:
+            session = self._live(session_id)
+            if session is not None and touch:
+                self._touch(session_id, session)
+            return session
+
+    def set_docs(self, session_id: str, docs: List[str]) -> None:
+        with self._lock:
+            session = self._live(session_id)
+            if not session:
+                return
+            new_bytes = _size(_dumps(docs))
+            self._total_bytes += new_bytes - session["docs_bytes"]
+            session["docs"] = docs
+            session["docs_bytes"] = new_bytes
+            self._touch(session_id, session)
+            self._enforce_limits()
+
+    def append(self, session_id: str, role: str, content: str) -> None:
+        with self._lock:
+            session = self._live(session_id)
+            if not session:
+                return
+            message: ChatMessage = {"role": role, "content": content}
+            session["history"].append(message)
+            chars, freed, dropped = trim_history(
+                session["history"], session["history_chars"] + len(content), self.max_history_chars
+            )
+            delta = _message_size(message) - freed
+            session["history_chars"] = chars
+            session["history_bytes"] += delta
+            session["dropped_turns"] += dropped
+            self._total_bytes += delta
+            self._touch(session_id, session)
+            self._enforce_limits()
+
+    def fold(self, session_id: str, start: int, count: int, summary: str) -> bool:
+        with self._lock:
+            session = self._live(session_id)
+            if not session or session["dropped_turns"] != start or len(session["history"]) < count:
+                return False
+            chars, freed = fold_history(session["history"], count)
+            delta = _size(summary) - _size(session["summary"]) - freed
+            session["history_chars"] -= chars
+            session["history_bytes"] += delta
+            session["summary"] = summary
+            session["dropped_turns"] += count
+            self._total_bytes += delta
+            return True
+
+    def history(self, session_id: str) -> List[ChatMessage]:
+        with self._lock:
+            session = self._live(session_id)
+            return list(session["history"]) if session else []
+
+    def sweep(self) -> int:
+        now = time.time()
+        with self._lock:
+            stale = [sid for sid, s in self._sessions.items() if self._expired(s["updated_at"], now)]
+            for session_id in stale:
+                self._drop(session_id, "expired")
+        return len(stale)
+
+    def _counts(self) -> Tuple[int, int]:
+        with self._lock:
+            return len(self._sessions), self._total_bytes
+
+
+# ------------ sqlite ------------
+class SQLiteChatBackend(ChatBackend):
+    """
+    `chat_sessions` holds one row per session (docs, counters, summary) and
+    `chat_messages` one row per live turn, numbered from the first turn ever
+    (so live turns are dropped_turns .. dropped_turns + turns - 1). Triggers
+    keep the session count and byte total in `chat_totals`, across processes.
+
+    Every thread has its own connection, so reads never wait on each other
+    (WAL). Writes to one session are ordered by a per-session lock (striped)
+    in this process and by BEGIN IMMEDIATE across processes; SQLite still has a
+    single writer at a time, but a write is now a few single-row statements.
+    """
+    name = "sqlite"
+    LOCK_STRIPES = 64
+
+    def __init__(self, path: str, **limits):
+        super().__init__(**limits)
+        self.path = path
+        self._local = threading.local()
+        self._session_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        with self._tx() as db:
+            self._create_schema(db)
+
+    def _conn(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            # autocommit mode: transactions are opened explicitly
+            db = sqlite3.connect(self.path, isolation_level=None, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("PRAGMA foreign_keys=ON")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _tx(self, immediate: bool = True) -> Iterator[sqlite3.Connection]:
+        """Transaction on this thread's connection; BEGIN IMMEDIATE takes the write lock up front."""
+        db = self._conn()
+        db.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        return self._session_locks[hash(session_id) % self.LOCK_STRIPES]
+
+    @staticmethod
+    def _create_schema(db: sqlite3.Connection) -> None:
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS chat_sessions ("
+            " id TEXT PRIMARY KEY, token TEXT, docs TEXT,"
+            " history_chars INTEGER, docs_bytes INTEGER, history_bytes INTEGER, updated_at REAL,"
+            " summary TEXT NOT NULL DEFAULT '', dropped_turns INTEGER NOT NULL DEFAULT 0,"
+            " turns INTEGER NOT NULL DEFAULT 0)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS chat_sessions_updated ON chat_sessions (updated_at)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS chat_messages ("
+            " session_id TEXT NOT NULL REFERENCES chat_sessions (id) ON DELETE CASCADE,"
+            " turn INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL,"
+            " PRIMARY KEY (session_id, turn)) WITHOUT ROWID"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS chat_totals ("
+            " id INTEGER PRIMARY KEY CHECK (id = 0), sessions INTEGER NOT NULL, bytes INTEGER NOT NULL)"
+        )
+        db.execute(
+            "INSERT OR IGNORE INTO chat_totals (id, sessions, bytes)"
+            " SELECT 0, COUNT(*), COALESCE(SUM(docs_bytes + history_bytes), 0) FROM chat_sessions"
+        )
+        db.execute(
+            "CREATE TRIGGER IF NOT EXISTS chat_totals_insert AFTER INSERT ON chat_sessions BEGIN"
+            " UPDATE chat_totals SET sessions = sessions + 1, bytes = bytes + NEW.docs_bytes + NEW.history_bytes;"
+            " END"
+        )
+        db.execute(
+            "CREATE TRIGGER IF NOT EXISTS chat_totals_delete AFTER DELETE ON chat_sessions BEGIN"
+            " UPDATE chat_totals SET sessions = sessions - 1, bytes = bytes - OLD.docs_bytes - OLD.history_bytes;"
+            " END"
+        )
+        db.execute(
+            "CREATE TRIGGER IF NOT EXISTS chat_totals_update AFTER UPDATE OF docs_bytes, history_bytes ON chat_sessions"
+            " BEGIN UPDATE chat_totals SET bytes = bytes + NEW.docs_bytes + NEW.history_bytes"
+            " - OLD.docs_bytes - OLD.history_bytes; END"
+        )
+
+    def _enforce_limits(self, db: sqlite3.Connection, keep: str) -> None:
+        """Evict least recently used sessions (never `keep`) until both caps hold."""
+        count, total = db.execute("SELECT sessions, bytes FROM chat_totals WHERE id = 0").fetchone()
+        if count <= self.max_sessions and total <= self.max_bytes:
+            return
+        victims = []
+        cur = db.execute(
+            "SELECT id, docs_bytes + history_bytes FROM chat_sessions WHERE id != ? ORDER BY updated_at", (keep,)
+        )
+        for session_id, size in cur:
+            if count <= self.max_sessions and total <= self.max_bytes:
+                break
+            victims.append((session_id,))
+            count, total = count - 1, total - size
+        cur.close()
+        db.executemany("DELETE FROM chat_sessions WHERE id = ?", victims)
+        self._count_evictions("lru", len(victims))
+
+    def _cutoff(self) -> float:
+        return time.time() - self.ttl if self.ttl > 0 else float("-inf")
+
+    def create(self, token: str, docs: List[str]) -> str:
+        session_id = str(uuid.uuid4())
+        raw_docs = _dumps(docs)
+        with self._tx() as db:
+            db.execute(
+                "INSERT INTO chat_sessions (id, token, docs, history_chars, docs_bytes, history_bytes, updated_at)"
+                " VALUES (?, ?, ?, 0, ?, 0, ?)",
+                (session_id, token.upper(), raw_docs, _size(raw_docs), time.time()),
+            )
+            self._enforce_limits(db, keep=session_id)
+        return session_id
+
+    def get(self, session_id: str, touch: bool = True) -> Optional[ChatSession]:
+        now = time.time()
+        with self._tx(immediate=False) as db:
+            row = db.execute(
+                "SELECT token, docs, history_chars, docs_bytes, history_bytes, updated_at,"
+                " summary, dropped_turns FROM chat_sessions WHERE id = ?",
+                (session_id,),
+            ).fetchone()
+            messages = db.execute(
+                "SELECT role, content FROM chat_messages WHERE session_id = ? ORDER BY turn", (session_id,)
+            ).fetchall() if row else []
+        if not row:
+            return None
+        db = self._conn()
+        if self._expired(row[5], now):
+            self._count_evictions("expired", db.execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,)).rowcount)
+            return None
+        if touch:
+            db.execute("UPDATE chat_sessions SET updated_at = ? WHERE id = ?", (now, session_id))
+        return {
+            "token": row[0],
+            "docs": json.loads(row[1]),
+            "history": [{"role": role, "content": content} for role, content in messages],
+            "history_chars": row[2],
+            "docs_bytes": row[3],
+            "history_bytes": row[4],
+            "updated_at": now if touch else row[5],
+            "summary": row[6],
+            "dropped_turns": row[7],
+        }
+
+    def set_docs(self, session_id: str, docs: List[str]) -> None:
+        raw_docs = _dumps(docs)
+        with self._session_lock(session_id), self._tx() as db:
+            db.execute(
+                "UPDATE chat_sessions SET docs = ?, docs_bytes = ?, updated_at = ? WHERE id = ? AND updated_at >= ?",
+                (raw_docs, _size(raw_docs), time.time(), session_id, self._cutoff()),
+            )
+            self._enforce_limits(db, keep=session_id)
+
+    def _front(self, db: sqlite3.Connection, session_id: str, count: int) -> List[ChatMessage]:
+        rows = db.execute(
+            "SELECT role, content FROM chat_messages WHERE session_id = ? ORDER BY turn LIMIT ?", (session_id, count)
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def append(self, session_id: str, role: str, content: str) -> None:
+        with self._session_lock(session_id), self._tx() as db:
+            row = db.execute(
+                "SELECT history_chars, history_bytes, dropped_turns, turns FROM chat_sessions"
+                " WHERE id = ? AND updated_at >= ?",
+                (session_id, self._cutoff()),
+            ).fetchone()
+            if not row:
+                return
+            chars, history_bytes, dropped, turns = row
+            message: ChatMessage = {"role": role, "content": content}
+            db.execute(
+                "INSERT INTO chat_messages (session_id, turn, role, content) VALUES (?, ?, ?, ?)",
+                (session_id, dropped + turns, role, content),
+            )
+            chars, history_bytes, turns = chars + len(content), history_bytes + _message_size(message), turns + 1
+            trimmed = 0
+            if chars > self.max_history_chars and turns > 2:
+                # only read the history back when it actually has to be trimmed
+                chars, freed, trimmed = trim_history(self._front(db, session_id, turns), chars, self.max_history_chars)
+                history_bytes -= freed
+                db.execute(
+                    "DELETE FROM chat_messages WHERE session_id = ? AND turn < ?", (session_id, dropped + trimmed)
+                )
+            db.execute(
+                "UPDATE chat_sessions SET history_chars = ?, history_bytes = ?, updated_at = ?,"
+                " dropped_turns = ?, turns = ? WHERE id = ?",
+                (chars, history_bytes, time.time(), dropped + trimmed, turns - trimmed, session_id),
+            )
+            self._enforce_limits(db, keep=session_id)
+
+    def fold(self, session_id: str, start: int, count: int, summary: str) -> bool:
+        with self._session_lock(session_id), self._tx() as db:
+            row = db.execute(
+                "SELECT history_chars, history_bytes, summary, turns FROM chat_sessions"
+                " WHERE id = ? AND updated_at >= ? AND dropped_turns = ?",
+                (session_id, self._cutoff(), start),
+            ).fetchone()
+            if not row or row[3] < count:
+                return False
+            chars, freed = fold_history(self._front(db, session_id, count), count)
+            db.execute("DELETE FROM chat_messages WHERE session_id = ? AND turn < ?", (session_id, start + count))
+            db.execute(
+                "UPDATE chat_sessions SET history_chars = ?, history_bytes = ?, summary = ?,"
+                " dropped_turns = ?, turns = ? WHERE id = ?",
+                (row[0] - chars, row[1] + _size(summary) - _size(row[2]) - freed,
+                 summary, start + count, row[3] - count, session_id),
+            )
+            return True
+
+    def history(self, session_id: str) -> List[ChatMessage]:
+        db = self._conn()
+        row = db.execute("SELECT updated_at FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()
+        if not row or self._expired(row[0], time.time()):
+            return []
+        return self._front(db, session_id, -1)   # LIMIT -1: all of them
+
+    def sweep(self) -> int:
+        if self.ttl <= 0:
+            return 0
+        with self._tx() as db:
+            removed = db.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (self._cutoff(),)).rowcount
+        self._count_evictions("expired", removed)
+        return removed
+
+    def _counts(self) -> Tuple[int, int]:
+        count, total = self._conn().execute("SELECT sessions, bytes FROM chat_totals WHERE id = 0").fetchone()
+        return count, total
+
+
+# ------------ redis ------------
+class RedisChatBackend(ChatBackend):
+    """
+    One hash per session (`<prefix>s:<id>`: token, docs, counters, summary),
+    a list of its turns (`<prefix>h:<id>`, one JSON message per item, so an
+    append is an RPUSH), a sorted set of session ids by last activity
+    (`<prefix>index`) for LRU/TTL, a hash of per-session sizes
+    (`<prefix>sizes`) and their running total (`<prefix>bytes`), which the
+    sweeper reconciles with the sizes.
+    """
+    name = "redis"
+    EVICT_BATCH = 100
+
+    def __init__(self, url: str, prefix: str = "chat:", client: Any = None, **limits):
+        """`client`: an existing Redis client (e.g. a local stand-in); else one is made from `url`."""
+        super().__init__(**limits)
+        if client is None:
+            if redis is None:
+                raise RuntimeError("CHAT_STORE_BACKEND=redis requires the 'redis' package.")
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self._r = client
+        self._index = f"{prefix}index"
+        self._sizes = f"{prefix}sizes"
+        self._bytes = f"{prefix}bytes"
+        self._prefix = f"{prefix}s:"
+        self._history_prefix = f"{prefix}h:"
+        self._reconcile()
+
+    def _key(self, session_id: str) -> str:
+        return f"{self._prefix}{session_id}"
+
+    def _history_key(self, session_id: str) -> str:
+        return f"{self._history_prefix}{session_id}"
+
+    def _expire_args(self) -> Optional[int]:
+        # the sweeper cleans the index; the key TTL only guards against orphans
+        return self.ttl * 2 if self.ttl > 0 else None
+
+    def _drop(self, session_ids: List[str], reason: str) -> None:
+        if not session_ids:
+            return
+        sizes = self._r.hmget(self._sizes, session_ids)
+        pipe = self._r.pipeline()
+        pipe.delete(*[self._key(s) for s in session_ids], *[self._history_key(s) for s in session_ids])
+        pipe.zrem(self._index, *session_ids)
+        pipe.hdel(self._sizes, *session_ids)
+        pipe.decrby(self._bytes, sum(int(size or 0) for size in sizes))
+        pipe.execute()
+        self._count_evictions(reason, len(session_ids))
+
+    def _reconcile(self) -> None:
+        """Reset the byte total to the sum of the per-session sizes (drift from racing drops)."""
+        def _tx(pipe) -> None:
+            total = sum(int(size) for size in pipe.hvals(self._sizes))
+            pipe.multi()
+            pipe.set(self._bytes, total)
+
+        self._r.transaction(_tx, self._sizes, self._bytes)
+
+    def _enforce_limits(self, keep: str) -> None:
+        """Evict least recently used sessions (never `keep`) until both caps hold."""
+        count, total = self._counts()
+        victims: List[str] = []
+        offset = 0
+        while count > self.max_sessions or total > self.max_bytes:
+            batch = [s for s in self._r.zrange(self._index, offset, offset + self.EVICT_BATCH - 1) if s != keep]
+            if not batch:
+                break
+            offset += self.EVICT_BATCH
+            for session_id, size in zip(batch, self._r.hmget(self._sizes, batch)):
+                if count <= self.max_sessions and total <= self.max_bytes:
+                    break
+                victims.append(session_id)
+                count, total = count - 1, total - int(size or 0)
+        self._drop(victims, "lru")
+
+    def create(self, token: str, docs: List[str]) -> str:
+        session_id = str(uuid.uuid4())
+        raw_docs = _dumps(docs)
+        pipe = self._r.pipeline()
+        pipe.hset(self._key(session_id), mapping={
+            "token": token.upper(),
+            "docs": raw_docs,
+            "history_chars": 0,
+            "docs_bytes": _size(raw_docs),
+            "history_bytes": 0,
+            "summary": "",
+            "dropped_turns": 0,
+        })
+        self._touch(pipe, session_id)
+        pipe.hset(self._sizes, session_id, _size(raw_docs))
+        pipe.incrby(self._bytes, _size(raw_docs))
+        pipe.execute()
+        self._enforce_limits(keep=session_id)
+        return session_id
+
+    def _alive(self, session_id: str) -> bool:
+        updated_at = self._r.zscore(self._index, session_id)
+        if updated_at is None:
+            return False
+        if self._expired(updated_at, time.time()) or not self._r.exists(self._key(session_id)):
+            self._drop([session_id], "expired")
+            return False
+        return True
+
+    def _touch(self, pipe, session_id: str) -> None:
+        pipe.zadd(self._index, {session_id: time.time()})
+        if self._expire_args():
+            pipe.expire(self._key(session_id), self._expire_args())
+            pipe.expire(self._history_key(session_id), self._expire_args())
+
+    @staticmethod
+    def _decode(items: List[str]) -> List[ChatMessage]:
+        return [json.loads(item) for item in items]
+
+    def get(self, session_id: str, touch: bool = True) -> Optional[ChatSession]:
+        if not self._alive(session_id):
+            return None
+        pipe = self._r.pipeline(transaction=False)
+        pipe.hgetall(self._key(session_id))
+        pipe.lrange(self._history_key(session_id), 0, -1)
+        data, items = pipe.execute()
+        if not data:
+            return None
+        if touch:
+            pipe = self._r.pipeline()
+            self._touch(pipe, session_id)
+            pipe.execute()
+            updated_at = time.time()
+        else:
+            updated_at = self._r.zscore(self._index, session_id) or time.time()
+        return {
+            "token": data["token"],
+            "docs": json.loads(data["docs"]),
+            "history": self._decode(items),
+            "history_chars": int(data["history_chars"]),
+            "docs_bytes": int(data["docs_bytes"]),
+            "history_bytes": int(data["history_bytes"]),
+            "updated_at": updated_at,
+            "summary": data.get("summary", ""),
+            "dropped_turns": int(data.get("dropped_turns", 0)),
+        }
+
+    def _update(
+        self,
+        session_id: str,
+        change: Callable[[Dict[str, str], Callable[[int], List[ChatMessage]], int], Optional[Tuple]],
+        touch: bool = True,
+    ) -> bool:
+        """
+        Optimistic per-session transaction: WATCH the session's hash and turn
+        list, apply `change`, retry on conflict. `change(current, front, turns)`
+        gets the hash, a reader for the first n turns and the turn count, and
+        returns (fields, turns to drop from the front, messages to push), or
+        None to leave the session untouched. `touch=False` keeps its TTL / LRU
+        position (background writes).
+        """
+        key = self._key(session_id)
+        history_key = self._history_key(session_id)
+
+        def _tx(pipe) -> bool:
+            current = pipe.hgetall(key)
+            if not current:
+                return False
+
+            def front(n: int) -> List[ChatMessage]:
+                return self._decode(pipe.lrange(history_key, 0, n - 1))
+
+            result = change(current, front, pipe.llen(history_key))
+            if result is None:
+                return False
+            fields, drop, push = result
+            old_size = int(current["docs_bytes"]) + int(current["history_bytes"])
+            new_size = int(fields.get("docs_bytes", current["docs_bytes"])) + int(
+                fields.get("history_bytes", current["history_bytes"])
+            )
+            pipe.multi()
+            pipe.hset(key, mapping=fields)
+            if push:
+                pipe.rpush(history_key, *[_dumps(m) for m in push])
+            if drop:
+                pipe.ltrim(history_key, drop, -1)
+            pipe.hset(self._sizes, session_id, new_size)
+            pipe.incrby(self._bytes, new_size - old_size)
+            if touch:
+                self._touch(pipe, session_id)
+            return True
+
+        return self._r.transaction(_tx, key, history_key, value_from_callable=True)
+
+    def set_docs(self, session_id: str, docs: List[str]) -> None:
+        if not self._alive(session_id):
+            return
+        raw_docs = _dumps(docs)
+        self._update(session_id, lambda *_: ({"docs": raw_docs, "docs_bytes": _size(raw_docs)}, 0, []))
+        self._enforce_limits(keep=session_id)
+
+    def append(self, session_id: str, role: str, content: str) -> None:
+        if not self._alive(session_id):
+            return
+        message: ChatMessage = {"role": role, "content": content}
+
+        def change(current: Dict[str, str], front, turns: int) -> Tuple:
+            chars = int(current["history_chars"]) + len(content)
+            history_bytes = int(current["history_bytes"]) + _message_size(message)
+            dropped = 0
+            if chars > self.max_history_chars and turns + 1 > 2:
+                # only read the history back when it actually has to be trimmed
+                chars, freed, dropped = trim_history(front(turns) + [message], chars, self.max_history_chars)
+                history_bytes -= freed
+            fields = {
+                "history_chars": chars,
+                "history_bytes": history_bytes,
+                "dropped_turns": int(current.get("dropped_turns", 0)) + dropped,
+            }
+            return fields, dropped, [message]
+
+        self._update(session_id, change)
+        self._enforce_limits(keep=session_id)
+
+    def fold(self, session_id: str, start: int, count: int, summary: str) -> bool:
+        def change(current: Dict[str, str], front, turns: int) -> Optional[Tuple]:
+            if int(current.get("dropped_turns", 0)) != start or turns < count:
+                return None
+            chars, freed = fold_history(front(count), count)
+            fields = {
+                "history_chars": int(current["history_chars"]) - chars,
+                "history_bytes": int(current["history_bytes"]) + _size(summary)
+                - _size(current.get("summary", "")) - freed,
+                "summary": summary,
+                "dropped_turns": start + count,
+            }
+            return fields, count, []
+
+        return self._alive(session_id) and self._update(session_id, change, touch=False)
+
+    def history(self, session_id: str) -> List[ChatMessage]:
+        if not self._alive(session_id):
+            return []
+        return self._decode(self._r.lrange(self._history_key(session_id), 0, -1))
+
+    def sweep(self) -> int:
+        removed = 0
+        if self.ttl > 0:
+            stale = self._r.zrangebyscore(self._index, "-inf", time.time() - self.ttl)
+            self._drop(stale, "expired")
+            removed = len(stale)
+        self._reconcile()
+        return removed
+
+    def _counts(self) -> Tuple[int, int]:
+        pipe = self._r.pipeline(transaction=False)
+        pipe.zcard(self._index)
+        pipe.get(self._bytes)
+        count, total = pipe.execute()
+        return count, int(total or 0)
@@ -1,69 +1,164 @@
-import time
-import uuid
-from typing import Dict, List, Optional, TypedDict
+"""
+Chat sessions, bounded so they can't grow without limit.
+
+A session expires after CHAT_SESSION_TTL seconds without activity; beyond
+CHAT_MAX_SESSIONS sessions or CHAT_MAX_BYTES of docs + history, the least
+recently used ones are evicted. A background sweeper drops expired sessions
+even if nobody touches them.
+
+Storage is pluggable (see chat_backends.py). `memory` only works with a single
+uvicorn worker; use `sqlite` (one host) or `redis` (many hosts) to run /chat on
+several workers and keep sessions across restarts.
+
+Env:
+    CHAT_STORE_BACKEND    memory | sqlite | redis (default memory)
+    CHAT_STORE_PATH       SQLite file for the sqlite backend (default chat_sessions.db)
+    REDIS_URL             server for the redis backend (default redis://localhost:6379/0)
+    CHAT_SESSION_TTL      idle seconds before a session expires (default 2h)
+    CHAT_MAX_SESSIONS     max live sessions (default 1000)
+    CHAT_MAX_BYTES        approx. max bytes of docs + history (default 64 MB)
+    CHAT_SWEEP_INTERVAL   seconds between sweeper runs (default 60)
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.stores.chat_backends import (
+    ChatBackend,
+    ChatMessage,
+    ChatSession,
+    MemoryChatBackend,
+    RedisChatBackend,
+    SQLiteChatBackend,
+)
 
 MAX_HISTORY_CHARS = 6000
+BACKEND = os.getenv("CHAT_STORE_BACKEND", "memory").lower()
+SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", str(2 * 3600)))
+MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))
+MAX_BYTES = int(os.getenv("CHAT_MAX_BYTES", str(64 * 1024 * 1024)))
+SWEEP_INTERVAL = int(os.getenv("CHAT_SWEEP_INTERVAL", "60"))
+CONTEXT_CACHE_SIZE = 256
 
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
 
-class ChatMessage(TypedDict):
-    role: str   # "user" or "assistant"
-    content: str
+# session_id -> (key, built context). Derived data, so it stays per process.
+_contexts: "OrderedDict[str, Tuple[str, Any]]" = OrderedDict()
+_contexts_lock = threading.Lock()
+_context_stats = {"hits": 0, "misses": 0}
 
 
-class ChatSession(TypedDict):
-    token: str
-    docs: List[Dict]
-    history: List[ChatMessage]
-    updated_at: float
+def make_backend(name: str = BACKEND) -> ChatBackend:
+    limits = dict(
+        ttl=SESSION_TTL,
+        max_sessions=MAX_SESSIONS,
+        max_bytes=MAX_BYTES,
+        max_history_chars=MAX_HISTORY_CHARS,
+    )
+    if name == "sqlite":
+        return SQLiteChatBackend(os.getenv("CHAT_STORE_PATH", "chat_sessions.db"), **limits)
+    if name == "redis":
+        return RedisChatBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"), **limits)
+    if name != "memory":
+        raise ValueError(f"Unknown CHAT_STORE_BACKEND '{name}' (expected memory, sqlite or redis).")
+    return MemoryChatBackend(**limits)
 
 
-_sessions: Dict[str, ChatSession] = {}
+_backend: ChatBackend = make_backend()
 
 
-def _trim_history(history: List[ChatMessage]) -> None:
-    """Trim history from the front until total chars fits limit."""
-    if not history:
-        return
-    total = sum(len(m.get("content", "")) for m in history)
-    while total > MAX_HISTORY_CHARS and len(history) > 2:
-        removed = history.pop(0)
-        total -= len(removed.get("content", ""))
+# ------------ sessions ------------
+def create_session(token: str, doc_ids: List[str]) -> str:
+    return _backend.create(token, doc_ids)
 
 
-def create_session(token: str, docs: List[Dict]) -> str:
-    session_id = str(uuid.uuid4())
-    _sessions[session_id] = {
-        "token": token.upper(),
-        "docs": docs,
-        "history": [],
-        "updated_at": time.time(),
-    }
-    return session_id
+def get_session(session_id: str) -> Optional[ChatSession]:
+    return _backend.get(session_id)
 
 
-def get_session(session_id: str) -> Optional[ChatSession]:
-    return _sessions.get(session_id)
+def peek_session(session_id: str) -> Optional[ChatSession]:
+    """Like get_session, but doesn't count as activity (TTL and LRU position stay as they are)."""
+    return _backend.get(session_id, touch=False)
 
 
-def upsert_docs(session_id: str, docs: List[Dict]) -> None:
-    session = _sessions.get(session_id)
-    if not session or not docs:
+def upsert_docs(session_id: str, doc_ids: List[str]) -> None:
+    if not doc_ids:
         return
-    session["docs"] = docs
-    session["updated_at"] = time.time()
+    _backend.set_docs(session_id, doc_ids)
+    with _contexts_lock:
+        _contexts.pop(session_id, None)
 
 
 def append_message(session_id: str, role: str, content: str) -> None:
-    session = _sessions.get(session_id)
-    if not session:
-        return
-    session["history"].append({"role": role, "content": content})
-    _trim_history(session["history"])
-    session["updated_at"] = time.time()
+    _backend.append(session_id, role, content)
 
 
 def get_history(session_id: str) -> List[ChatMessage]:
-    session = _sessions.get(session_id)
-    if not session:
-        return []
-    return session["history"]
+    return _backend.history(session_id)
+
+
+def fold_into_summary(session_id: str, start: int, count: int, summary: str) -> bool:
+    """Swap the first `count` turns for `summary` if the history still begins at turn `start`."""
+    return _backend.fold(session_id, start, count, summary)
+
+
+def get_cached_context(session_id: str, key: str) -> Optional[Any]:
+    """Prompt context memoized for this session, if it was built for the same `key`."""
+    with _contexts_lock:
+        entry = _contexts.get(session_id)
+        if entry is not None and entry[0] == key:
+            _contexts.move_to_end(session_id)
+            _context_stats["hits"] += 1
+            return entry[1]
+        _context_stats["misses"] += 1
+        return None
+
+
+def set_cached_context(session_id: str, key: str, context: Any) -> None:
+    with _contexts_lock:
+        _contexts[session_id] = (key, context)
+        _contexts.move_to_end(session_id)
+        while len(_contexts) > CONTEXT_CACHE_SIZE:
+            _contexts.popitem(last=False)
+
+
+# ------------ maintenance ------------
+def sweep_expired() -> int:
+    """Drop every expired session; returns how many were removed."""
+    return _backend.sweep()
+
+
+def get_stats() -> Dict:
+    with _contexts_lock:
+        contexts = dict(_context_stats, size=len(_contexts))
+    return {**_backend.stats(), "context_cache": contexts}
+
+
+def _run() -> None:
+    while not _stop.wait(SWEEP_INTERVAL):
+        try:
+            removed = sweep_expired()
+        except Exception as e:
+            print(f"[{datetime.now()}] ERROR: Chat sweeper failed: {e}", file=sys.stderr)
+            continue
+        if removed:
+            print(f"[{datetime.now()}] Chat sweeper: expired {removed} sessions.")
+
+
+def start_chat_sweeper() -> bool:
+    """Start the daemon sweeper thread (no-op if it is already running)."""
+    global _thread
+    if SESSION_TTL <= 0 or (_thread and _thread.is_alive()):
+        return False
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name="chat-sweeper", daemon=True)
+    _thread.start()
+    return True
+
+
+def stop_chat_sweeper() -> None:
+    _stop.set()
@@ -0,0 +1,154 @@
+"""
+Content-addressed document store shared by /ask, /chat and every session.
+
+A doc's id is the hash of its cleaned content, so identical docs uploaded by
+different users or sessions are stored once. Clients upload docs once via
+`POST /documents` and then reference them by id. Docs are cleaned when stored, so
+the work is not repeated per request.
+
+Entries live in an LRU bounded by approximate bytes. When DOC_STORE_PATH is
+set they are also written to a SQLite file (WAL), so every worker and restart
+sees the same docs; rows unused for DOC_STORE_TTL seconds are pruned.
+
+Env:
+    DOC_STORE_MAX_BYTES   in-memory byte budget (default 32 MB)
+    DOC_STORE_PATH        optional SQLite file shared between workers
+    DOC_STORE_TTL         seconds an unused doc is kept on disk (default 24h)
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.text_utils import strip_noise
+
+
+def _canonical(doc: Dict) -> str:
+    return json.dumps(doc, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def normalize_doc(doc: Dict) -> Dict:
+    """Cleaned copy of `doc`; `cleaned` tells the prompt builder not to clean it again."""
+    out = {k: v for k, v in doc.items() if v is not None and k != "cleaned"}
+    out["context"] = strip_noise(out.get("context", ""))
+    if out.get("title"):
+        out["title"] = strip_noise(out["title"])
+    return out
+
+
+def _content_id(encoded: str) -> str:
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:32]
+
+
+class DocStore:
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, disk_path: Optional[str] = None, ttl: float = 86400):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._mem: "OrderedDict[str, Tuple[int, Dict]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._stats = {"puts": 0, "dedup_hits": 0, "hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, used_at REAL, doc TEXT)"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS docs_used_at ON docs (used_at)")
+            self._disk.commit()
+
+    def _put_mem(self, key: str, size: int, doc: Dict) -> None:
+        if key in self._mem:
+            self._mem.move_to_end(key)
+            return
+        self._mem[key] = (size, doc)
+        self._bytes += size
+        while self._bytes > self.max_bytes and len(self._mem) > 1:
+            _, (old_size, _) = self._mem.popitem(last=False)
+            self._bytes -= old_size
+            self._stats["evictions"] += 1
+
+    def put_many(self, docs: List[Dict]) -> Tuple[List[str], int]:
+        """Store docs; returns (ids in input order, how many weren't already in memory)."""
+        ids, new = [], 0
+        now = time.time()
+        with self._lock:
+            for raw in docs:
+                doc = normalize_doc(raw)
+                encoded = _canonical(doc)
+                key = _content_id(encoded)
+                ids.append(key)
+                self._stats["puts"] += 1
+                if key in self._mem:
+                    self._stats["dedup_hits"] += 1
+                    self._mem.move_to_end(key)
+                    continue
+                new += 1
+                self._put_mem(key, len(encoded.encode("utf-8")), doc)
+                if self._disk is not None:
+                    self._disk.execute(
+                        "INSERT OR REPLACE INTO docs (id, used_at, doc) VALUES (?, ?, ?)", (key, now, encoded)
+                    )
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM docs WHERE used_at < ?", (now - self.ttl,))
+                self._disk.commit()
+        return ids, new
+
+    def get_many(self, ids: List[str]) -> Tuple[List[Dict], List[str]]:
+        """Docs for `ids` in order (each tagged cleaned=True), plus the ids that are unknown."""
+        found, missing = [], []
+        now = time.time()
+        with self._lock:
+            for key in ids:
+                entry = self._mem.get(key)
+                if entry is not None:
+                    self._mem.move_to_end(key)
+                    self._stats["hits"] += 1
+                    found.append({**entry[1], "cleaned": True})
+                    continue
+                row = None
+                if self._disk is not None:
+                    row = self._disk.execute("SELECT doc FROM docs WHERE id = ?", (key,)).fetchone()
+                if row:
+                    doc = json.loads(row[0])
+                    self._put_mem(key, len(row[0].encode("utf-8")), doc)
+                    self._stats["disk_hits"] += 1
+                    found.append({**doc, "cleaned": True})
+                else:
+                    self._stats["misses"] += 1
+                    missing.append(key)
+            if self._disk is not None and ids:
+                self._disk.executemany("UPDATE docs SET used_at = ? WHERE id = ?", [(now, k) for k in ids])
+                self._disk.commit()
+        return found, missing
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(
+                self._stats,
+                docs=len(self._mem),
+                approx_bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                disk=self._disk is not None,
+            )
+
+
+doc_store = DocStore(
+    max_bytes=int(os.getenv("DOC_STORE_MAX_BYTES", str(32 * 1024 * 1024))),
+    disk_path=os.getenv("DOC_STORE_PATH") or None,
+    ttl=float(os.getenv("DOC_STORE_TTL", str(24 * 3600))),
+)
+
+
+def put_docs(docs: List[Dict]) -> List[str]:
+    return doc_store.put_many(docs)[0]
+
+
+def resolve_docs(doc_ids: List[str]) -> Tuple[List[Dict], List[str]]:
+    """Docs for `doc_ids` in order, plus the ids no longer in the store."""
+    return doc_store.get_many(doc_ids)
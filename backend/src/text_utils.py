@@ -0,0 +1,11 @@
+# src/text_utils.py
+"""Text helpers shared by the stores and the agents."""
+import re
+
+EMOJI_RE = re.compile(r"[\U00010000-\U0010ffff]")
+
+
+def strip_noise(text: str) -> str:
+    """Light cleaner to keep answers/context tidy: drop emojis, collapse whitespace."""
+    t = EMOJI_RE.sub("", text or "")
+    return re.sub(r"\s+", " ", t).strip()
@@ -0,0 +1,188 @@
+import multiprocessing
+import threading
+
+import fakeredis
+import pytest
+
+from src.stores import chat_backends
+from src.stores.chat_backends import (
+    ChatBackend,
+    MemoryChatBackend,
+    RedisChatBackend,
+    SQLiteChatBackend,
+)
+
+LIMITS = dict(ttl=3600, max_sessions=100, max_bytes=10_000_000, max_history_chars=6000)
+
+
+def make(kind, tmp_path, **overrides):
+    limits = {**LIMITS, **overrides}
+    if kind == "memory":
+        return MemoryChatBackend(**limits)
+    if kind == "sqlite":
+        return SQLiteChatBackend(str(tmp_path / "chat.db"), **limits)
+    return RedisChatBackend("redis://unused", client=fakeredis.FakeRedis(decode_responses=True), **limits)
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def kind(request):
+    return request.param
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        ChatBackend(**LIMITS)
+
+
+def test_create_get_round_trip(kind, tmp_path):
+    backend = make(kind, tmp_path)
+    sid = backend.create("eth", ["doc-1", "doc-2"])
+    session = backend.get(sid)
+    assert session["token"] == "ETH"
+    assert session["docs"] == ["doc-1", "doc-2"]
+    assert session["history"] == []
+    assert backend.get("missing") is None
+
+
+def test_append_keeps_order_and_trims_from_front(kind, tmp_path):
+    backend = make(kind, tmp_path, max_history_chars=50)
+    sid = backend.create("btc", [])
+    for i in range(10):
+        backend.append(sid, "user" if i % 2 == 0 else "assistant", f"{i}" * 10)
+    session = backend.get(sid)
+    assert [m["content"] for m in session["history"]] == ["5" * 10, "6" * 10, "7" * 10, "8" * 10, "9" * 10]
+    assert session["history_chars"] == 50
+    assert session["dropped_turns"] == 5
+    assert backend.history(sid) == session["history"]
+
+
+def test_fold_replaces_front_turns_only_if_unchanged(kind, tmp_path):
+    backend = make(kind, tmp_path)
+    sid = backend.create("sol", [])
+    for i in range(6):
+        backend.append(sid, "user", f"turn {i}")
+    assert not backend.fold(sid, start=1, count=2, summary="stale")
+    assert backend.fold(sid, start=0, count=4, summary="first four turns")
+    session = backend.get(sid)
+    assert [m["content"] for m in session["history"]] == ["turn 4", "turn 5"]
+    assert session["summary"] == "first four turns"
+    assert session["dropped_turns"] == 4
+    assert session["history_chars"] == len("turn 4") + len("turn 5")
+    assert not backend.fold(sid, start=0, count=2, summary="again")
+
+
+def test_byte_total_tracks_every_write(kind, tmp_path):
+    backend = make(kind, tmp_path, max_history_chars=40)
+    ids = [backend.create("eth", [f"doc-{i}"]) for i in range(3)]
+    for sid in ids:
+        for i in range(8):
+            backend.append(sid, "user", "x" * (i + 3))
+    backend.set_docs(ids[0], ["a", "b", "c"])
+    backend.fold(ids[1], backend.get(ids[1])["dropped_turns"], 1, "summary")
+    expected = sum(s["docs_bytes"] + s["history_bytes"] for s in (backend.get(sid) for sid in ids))
+    assert backend.stats()["sessions"] == 3
+    assert backend.stats()["approx_bytes"] == expected
+
+
+def test_lru_eviction_by_session_count(kind, tmp_path):
+    backend = make(kind, tmp_path, max_sessions=2)
+    first = backend.create("a", [])
+    second = backend.create("b", [])
+    backend.get(first)   # first is now the most recently used
+    third = backend.create("c", [])
+    assert backend.get(second) is None
+    assert backend.get(first) is not None and backend.get(third) is not None
+    assert backend.stats()["evicted_lru"] == 1
+
+
+def test_lru_eviction_by_bytes_keeps_the_session_written(kind, tmp_path):
+    backend = make(kind, tmp_path, max_bytes=300)
+    old = backend.create("a", [])
+    new = backend.create("b", [])
+    backend.append(new, "user", "y" * 200)
+    backend.append(old, "user", "z" * 200)   # over the cap: the other session goes, never the one written
+    assert backend.get(new) is None
+    assert backend.get(old) is not None
+    assert backend.stats()["approx_bytes"] <= 300
+
+
+def test_sweep_drops_idle_sessions(kind, tmp_path, monkeypatch):
+    backend = make(kind, tmp_path, ttl=60)
+    stale = backend.create("a", [])
+    backend.append(stale, "user", "hello")
+    now = chat_backends.time.time()
+    monkeypatch.setattr(chat_backends.time, "time", lambda: now + 120)
+    fresh = backend.create("b", [])
+    assert backend.sweep() == 1
+    assert backend.get(stale) is None
+    assert backend.get(fresh) is not None
+    assert backend.stats()["sessions"] == 1
+    assert backend.stats()["evicted_expired"] == 1
+
+
+def test_peek_and_fold_do_not_renew_the_session(kind, tmp_path, monkeypatch):
+    backend = make(kind, tmp_path, ttl=60)
+    sid = backend.create("a", [])
+    for i in range(4):
+        backend.append(sid, "user", f"turn {i}")
+    now = chat_backends.time.time()
+    monkeypatch.setattr(chat_backends.time, "time", lambda: now + 40)
+    assert [m["content"] for m in backend.get(sid, touch=False)["history"]][0] == "turn 0"
+    assert backend.fold(sid, start=0, count=2, summary="first two")
+    monkeypatch.setattr(chat_backends.time, "time", lambda: now + 90)   # idle for 90s since the last append
+    assert backend.sweep() == 1
+    assert backend.get(sid) is None
+
+
+def test_concurrent_appends_are_not_lost(kind, tmp_path):
+    backend = make(kind, tmp_path, max_history_chars=1_000_000)
+    sids = [backend.create("eth", []) for _ in range(2)]
+
+    def worker(n):
+        for i in range(25):
+            backend.append(sids[n % 2], "user", f"{n}:{i}")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for k, sid in enumerate(sids):
+        history = backend.history(sid)
+        assert len(history) == 75
+        for n in range(k, 6, 2):   # each writer's own turns stay in order
+            assert [m["content"] for m in history if m["content"].startswith(f"{n}:")] == [f"{n}:{i}" for i in range(25)]
+
+
+def _sqlite_writer(path, sid, n):
+    backend = SQLiteChatBackend(path, **{**LIMITS, "max_history_chars": 1_000_000})
+    for i in range(40):
+        backend.append(sid, "user", f"{n}:{i}")
+
+
+def test_sqlite_concurrent_writer_processes(tmp_path):
+    path = str(tmp_path / "chat.db")
+    backend = SQLiteChatBackend(path, **{**LIMITS, "max_history_chars": 1_000_000})
+    sid = backend.create("eth", [])
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_sqlite_writer, args=(path, sid, n)) for n in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(timeout=60)
+        assert p.exitcode == 0
+    session = backend.get(sid)
+    assert len(session["history"]) == 160
+    assert session["history_chars"] == sum(len(m["content"]) for m in session["history"])
+    assert backend.stats()["approx_bytes"] == session["docs_bytes"] + session["history_bytes"]
+
+
+def test_redis_append_does_not_scan_sessions(monkeypatch):
+    backend = make("redis", None)
+    ids = [backend.create("eth", []) for _ in range(20)]
+    calls = []
+    monkeypatch.setattr(backend._r, "hvals", lambda *a: calls.append(a) or [])
+    monkeypatch.setattr(backend._r, "zrangebyscore", lambda *a, **k: calls.append(a) or [])
+    for sid in ids:
+        backend.append(sid, "user", "hello")
+    assert calls == []
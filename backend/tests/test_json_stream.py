@@ -0,0 +1,88 @@
+import pytest
+
+from src.llm.json_stream import StreamingJSONParser, parse_json_object, repair_json
+
+DOC = '{"action": "news_agent", "params": {"token": "ETH", "top_k": 5}, "notes": "a, b } c", "score": 0.75}'
+
+
+def feed_in_chunks(text, size):
+    parser = StreamingJSONParser()
+    seen = []
+    for start in range(0, len(text), size):
+        fields = parser.feed(text[start : start + size])
+        seen.append(dict(fields))
+    return parser, seen
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(DOC)])
+def test_streaming_parser_chunked_feeds(size):
+    parser, seen = feed_in_chunks(DOC, size)
+    assert parser.done
+    assert parser.fields == {
+        "action": "news_agent",
+        "params": {"token": "ETH", "top_k": 5},
+        "notes": "a, b } c",
+        "score": 0.75,
+    }
+    assert parser.result() == parser.fields
+
+
+def test_streaming_parser_exposes_fields_once_complete():
+    parser = StreamingJSONParser()
+    assert parser.feed('Sure! {"action": "news_') == {}
+    assert parser.feed('agent", "params": {"token": "E') == {"action": "news_agent"}
+    assert parser.feed('TH"}, ') == {"action": "news_agent", "params": {"token": "ETH"}}
+    assert not parser.done
+    assert parser.has(["action", "params"])
+
+
+def test_streaming_parser_skips_fences_and_prose():
+    parser, _ = feed_in_chunks('Here you go:\n```json\n{"a": 1, "b": [1, 2]}\n```', 4)
+    assert parser.done
+    assert parser.result() == {"a": 1, "b": [1, 2]}
+
+
+def test_streaming_parser_result_drops_cut_off_value():
+    parser = StreamingJSONParser()
+    parser.feed('{"action": "news_agent", "params": {"token": "E')
+    assert parser.result() == {"action": "news_agent", "params": {}}
+
+
+def test_parse_fences_and_trailing_commas():
+    assert parse_json_object('```json\n{"a": 1, "b": [1, 2,],}\n```') == {"a": 1, "b": [1, 2]}
+    assert parse_json_object('Answer: {"s": "x, ]"} thanks') == {"s": "x, ]"}
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"side": "buy", "amount": 12', {"side": "buy"}),
+        ('{"side": "buy", "confidence": 0.8', {"side": "buy"}),
+        ('{"amount": 5, "side": "bu', {"amount": 5}),
+        ('{"token": "E', {}),
+        ('{"a": 1, "b": ', {"a": 1}),
+        ('{"a": 1, "b"', {"a": 1}),
+        ('{"a": true', {}),
+        ('{"a": "x\\', {}),
+        ('{"plan": {"side": "buy", "amount": 12', {"plan": {"side": "buy"}}),
+        ('{"xs": [1, 2, 3', {"xs": [1, 2]}),
+        ('{"xs": ["a", "b', {"xs": ["a"]}),
+        ('{"a": {"b": "x"}', {"a": {"b": "x"}}),
+        ('{"s": "done", "n": 3,', {"s": "done", "n": 3}),
+    ],
+)
+def test_truncation_drops_the_cut_off_value(text, expected):
+    assert parse_json_object(text) == expected
+
+
+def test_strict_parse_rejects_repairs():
+    assert parse_json_object('```json\n{"a": 1}\n```', strict=True) == {"a": 1}
+    for text in ('{"a": 1,}', '{"a": 1, "b": 12', "no json here"):
+        with pytest.raises(ValueError):
+            parse_json_object(text, strict=True)
+
+
+def test_repair_json_without_object_is_left_alone():
+    assert repair_json("no json here") == "no json here"
+    with pytest.raises(ValueError):
+        parse_json_object("no json here")